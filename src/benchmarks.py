@@ -0,0 +1,351 @@
+'''Benchmarks for model building, search and solution output.
+
+Sweeps league sizes (and, for `sports_schedule_sat`, match days, pools
+and `max_home_stand`) and records, per case:
+
+* model build time and the number of variables and constraints,
+* `sports_schedule_sat` build time with each model builder, for
+  single round robins of up to 40 teams,
+* solutions per second with a bare counting callback, with the real
+  printer and a no-op sink, with bulk batch collection, and with each
+  output format, giving the callback and output overhead per solution,
+* bytes written per solution for every `te_cli` output format,
+* solve time, status and objective for break minimization.
+
+Small cases are checked against known schedule counts (by CP-SAT, the
+direct enumerator and `schedule_count`), and the run fails loudly if
+those are off.  Results are written as JSON.
+
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+from time import perf_counter
+
+from ortools.sat.python import cp_model
+
+import sports_schedule_sat
+import te_cli
+from schedule_sinks import NullSink
+from round_robin import iter_schedules
+from schedule_count import count_schedules_dp
+from sharded_search import RawSink, VarValuesPrinter
+from solution_batches import BatchCollector
+
+# number of single round robin schedules, i.e. ordered 1-factorizations
+KNOWN_COUNTS = {4: 6, 6: 720, 8: 31449600}
+
+
+class CountingPrinter(cp_model.CpSolverSolutionCallback):
+    def __init__(self, limit):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._limit = limit
+        self._n_sol = 0
+
+    def on_solution_callback(self):
+        self._n_sol += 1
+        if self._n_sol >= self._limit:
+            self.StopSearch()
+
+    def n_sol(self):
+        return self._n_sol
+
+
+def model_size(model):
+    proto = model.Proto()
+    return {
+        'variables': len(proto.variables),
+        'constraints': len(proto.constraints),
+    }
+
+
+def seconds_per_solution(result):
+    return result['seconds'] / max(result['solutions'], 1)
+
+
+def time_search(model, printer, time):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time
+    start = perf_counter()
+    status = solver.SearchForAllSolutions(model, printer)
+    secs = perf_counter() - start
+    n_sol = printer.n_sol()
+    return {
+        'status': solver.StatusName(status),
+        'solutions': n_sol,
+        'seconds': secs,
+        'solutions_per_second': n_sol / secs if secs else None,
+    }
+
+
+def bench_te_cli(n_t, limit, time, tmp_dir):
+    n_w = n_t - 1
+    res = {'solver': 'te_cli', 'n_t': n_t, 'n_w': n_w}
+    start = perf_counter()
+    (model, games) = te_cli.model_games(n_t=n_t, n_w=n_w)
+    res['build_seconds'] = perf_counter() - start
+    res.update(model_size(model))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        res['search_bare'] = time_search(model, CountingPrinter(limit), time)
+        res['search_noop_sink'] = time_search(
+            model,
+            te_cli.SolutionPrinter(
+                games, n_t, n_w, NullSink(), n_show=0, limit=limit
+            ), time
+        )
+        res['search_batch_collect'] = time_search(
+            model,
+            BatchCollector(games.values(), lambda i, b: None, limit=limit),
+            time
+        )
+    res['callback_seconds_per_solution'] = (
+        seconds_per_solution(res['search_noop_sink']) -
+        seconds_per_solution(res['search_bare'])
+    )
+
+    res['formats'] = {}
+    for (fmt, ext) in te_cli.SINK_EXTENSIONS.items():
+        path = os.path.join(tmp_dir, f'bench-{n_t}{ext}')
+        sink = te_cli.make_sink(
+            fmt, None, list(games.keys()), n_t, n_w, path=path
+        )
+        printer = te_cli.SolutionPrinter(
+            games, n_t, n_w, sink, n_show=0, limit=limit
+        )
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                r = time_search(model, printer, time)
+        finally:
+            printer.close()
+        r['bytes_per_solution'] = os.path.getsize(path) / max(
+            r['solutions'], 1
+        )
+        r['output_seconds_per_solution'] = (
+            seconds_per_solution(r) -
+            seconds_per_solution(res['search_noop_sink'])
+        )
+        res['formats'][fmt] = r
+        os.remove(path)
+
+    start = perf_counter()
+    n_direct = 0
+    for _ in iter_schedules(n_t):
+        n_direct += 1
+        if n_direct >= limit:
+            break
+    secs = perf_counter() - start
+    res['direct'] = {
+        'solutions': n_direct,
+        'seconds': secs,
+        'solutions_per_second': n_direct / secs if secs else None,
+    }
+    return res
+
+
+def bench_sports(
+    num_teams, num_matchdays, num_pools, max_home_stand, limit, time, tmp_dir
+):
+    num_matches_per_day = num_teams // 2
+    res = {
+        'solver': 'sports_schedule_sat',
+        'num_teams': num_teams,
+        'num_matchdays': num_matchdays,
+        'num_pools': num_pools,
+        'max_home_stand': max_home_stand,
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = perf_counter()
+        (pools, fixtures, breaks, model) = sports_schedule_sat.model_matches(
+            num_teams, num_matchdays, num_matches_per_day, num_pools,
+            max_home_stand, False
+        )
+        res['build_seconds'] = perf_counter() - start
+        res.update(model_size(model))
+        model.Minimize(sum(breaks))
+        start = perf_counter()
+        (solver, status) = sports_schedule_sat.solve_model(model, time, 1)
+        res['solve'] = {
+            'status': solver.StatusName(status),
+            'seconds': perf_counter() - start,
+            'objective': (
+                solver.ObjectiveValue()
+                if status in (cp_model.OPTIMAL, cp_model.FEASIBLE) else None
+            ),
+        }
+
+        (pools, fixtures, breaks, model) = sports_schedule_sat.model_matches(
+            num_teams, num_matchdays, num_matches_per_day, num_pools,
+            max_home_stand, True
+        )
+        variables = sports_schedule_sat.fixture_slice(
+            fixtures, range(num_matchdays), range(num_teams), range(num_teams)
+        )
+        res['search_bare'] = time_search(model, CountingPrinter(limit), time)
+        path = os.path.join(tmp_dir, f'bench-sports-{num_teams}.u8')
+        sink = RawSink(path)
+        try:
+            r = time_search(
+                model, VarValuesPrinter(variables, sink, limit=limit), time
+            )
+        finally:
+            sink.close()
+    r['bytes_per_solution'] = os.path.getsize(path) / max(r['solutions'], 1)
+    os.remove(path)
+    res['search_raw_sink'] = r
+    return res
+
+
+def bench_build(n_ts, num_pools=2, max_home_stand=3):
+    cases = []
+    for n_t in n_ts:
+        for builder in ['lists', 'numpy']:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = perf_counter()
+                model = sports_schedule_sat.build_matches(
+                    n_t,
+                    n_t - 1,
+                    n_t // 2,
+                    num_pools,
+                    max_home_stand,
+                    True,
+                    builder=builder
+                )[-1]
+                seconds = perf_counter() - start
+            res = {
+                'num_teams': n_t,
+                'builder': builder,
+                'build_seconds': seconds,
+            }
+            res.update(model_size(model))
+            print(
+                f'build, {n_t} teams, {builder}: {seconds:.2f} s, {res["constraints"]} constraints'
+            )
+            cases.append(res)
+    return cases
+
+
+def check_counts(n_ts, time):
+    checks = []
+    for n_t in n_ts:
+        if n_t not in KNOWN_COUNTS or KNOWN_COUNTS[n_t] > 10**5:
+            continue
+        (model, games) = te_cli.model_games(n_t=n_t, n_w=n_t - 1)
+        cp_sat = time_search(model, CountingPrinter(10**9), time)['solutions']
+        direct = sum(1 for _ in iter_schedules(n_t))
+        dp = count_schedules_dp(n_t, n_t - 1)
+        ok = cp_sat == direct == dp == KNOWN_COUNTS[n_t]
+        checks.append(
+            {
+                'n_t': n_t,
+                'expected': KNOWN_COUNTS[n_t],
+                'cp_sat': cp_sat,
+                'direct': direct,
+                'dp': dp,
+                'ok': ok,
+            }
+        )
+        if not ok:
+            raise AssertionError(f'Schedule count check failed: {checks[-1]}')
+    return checks
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description='Benchmark model build, search and output throughput.'
+    )
+    parser.add_argument(
+        '--teams',
+        type=int,
+        nargs='+',
+        default=[4, 6, 8, 10, 12, 14],
+        help='League sizes to sweep. Default is 4 to 14.'
+    )
+    parser.add_argument(
+        '--pools',
+        type=int,
+        nargs='+',
+        default=[1, 2],
+        help='sports_schedule_sat pool counts to sweep. Default is 1 and 2.'
+    )
+    parser.add_argument(
+        '--max_home_stand',
+        type=int,
+        nargs='+',
+        default=[2, 3],
+        help='sports_schedule_sat home stand limits to sweep.'
+    )
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        nargs='+',
+        default=[1, 2],
+        help=
+        'sports_schedule_sat seasons to sweep, in round robins: match days are rounds * (teams - 1). Default is 1 and 2.'
+    )
+    parser.add_argument(
+        '--build_teams',
+        type=int,
+        nargs='+',
+        default=[10, 20, 30, 40],
+        help=
+        'League sizes for the sports_schedule_sat model build comparison. Default is 10 to 40.'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=2000,
+        help='Solutions to enumerate per search. Default is 2000.'
+    )
+    parser.add_argument(
+        '--time',
+        type=float,
+        default=10,
+        help='Time limit per search or solve, in seconds. Default is 10.'
+    )
+    parser.add_argument(
+        '--out',
+        type=str,
+        default='bench_output.json',
+        help='Where to write the JSON results. Default is bench_output.json.'
+    )
+    args = parser.parse_args()
+
+    results = {
+        'checks': check_counts(args.teams, args.time),
+        'build': bench_build(args.build_teams),
+        'cases': [],
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_t in args.teams:
+            print(f'te_cli, {n_t} teams')
+            results['cases'].append(
+                bench_te_cli(n_t, args.limit, args.time, tmp_dir)
+            )
+        for n_t in args.teams:
+            for rounds in args.rounds:
+                for num_pools in args.pools:
+                    if num_pools > 1 and n_t // num_pools < 2:
+                        continue
+                    for mhs in args.max_home_stand:
+                        print(
+                            f'sports_schedule_sat, {n_t} teams, {rounds} rounds, {num_pools} pools, max home stand {mhs}'
+                        )
+                        results['cases'].append(
+                            bench_sports(
+                                n_t, rounds * (n_t - 1), num_pools, mhs,
+                                args.limit, args.time, tmp_dir
+                            )
+                        )
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Wrote {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''Checkpoints for long, sharded enumeration runs.
+
+A checkpoint records the output file, how many solutions have been
+written, which shards are complete and the byte offset of the output
+once those shards were flushed.  Resuming truncates the output back to
+that offset and only searches the shards that are still missing, so no
+schedule is written twice or skipped, even if the run died halfway
+through a shard.
+
+'''
+import json
+import os
+import tempfile
+
+
+def checkpoint_path(name):
+    return name + '.ckpt.json'
+
+
+def save_checkpoint(path, state):
+    # write then rename, so a crash never leaves a half-written checkpoint
+    with tempfile.NamedTemporaryFile(
+        'w', dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False
+    ) as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f.name, path)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_params(state, params):
+    for (k, v) in params.items():
+        if state['params'].get(k) != v:
+            raise ValueError(
+                f'Checkpoint was written with {k}={state["params"].get(k)}, not {v}.'
+            )
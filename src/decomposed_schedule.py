@@ -0,0 +1,288 @@
+'''Two-phase (decomposed) break minimization for large leagues.
+
+The monolithic model decides the days x teams x teams fixture cube, the
+home days and the breaks all at once.  When every team plays every day,
+the work splits in two much smaller models instead:
+
+1. the pattern model picks the home days home[d, t] of every team, its
+   home/away pattern (HAP), with half of the teams home each day, no
+   home stand longer than `max_home_stand`, the break bound of the
+   monolithic model, and the breaks minimized.  On top of that come
+   conditions every real schedule meets: teams that meet in a round
+   robin period differ on some day of it (one of them is home), and the
+   teams of a pool are home exactly as often as the pool hosts games;
+2. the opponent model gets the HAP set as data and only decides who
+   plays whom.  A fixture variable exists only where the home team is at
+   home and the away team away, which is a quarter of the cube; the
+   rest of the cube points at one variable fixed to 0, so the fixture
+   constraints are the monolithic ones (`add_fixture_constraints`).
+
+A first schedule comes from the seed: the games of the circle method,
+with the pattern model deciding only who is home in each, so any
+solution of it is a whole schedule.  After that, phase 1 only looks for
+HAP sets with fewer breaks than the best schedule so far.  Its
+conditions are necessary, not sufficient, so phase 2 can still find a
+set impossible; the set is then excluded and the next one tried, up to
+`attempts` sets.  Since phase 1 only leaves out sets no schedule can
+have, a phase 1 optimum that phase 2 completes is optimal for the whole
+problem, and so is the best schedule once phase 1 runs out of better
+sets.
+
+'''
+from time import perf_counter
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from home_away_patterns import meeting_periods
+from model_proto import (
+    add_clauses, add_linear, bool_vars, fix_vars, negated, new_bool_vars
+)
+
+
+def decomposable(num_teams, num_matches_per_day):
+    '''Whether every team plays every day, which the HAPs rely on.'''
+    return num_teams % 2 == 0 and num_matches_per_day == num_teams // 2
+
+
+def pool_home_days(pools, num_teams, num_matchdays):
+    '''`(lo, hi)` home days of the teams of each pool, from pool balance.'''
+    from sports_schedule_sat import (
+        expected_pool_vs_pool_games, season_expected_games, season_matchups
+    )
+
+    (matchups, matchups_exact, unique_games, total_games) = season_matchups(
+        num_teams, num_matchdays, num_teams // 2
+    )
+    bounds = []
+    for pooli in pools:
+        lo = sum(
+            season_expected_games(
+                games_per_rr=expected_pool_vs_pool_games(pooli, poolj),
+                matchups=matchups,
+                matchups_exact=matchups_exact,
+                unique_games=unique_games,
+                total_games=total_games
+            ) for poolj in pools
+        )
+        # within the pool, one more game is allowed
+        bounds.append((lo, lo + 1))
+    return bounds
+
+
+def pattern_model(
+    num_teams, num_matchdays, pools, max_home_stand, meetings=True
+):
+    '''Phase 1: `(model, home, brk)`, breaks minimized.
+
+    `meetings=False` leaves out the conditions on teams that meet, for a
+    model that decides the meetings itself.
+    '''
+    from sports_schedule_sat import add_break_vars, add_home_stand_clauses
+
+    model = cp_model.CpModel()
+    (n_d, n_t) = (num_matchdays, num_teams)
+    home = new_bool_vars(model, (n_d, n_t), 'at_home: day %i, team %i')
+    # every team plays every day, so half of them are home
+    add_linear(model, home, n_t // 2, n_t // 2)
+    add_home_stand_clauses(model, home, max_home_stand)
+    brk = add_break_vars(model, home, False)
+
+    # teams that meet in a period are home and away on some day of it:
+    # differ[p, d] implies the pair p is split on day d
+    (t1, t2) = np.triu_indices(n_t, 1)
+    for days in meeting_periods(n_t, n_d) if meetings else []:
+        days = list(days)
+        (a, b) = (home[days][:, t1].T, home[days][:, t2].T)
+        differ = new_bool_vars(model, a.shape)
+        add_clauses(
+            model,
+            np.concatenate(
+                [
+                    np.stack([negated(differ), a, b], axis=-1),
+                    np.stack([negated(differ), negated(a), negated(b)], axis=-1)
+                ]
+            ).reshape(-1, 3)
+        )
+        add_clauses(model, differ)
+
+    # the teams of a pool host all of its home games
+    for (pool, (lo, hi)) in zip(pools, pool_home_days(pools, n_t, n_d)):
+        add_linear(model, home[:, pool].reshape(1, -1), lo, hi)
+
+    model.Minimize(sum(bool_vars(model, brk.ravel())))
+    return (model, home, brk)
+
+
+def sparse_fixtures(model, allowed):
+    '''A fixture index cube with variables only where `allowed`; the rest
+    is one variable fixed to 0.'''
+    zero = new_bool_vars(model, (1, ))
+    fix_vars(model, zero, 0)
+    fix = np.full(allowed.shape, zero[0])
+    fix[allowed] = new_bool_vars(model, (int(allowed.sum()), ))
+    return fix
+
+
+def circle_timetable(num_teams, num_matchdays):
+    '''opp[d, t], the opponent of team t on day d in the circle method.
+
+    Round r pairs the last team with team r and teams r + k and r - k
+    (mod num_teams - 1); the rounds repeat for every round robin.
+    '''
+    n = num_teams - 1
+    opp = np.empty((num_matchdays, num_teams), dtype=np.int64)
+    for d in range(num_matchdays):
+        r = d % n
+        opp[d, n] = r
+        opp[d, r] = n
+        for k in range(1, num_teams // 2):
+            (a, b) = ((r + k) % n, (r - k) % n)
+            opp[d, a] = b
+            opp[d, b] = a
+    return opp
+
+
+def timetable_model(num_teams, num_matchdays, pools, max_home_stand):
+    '''The seed: `(model, home, brk, fix)` deciding only who is home in
+    the games of the circle method, so every solution is a schedule.'''
+    from sports_schedule_sat import add_fixture_constraints
+
+    (model, home, brk) = pattern_model(
+        num_teams, num_matchdays, pools, max_home_stand, meetings=False
+    )
+    opp = circle_timetable(num_teams, num_matchdays)
+    allowed = opp[:, :, None] == np.arange(num_teams)
+    fix = sparse_fixtures(model, allowed)
+    add_fixture_constraints(model, fix, pools, num_teams // 2)
+    # fix[d, h, a] is h being home on day d
+    (d, h, a) = np.nonzero(allowed)
+    add_linear(
+        model, np.stack([fix[d, h, a], home[d, h]], axis=1), 0, 0,
+        coeffs=[1, -1]
+    )
+    return (model, home, brk, fix)
+
+
+def opponent_model(pattern, pools):
+    '''Phase 2: `(model, fix)` for the home days `pattern[d, t]`.'''
+    from sports_schedule_sat import add_fixture_constraints
+
+    model = cp_model.CpModel()
+    n_t = pattern.shape[1]
+    # a game needs the home team at home and the away team away
+    fix = sparse_fixtures(
+        model, (pattern[:, :, None] == 1) & (pattern[:, None, :] == 0)
+    )
+    add_fixture_constraints(model, fix, pools, n_t // 2)
+    return (model, fix)
+
+
+def opponents_exist(pattern, pools, time_limit=10):
+    '''Whether phase 2 can complete the HAP set `pattern[d, t]`; only a
+    proof of the contrary, within `time_limit` seconds, says no.'''
+    (model, _) = opponent_model(pattern, pools)
+    (_, status) = solve_phase(model, time_limit, 1)
+    return status != cp_model.INFEASIBLE
+
+
+def solve_phase(model, time_limit, num_cpus=None, debug=None):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = max(time_limit, 0)
+    solver.parameters.log_search_progress = bool(debug)
+    if num_cpus is not None:
+        solver.parameters.num_search_workers = num_cpus
+    status = solver.Solve(model)
+    return (solver, status)
+
+
+def solve_decomposed(
+    num_teams,
+    num_matchdays,
+    pools,
+    max_home_stand,
+    time_limit,
+    num_cpus=None,
+    attempts=5,
+    debug=None
+):
+    '''Minimize breaks in two phases.
+
+    The seed schedule, on the circle method's games, comes first.  Phase
+    1 then looks for a HAP set with fewer breaks than the best schedule
+    so far and phase 2 for its opponents; a phase 2 failure excludes the
+    set, and a success becomes the best schedule.  This goes on for up to
+    `attempts` HAP sets, or until phase 1 runs out of better sets, which
+    proves the best schedule optimal.
+
+    Returns `(status, objective, values)`, `values` the fixture values
+    of the best schedule as a `days x home x away` array, or `None` if
+    there is none yet.
+    '''
+    start = perf_counter()
+
+    def left():
+        return time_limit - (perf_counter() - start)
+
+    (objective, values) = (None, None)
+    (model, home, brk, fix) = timetable_model(
+        num_teams, num_matchdays, pools, max_home_stand
+    )
+    (solver, status) = solve_phase(model, left() / 3, num_cpus, debug)
+    print(
+        'Seed schedule: %s, %.2f s' %
+        (solver.StatusName(status), solver.WallTime())
+    )
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        objective = int(solver.ObjectiveValue())
+        values = np.asarray(solver.ResponseProto().solution)[fix]
+        print('  - %i breaks' % objective)
+
+    (patterns, home, brk) = pattern_model(
+        num_teams, num_matchdays, pools, max_home_stand
+    )
+    for attempt in range(attempts):
+        if left() <= 0:
+            break
+        if objective is not None:
+            # only a better HAP set can improve on the best schedule
+            add_linear(patterns, brk.reshape(1, -1), None, objective - 1)
+        # phase 1 gets half of what is left, so phase 2 has time too
+        (solver, status) = solve_phase(patterns, left() / 2, num_cpus, debug)
+        print(
+            'Phase 1, attempt %i: %s, %.2f s' %
+            (attempt + 1, solver.StatusName(status), solver.WallTime())
+        )
+        if status == cp_model.INFEASIBLE:
+            # no HAP set, hence no schedule, beats the best one
+            return (
+                'INFEASIBLE' if values is None else 'OPTIMAL', objective,
+                values
+            )
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            break
+        proved = status == cp_model.OPTIMAL
+        pattern = np.asarray(solver.ResponseProto().solution)[home]
+        breaks = int(solver.ObjectiveValue())
+        print('  - HAP set with %i breaks' % breaks)
+
+        (opponents, fix) = opponent_model(pattern, pools)
+        (solver, status) = solve_phase(opponents, left(), num_cpus, debug)
+        print(
+            'Phase 2, attempt %i: %s, %.2f s' %
+            (attempt + 1, solver.StatusName(status), solver.WallTime())
+        )
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            objective = breaks
+            values = np.asarray(solver.ResponseProto().solution)[fix]
+            if proved:
+                return ('OPTIMAL', objective, values)
+            continue
+        # no schedule has this HAP set: never pick it again
+        flat = home.ravel()
+        add_clauses(
+            patterns, [np.where(pattern.ravel() == 1, negated(flat), flat)]
+        )
+    if values is None:
+        return ('UNKNOWN', None, None)
+    return ('FEASIBLE', objective, values)
@@ -0,0 +1,164 @@
+'''Catalogue of non-isomorphic 1-factorizations of K_n.
+
+Every single round robin schedule for `n_t` teams is some 1-factorization
+of K_n with its teams relabeled and its weeks put in some order.  The
+catalogue keeps one representative per isomorphism class together with its
+automorphism group, which is enough to
+
+* count the schedules exactly: a class with automorphism group `Aut`
+  accounts for `n_t! * (n_t - 1)! / |Aut|` schedules, and
+* regenerate all of them lazily, by applying each team relabeling once
+  per coset of `Aut` and then every ordering of the weeks.
+
+Building the catalogue walks every labelled 1-factorization once, so it is
+only practical up to 8 teams (6240 factorizations, 6 classes), and
+`build_catalogue` refuses more (K_10 alone has about 1.2e9).  Larger
+catalogues can be dropped into the cache directory in the same JSON
+format and are then used as is; a build is never started unless asked
+for with `build=True`.
+
+'''
+import argparse
+import json
+import os
+from itertools import permutations
+from math import factorial
+
+from round_robin import directed_pairs, iter_schedules
+
+# largest league build_catalogue will enumerate
+BUILD_LIMIT = 8
+
+
+def catalogue_path(n_t, cache_dir='data'):
+    return os.path.join(cache_dir, f'factorizations-n_t={n_t}.json')
+
+
+def factors_from_wks(n_t, wks):
+    factors = [[] for _ in range(n_t - 1)]
+    for ((t1, t2), wk) in zip(directed_pairs(n_t), wks):
+        if t1 < t2:
+            factors[wk - 1].append((t1, t2))
+    return factors
+
+
+def factorization_key(factors):
+    return frozenset(frozenset(f) for f in factors)
+
+
+def relabel(factors, perm):
+    return [
+        [(min(perm[t1], perm[t2]), max(perm[t1], perm[t2])) for (t1, t2) in f]
+        for f in factors
+    ]
+
+
+def build_catalogue(n_t):
+    if n_t > BUILD_LIMIT:
+        raise ValueError(
+            f'Building the catalogue stops at {BUILD_LIMIT} teams; '
+            f'{n_t} teams need a catalogue in the cache directory.'
+        )
+    seen = set()
+    classes = []
+    for wks in iter_schedules(n_t, normalized=True):
+        factors = factors_from_wks(n_t, wks)
+        key = factorization_key(factors)
+        if key in seen:
+            continue
+        aut = []
+        for perm in permutations(range(n_t)):
+            other = factorization_key(relabel(factors, perm))
+            seen.add(other)
+            if other == key:
+                aut.append(list(perm))
+        classes.append({'factors': factors, 'aut': aut})
+        print(f'class {len(classes)}: |Aut| = {len(aut)}')
+    return {'n_t': n_t, 'classes': classes}
+
+
+def save_catalogue(catalogue, path):
+    with open(path, 'w') as f:
+        json.dump(catalogue, f)
+
+
+def load_catalogue(n_t, cache_dir='data', build=False):
+    path = catalogue_path(n_t, cache_dir)
+    if os.path.exists(path):
+        with open(path) as f:
+            catalogue = json.load(f)
+        for cls in catalogue['classes']:
+            cls['factors'] = [[tuple(e) for e in f] for f in cls['factors']]
+        return catalogue
+    if not build:
+        raise FileNotFoundError(path)
+    catalogue = build_catalogue(n_t)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_catalogue(catalogue, path)
+    return catalogue
+
+
+def class_size(n_t, cls):
+    return factorial(n_t) * factorial(n_t - 1) // len(cls['aut'])
+
+
+def count_schedules(catalogue):
+    n_t = catalogue['n_t']
+    return sum(class_size(n_t, cls) for cls in catalogue['classes'])
+
+
+def iter_relabelings(n_t, aut):
+    # one team permutation per left coset perm * Aut, namely the
+    # lexicographically smallest one
+    for perm in permutations(range(n_t)):
+        if all(perm <= tuple(perm[a] for a in alpha) for alpha in aut):
+            yield perm
+
+
+def iter_class_schedules(n_t, cls):
+    pos = {p: i for (i, p) in enumerate(directed_pairs(n_t))}
+    wks = [0] * len(pos)
+    for perm in iter_relabelings(n_t, cls['aut']):
+        factors = relabel(cls['factors'], perm)
+        for order in permutations(range(n_t - 1)):
+            for (wk, f) in zip(order, factors):
+                for (t1, t2) in f:
+                    wks[pos[(t1, t2)]] = wk + 1
+                    wks[pos[(t2, t1)]] = wk + 1
+            yield tuple(wks)
+
+
+def iter_catalogue_schedules(catalogue):
+    n_t = catalogue['n_t']
+    for cls in catalogue['classes']:
+        yield from iter_class_schedules(n_t, cls)
+
+
+def main():
+    '''Build (or load) the catalogue and report its size.'''
+    parser = argparse.ArgumentParser(
+        description=
+        'Catalogue non-isomorphic round robin schedules and count all schedules.'
+    )
+    parser.add_argument(
+        '--teams',
+        type=int,
+        dest='n_t',
+        default=8,
+        help='Number of teams in the league'
+    )
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        dest='cache_dir',
+        default='data',
+        help='Directory holding the cached catalogues. Default is data.'
+    )
+    args = parser.parse_args()
+    catalogue = load_catalogue(args.n_t, args.cache_dir, build=True)
+    print(f'non-isomorphic 1-factorizations: {len(catalogue["classes"])}')
+    print(f'unique schedules: {count_schedules(catalogue)}')
+
+
+if __name__ == '__main__':
+    main()
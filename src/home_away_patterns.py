@@ -0,0 +1,349 @@
+'''Cached sets of home/away patterns (HAPs).
+
+A team's HAP is its home (1) and away (0) days over the season.  In a
+`sports_schedule_sat` schedule where every team plays every day
+
+* no HAP is home or away more than `max_home_stand` days in a row,
+* every day, half of the teams are at home,
+* two teams can only meet on days where one is home and the other away,
+  so HAPs of teams that meet `m` times differ on at least `m` days,
+* the breaks (two home or two away days in a row) of all teams add up to
+  something within the model's break bound.
+
+A HAP set is `num_teams` HAPs that meet all of these together.  They are
+found once per league shape, by a depth-first search over bitsets of the
+feasible single-team patterns, and cached as
+
+* `patterns`: `P x num_matchdays` uint8, every feasible HAP,
+* `sets`: `K x num_teams` indices into `patterns`, sorted within a set,
+  and the sets sorted by their total breaks, fewest first (ties in
+  search order), so set 0 is the best one known,
+
+in `haps-...npz` under the cache directory.  A search stopped by `limit`
+or by `time_limit` is cached as incomplete, and only reused for limits
+it can satisfy or time limits no longer than the one that stopped it.
+The search grows exponentially with the league, so beyond about 10
+teams expect it to stop early.
+
+`model_matches` can then restrict each team to the patterns that occur
+in some set, which needs every set to be known, or fix the teams' home
+days to one set outright.  These are necessary conditions only: the
+opponents of a set can still turn out impossible to arrange, so a fixed
+set is first checked with the opponent model of `decomposed_schedule`
+and the next one taken if it has no schedule.
+
+'''
+import argparse
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from schedule_check import break_counts, home_stand_fails
+
+
+def break_bounds(num_matchdays, listall):
+    '''`(lo, hi)` total breaks, as `breaks_constraint` has them.'''
+    bound = num_matchdays + num_matchdays % 2
+    if listall:
+        return (None, bound)
+    return (bound, None)
+
+
+def hap_cache_path(
+    num_teams,
+    num_matchdays,
+    max_home_stand,
+    breaks,
+    cache_dir='data'
+):
+    (lo, hi) = ('none' if b is None else b for b in breaks)
+    return os.path.join(
+        cache_dir,
+        f'haps-num_teams={num_teams}-num_matchdays={num_matchdays}-max_home_stand={max_home_stand}-breaks={lo}-{hi}.npz'
+    )
+
+
+def feasible_patterns(num_matchdays, max_home_stand):
+    '''Every single-team HAP without a too long home or away stand.'''
+    codes = np.arange(1 << num_matchdays, dtype=np.int64)
+    bits = codes[:, None] >> np.arange(num_matchdays)[None, :] & 1
+    bits = bits.astype(np.uint8)
+    ok = ~home_stand_fails(bits[:, :, None], max_home_stand)
+    return bits[ok]
+
+
+def meeting_periods(num_teams, num_matchdays):
+    '''The round robin periods in which every pair has to meet once.'''
+    from sports_schedule_sat import season_matchups
+
+    (matchups, matchups_exact, unique_games, _) = season_matchups(
+        num_teams, num_matchdays, num_teams // 2
+    )
+    days = int(unique_games // (num_teams // 2))
+    periods = [range(m * days, (m + 1) * days) for m in range(matchups - 1)]
+    if matchups_exact:
+        periods.append(range((matchups - 1) * days, num_matchdays))
+    return periods
+
+
+def popcount(x):
+    return bin(x).count('1')
+
+
+def bitset(mask):
+    return sum(1 << int(i) for i in np.flatnonzero(mask))
+
+
+def search_hap_sets(
+    patterns, num_teams, periods, breaks, limit=None, time_limit=None
+):
+    '''Index sets (sorted) of `num_teams` patterns that fit together.
+
+    Returns `(sets, complete)`; `complete` is false if `limit`, or
+    `time_limit` seconds, cut the search short.
+    '''
+    deadline = None if time_limit is None else perf_counter() + time_limit
+    (n_pat, num_matchdays) = patterns.shape
+    half = num_teams // 2
+    (lo, hi) = breaks
+    n_breaks = break_counts(patterns[:, :, None].astype(bool)).astype(int)
+    max_breaks = int(n_breaks.max(initial=0))
+    # compatible[i]: patterns, from i on, that may share a set with i,
+    # that is differ on some day of each period, when the two teams meet;
+    # on the patterns as bit codes, one P x P xor per period
+    codes = [bitset(p) for p in patterns]
+    meet = np.ones((n_pat, n_pat), dtype=bool)
+    for days in periods:
+        mask = sum(1 << d for d in days)
+        masked = np.array(
+            [c & mask for c in codes],
+            dtype=np.int64 if num_matchdays < 63 else object
+        )
+        meet &= (masked[:, None] ^ masked[None, :]) != 0
+    order = np.arange(n_pat)
+    compatible = [bitset(meet[i] & (order >= i)) for i in range(n_pat)]
+    distinct = len(periods) > 0
+    home = [bitset(patterns[:, d] == 1) for d in range(num_matchdays)]
+    everyone = (1 << n_pat) - 1
+    at_most = [bitset(n_breaks <= b) for b in range(max_breaks + 1)]
+    exactly = [bitset(n_breaks == b) for b in range(max_breaks + 1)]
+    sets = []
+    chosen = []
+
+    def fewest_breaks(candidates, left):
+        # breaks of the `left` candidates with the fewest of them
+        total = 0
+        for (b, mask) in enumerate(exactly):
+            n = min(popcount(candidates & mask), left)
+            total += b * n
+            left -= n
+            if not left:
+                return total
+        return total
+
+    def extend(candidates, counts, total):
+        if len(sets) == limit:
+            return False
+        if deadline is not None and perf_counter() > deadline:
+            return False
+        left = num_teams - len(chosen)
+        if left == 0:
+            if lo is None or total >= lo:
+                sets.append(list(chosen))
+            return True
+        if lo is not None and total + left * max_breaks < lo:
+            return True
+        for d in range(num_matchdays):
+            if counts[d] == half:
+                candidates &= ~home[d]
+            elif counts[d] + left == half:
+                candidates &= home[d]
+        if hi is not None:
+            candidates &= at_most[min(hi - total, max_breaks)]
+            if distinct and total + fewest_breaks(candidates, left) > hi:
+                return True
+        if distinct:
+            # every pattern is used at most once, so each day needs enough
+            # candidates home, and away, to fill it
+            for d in range(num_matchdays):
+                need = half - counts[d]
+                if (
+                    popcount(candidates & home[d]) < need
+                    or popcount(candidates & ~home[d]) < left - need
+                ):
+                    return True
+        while candidates:
+            i = (candidates & -candidates).bit_length() - 1
+            candidates ^= 1 << i
+            chosen.append(i)
+            # i itself stays a candidate only if patterns may repeat
+            ok = extend(
+                compatible[i] & (candidates | 1 << i),
+                [c + int(h) for (c, h) in zip(counts, patterns[i])],
+                total + n_breaks[i]
+            )
+            chosen.pop()
+            if not ok:
+                return False
+        return True
+
+    complete = extend(everyone, [0] * num_matchdays, 0)
+    return (np.array(sets, dtype=np.int32).reshape(-1, num_teams), complete)
+
+
+def sort_by_breaks(patterns, sets):
+    '''`sets`, fewest total breaks first, in search order within a tie.'''
+    n_breaks = break_counts(patterns[:, :, None].astype(bool)).astype(int)
+    return sets[np.argsort(n_breaks[sets].sum(axis=1), kind='stable')]
+
+
+def build_hap_sets(
+    num_teams,
+    num_matchdays,
+    max_home_stand,
+    breaks,
+    limit=None,
+    time_limit=None
+):
+    if num_teams % 2:
+        raise ValueError('Home/away patterns need an even number of teams.')
+    patterns = feasible_patterns(num_matchdays, max_home_stand)
+    (sets, complete) = search_hap_sets(
+        patterns, num_teams, meeting_periods(num_teams, num_matchdays),
+        breaks, limit, time_limit
+    )
+    return {
+        'patterns': patterns,
+        'sets': sort_by_breaks(patterns, sets),
+        'complete': np.array(complete),
+        'limit': np.array(-1 if limit is None else limit),
+        'time_limit': np.array(-1 if time_limit is None else time_limit),
+    }
+
+
+def save_hap_sets(haps, path):
+    # write a temporary file of our own, then rename, so a crash never
+    # leaves a half-written cache and concurrent writers never share one
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False
+    ) as f:
+        np.savez(f, **haps)
+    os.replace(f.name, path)
+
+
+def load_hap_sets(
+    num_teams,
+    num_matchdays,
+    max_home_stand,
+    breaks,
+    cache_dir='data',
+    limit=None,
+    build=True,
+    time_limit=None
+):
+    '''The HAP sets for a league shape, from the cache if it has enough.
+
+    An incomplete cache is enough for `limit` sets it has, or for a
+    `time_limit` no longer than the one its search ran out of.
+    '''
+    path = hap_cache_path(
+        num_teams, num_matchdays, max_home_stand, breaks, cache_dir
+    )
+    if os.path.exists(path):
+        with np.load(path) as f:
+            haps = {k: f[k] for k in f.files}
+        # stopped by the clock rather than by its limit
+        cached_time = float(haps.get('time_limit', -1))
+        timed_out = (
+            not haps['complete'] and cached_time >= 0
+            and len(haps['sets']) != int(haps['limit'])
+        )
+        if (
+            haps['complete']
+            or (limit is not None and len(haps['sets']) >= limit) or (
+                timed_out and time_limit is not None
+                and time_limit <= cached_time
+            )
+        ):
+            haps['sets'] = sort_by_breaks(haps['patterns'], haps['sets'])
+            return haps
+    if not build:
+        raise FileNotFoundError(path)
+    haps = build_hap_sets(
+        num_teams, num_matchdays, max_home_stand, breaks, limit, time_limit
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    save_hap_sets(haps, path)
+    return haps
+
+
+def set_patterns(haps, k):
+    '''HAP set `k` as a `num_teams x num_matchdays` array.'''
+    return haps['patterns'][haps['sets'][k]]
+
+
+def used_patterns(haps):
+    '''Patterns a team may have, `U x num_matchdays`.
+
+    Those that occur in some set, if every set is known, or else all the
+    feasible ones.
+    '''
+    if not haps['complete']:
+        return haps['patterns']
+    return haps['patterns'][np.unique(haps['sets'])]
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description=
+        'Enumerate and cache the home/away pattern sets of a league shape.'
+    )
+    parser.add_argument('--teams', type=int, dest='num_teams', default=4)
+    parser.add_argument('--days', type=int, dest='num_matchdays', default=3)
+    parser.add_argument('--max_home_stand', type=int, default=3)
+    parser.add_argument(
+        '--minimize',
+        default=False,
+        action='store_true',
+        help=
+        'Use the break bound of a single optimized run instead of the one of --enumerate.'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=None,
+        help='Stop after this many sets.  Default is all of them.'
+    )
+    parser.add_argument(
+        '--time',
+        type=float,
+        default=None,
+        help='Stop the search after this many seconds.  Default is no limit.'
+    )
+    parser.add_argument('--cache_dir', type=str, default='data')
+    args = parser.parse_args()
+    haps = load_hap_sets(
+        args.num_teams,
+        args.num_matchdays,
+        args.max_home_stand,
+        break_bounds(args.num_matchdays, not args.minimize),
+        args.cache_dir,
+        args.limit,
+        time_limit=args.time
+    )
+    print(
+        f'{len(haps["patterns"])} feasible patterns, {len(haps["sets"])} HAP sets'
+        + ('' if haps['complete'] else ' (stopped at --limit or --time)')
+    )
+    if len(haps['sets']):
+        n_breaks = break_counts(
+            haps['patterns'][:, :, None].astype(bool)
+        ).astype(int)
+        print(f'fewest breaks: {n_breaks[haps["sets"][0]].sum()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''On-disk cache of built CP-SAT models.
+
+Building a model in Python costs the same every run for the same league,
+so a built model can be kept as
+
+* `model-<key>.pbtxt`: the `CpModelProto`, as written by `ExportToFile`,
+* `model-<key>.npz`: the proto indices of the variables the caller needs
+  back (fixtures, at_home, breaks, ...), each as an integer array,
+
+under the cache directory.  `<key>` is a hash of the model parameters
+and the OR-Tools version, so a cached proto is never read by a version
+that did not write it.  A reloaded model gets its variables back with
+`GetBoolVarFromProtoIndex`, in the shape they were saved in.
+
+'''
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+from ortools import __version__ as ortools_version
+from ortools.sat.python import cp_model
+
+
+def model_cache_stem(params, cache_dir=os.path.join('data', 'cache')):
+    blob = json.dumps(
+        dict(params, ortools=ortools_version), sort_keys=True
+    ).encode('utf-8')
+    key = hashlib.sha256(blob).hexdigest()[:16]
+    return os.path.join(cache_dir, f'model-{key}')
+
+
+def var_index(variables):
+    '''Proto indices of a (nested) list of variables, as an array.'''
+    if isinstance(variables, (list, tuple)):
+        return np.array([var_index(v) for v in variables], dtype=np.int32)
+    return variables.Index()
+
+
+def model_vars(model, index):
+    '''The variables of `model` at `index`, nested like `index`.'''
+    if np.ndim(index) == 0:
+        return model.GetBoolVarFromProtoIndex(int(index))
+    return [model_vars(model, i) for i in index]
+
+
+def save_model(stem, model, index):
+    '''Write `model` and the `{name: indices}` arrays of its variables.'''
+    cache_dir = os.path.dirname(stem) or '.'
+    os.makedirs(cache_dir, exist_ok=True)
+    # temporary files of our own, so concurrent runs building the same
+    # model never write into each other's; ExportToFile picks text
+    # format from the extension
+    with tempfile.NamedTemporaryFile(
+        dir=cache_dir, suffix='.tmp.pbtxt', delete=False
+    ) as f:
+        pass
+    model.ExportToFile(f.name)
+    os.replace(f.name, stem + '.pbtxt')
+    # the indices go last: a proto without them is never used
+    with tempfile.NamedTemporaryFile(
+        dir=cache_dir, suffix='.npz.tmp', delete=False
+    ) as f:
+        np.savez(f, **index)
+    os.replace(f.name, stem + '.npz')
+
+
+def load_model(stem):
+    '''`(model, index)` from the cache, or `None` if it is not there.'''
+    if not os.path.exists(stem + '.npz'):
+        return None
+    with np.load(stem + '.npz') as f:
+        index = {k: f[k] for k in f.files}
+    with open(stem + '.pbtxt') as f:
+        text = f.read()
+    model = cp_model.CpModel()
+    if not model.Proto().parse_text_format(text):
+        raise ValueError(f'Could not parse the cached model {stem}.pbtxt.')
+    return (model, index)
@@ -0,0 +1,79 @@
+'''Build CP-SAT models in bulk from NumPy index arrays.
+
+The variables of a model are kept as arrays of their proto indices (a
+negative literal `-i - 1` is the negation of variable `i`).  The variable
+lists of constraints then come from slicing and stacking those arrays
+once per constraint family, and each constraint goes straight into the
+`CpModelProto`, without building linear expressions in Python.  Variable
+objects are only made for the arrays a caller needs back.
+
+'''
+import numpy as np
+from ortools.sat.python import cp_model
+
+
+def new_bool_vars(model, shape, name=None):
+    '''Add `prod(shape)` Boolean variables; returns their index array.
+
+    `name`, if given, is formatted with each variable's multi-index.
+    '''
+    proto = model.Proto()
+    first = len(proto.variables)
+    index = np.arange(first, first + int(np.prod(shape))).reshape(shape)
+    for i in np.ndindex(*shape) if name else range(index.size):
+        v = proto.variables.add()
+        v.domain.extend([0, 1])
+        if name:
+            v.name = name % i
+    return index
+
+
+def negated(literals):
+    return -np.asarray(literals) - 1
+
+
+def fix_vars(model, index, value):
+    proto = model.Proto()
+    for i in np.ravel(index).tolist():
+        domain = proto.variables[i].domain
+        domain[0] = value
+        domain[1] = value
+
+
+def add_linear(model, rows, lo, hi, coeffs=None):
+    '''`lo <= sum(coeffs * x[row]) <= hi` for every row of `rows` (`K x n`).
+
+    `lo`, `hi` are scalars or length `K`, `coeffs` length `n` (default
+    all ones) or `K x n`; `None` bounds are open.
+    '''
+    rows = np.asarray(rows)
+    k = rows.shape[0]
+    lo = np.broadcast_to(cp_model.INT_MIN if lo is None else lo, (k, ))
+    hi = np.broadcast_to(cp_model.INT_MAX if hi is None else hi, (k, ))
+    if coeffs is None:
+        coeffs = np.ones(rows.shape[1], dtype=np.int64)
+    coeffs = np.broadcast_to(coeffs, rows.shape)
+    proto = model.Proto()
+    for (row, c, l, h) in zip(
+        rows.tolist(), coeffs.tolist(), lo.tolist(), hi.tolist()
+    ):
+        ct = proto.constraints.add()
+        ct.linear.vars.extend(row)
+        ct.linear.coeffs.extend(c)
+        ct.linear.domain.extend([l, h])
+
+
+def add_clauses(model, literals):
+    '''A Boolean or over every row of `literals` (`K x n`).'''
+    proto = model.Proto()
+    for row in np.asarray(literals).tolist():
+        proto.constraints.add().bool_or.literals.extend(row)
+
+
+def bool_vars(model, index):
+    '''Variable objects for an index array, as nested lists.'''
+    index = np.asarray(index)
+    flat = [model.GetBoolVarFromProtoIndex(i) for i in index.ravel().tolist()]
+    for n in reversed(index.shape[1:]):
+        flat = [flat[i:i + n] for i in range(0, len(flat), n)]
+    return flat
@@ -0,0 +1,260 @@
+'''Rest-of-season playoff odds.
+
+Takes the first `played` weeks of a scores CSV as final, and simulates
+the rest of the season many times over:
+
+* every team's score in a remaining week is drawn with replacement from
+  its own scores so far,
+* the games are either the real remaining schedule (the opponents in the
+  CSV) or, with a set of schedules, the whole season is replayed on
+  schedule `sim % S` for simulated season `sim`, played weeks included,
+* standings are ranked by wins, then points for, as in `standings`.
+
+Seasons are simulated in chunks of `batch_size`, fully vectorized, and
+each chunk draws from its own `SeedSequence.spawn` stream, so results
+for a given seed do not depend on how many worker processes share the
+chunks.  Only the team x rank counts come back from the workers.
+
+'''
+import argparse
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from scores_cache import load_scores, parse_scores
+from standings import read_schedules, scores_path
+from standings_aggregate import StandingsAggregator
+
+_context = {}
+
+
+def playoff_odds_path(
+    league_id, league_size, season, played, sims, data_dir='data'
+):
+    return os.path.join(
+        data_dir,
+        f'playoff_odds-league_id={league_id}-league_size={league_size}-season={season}-played={played}-sims={sims}.csv'
+    )
+
+
+def bootstrap_scores(rng, played_points, n_sims, n_weeks):
+    '''`n_sims x n_weeks x T` scores, each team resampling its own.'''
+    (n_played, n_teams) = played_points.shape
+    draws = rng.integers(0, n_played, size=(n_sims, n_weeks, n_teams))
+    return played_points[draws, np.arange(n_teams)]
+
+
+def played_wins(points, opps):
+    '''Wins (`S x T`) over the played weeks, for every schedule.'''
+    n_weeks = points.shape[0]
+    pts_opp = points[np.arange(n_weeks)[None, :, None], opps[:, :n_weeks, :]]
+    return (points[None, :, :] > pts_opp).sum(axis=1)
+
+
+def rank_seasons(w, pf):
+    '''Ranks (`S x T`) by wins, then points for, both varying by season.'''
+    n_teams = w.shape[1]
+    key = w + pf / (pf.max() + 1)
+    rank = np.empty(w.shape, dtype=np.int64)
+    np.put_along_axis(
+        rank,
+        np.argsort(-key, axis=1, kind='stable'),
+        np.arange(1, n_teams + 1)[None, :],
+        axis=1
+    )
+    return rank
+
+
+def simulate_chunk(task):
+    (seed_seq, first_sim, n_sims) = task
+    ctx = _context
+    rng = np.random.default_rng(seed_seq)
+    played = ctx['points'].shape[0]
+    opps = ctx['opps']
+    # schedule of every simulated season, and its remaining weeks
+    which = (first_sim + np.arange(n_sims)) % opps.shape[0]
+    opps_rest = opps[which, played:, :].astype(np.int64)
+    rest = bootstrap_scores(rng, ctx['points'], n_sims, opps_rest.shape[1])
+    pts_opp = np.take_along_axis(rest, opps_rest, axis=2)
+    w = ctx['wins'][which] + (rest > pts_opp).sum(axis=1)
+    pf = ctx['pf'][None, :] + rest.sum(axis=1)
+    agg = StandingsAggregator(
+        ctx['team_ids'], ctx['teams'], opps.shape[1], wins=True
+    )
+    agg.add(w, rank_seasons(w, pf))
+    return agg
+
+
+def init_worker(context):
+    _context.clear()
+    _context.update(context)
+
+
+def simulate_playoff_odds(
+    team_ids,
+    teams,
+    points,
+    opps,
+    n_sims,
+    seed=None,
+    batch_size=100000,
+    n_workers=None
+):
+    '''Simulate `n_sims` seasons and return their `StandingsAggregator`.
+
+    `points` are the played weeks (weeks x teams) and `opps` the 0-based
+    opponents of one or more full-season schedules (`S x weeks x T`).
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    opps = np.asarray(opps)
+    context = {
+        'team_ids': np.asarray(team_ids),
+        'teams': np.asarray(teams),
+        'points': points,
+        'opps': opps,
+        'wins': played_wins(points, opps),
+        'pf': points.sum(axis=0),
+    }
+    starts = range(0, n_sims, batch_size)
+    children = np.random.SeedSequence(seed).spawn(len(starts))
+    tasks = [
+        (child, start, min(batch_size, n_sims - start))
+        for (child, start) in zip(children, starts)
+    ]
+    total = StandingsAggregator(
+        team_ids, teams, opps.shape[1], wins=True
+    )
+    if n_workers is None or n_workers == 1:
+        init_worker(context)
+        for task in tasks:
+            total.merge(simulate_chunk(task))
+        return total
+    with Pool(
+        processes=n_workers, initializer=init_worker, initargs=(context, )
+    ) as pool:
+        for agg in pool.imap_unordered(simulate_chunk, tasks):
+            total.merge(agg)
+    return total
+
+
+def odds_table(agg, top):
+    n = max(agg.n_sims, 1)
+    n_w = agg.win_counts.shape[1]
+    return pd.DataFrame(
+        {
+            'team_id': agg.team_ids,
+            'team': agg.teams,
+            'w_mean': agg.win_counts @ np.arange(n_w) / n,
+            'p_first': agg.rank_counts[:, 0] / n,
+            'p_top': agg.rank_counts[:, :top].sum(axis=1) / n,
+        }
+    ).sort_values('p_top', ascending=False)
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description='Simulate the rest of the season and report playoff odds.'
+    )
+    parser.add_argument('--league_id', type=int, default=899513)
+    parser.add_argument('--league_size', type=int, default=10)
+    parser.add_argument('--season', type=int, default=2020)
+    parser.add_argument(
+        '--weeks',
+        type=int,
+        default=12,
+        help='Weeks in the regular season. Default is 12.'
+    )
+    parser.add_argument(
+        '--played',
+        type=int,
+        required=True,
+        help='Weeks of the scores CSV to take as played.'
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=4,
+        help='Number of playoff spots. Default is 4.'
+    )
+    parser.add_argument(
+        '--schedules',
+        type=str,
+        default=None,
+        help=
+        'Replay the season on these schedules (schedules-*.parquet, te_cli --format compact .npy or schedule store .sched file) instead of the real one.'
+    )
+    parser.add_argument(
+        '--sims',
+        type=int,
+        default=1000000,
+        help='Seasons to simulate. Default is 1e6.'
+    )
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        dest='n_workers',
+        default=None,
+        help='Worker processes. Default is to simulate in this process.'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=100000,
+        help='Seasons per vectorized chunk. Default is 100000.'
+    )
+    parser.add_argument('--data_dir', type=str, default='data')
+    parser.add_argument(
+        '--scores_cache',
+        type=str,
+        default=None,
+        help=
+        'Read the scores through a binary cache in this directory (see scores_cache), e.g. data/cache. Default is to parse the CSV.'
+    )
+    args = parser.parse_args()
+    if not 1 <= args.played <= args.weeks:
+        raise ValueError('--played must be between 1 and --weeks.')
+    path = scores_path(
+        args.league_id, args.league_size, args.season, args.weeks,
+        args.data_dir
+    )
+    if args.scores_cache is not None:
+        (team_ids, teams, points, opps) = load_scores(
+            path, args.weeks, args.scores_cache
+        )
+    else:
+        (team_ids, teams, points, opps) = parse_scores(path, args.weeks)
+    if args.schedules is not None:
+        opps = read_schedules(args.schedules, len(team_ids), args.weeks)
+    elif opps.shape[0] < args.weeks or (opps < 0).any():
+        raise ValueError(
+            f'{path} does not have every game of the season; pass --schedules.'
+        )
+    else:
+        opps = np.asarray(opps)[None, :, :]
+
+    agg = simulate_playoff_odds(
+        team_ids,
+        teams,
+        points[:args.played],
+        opps,
+        args.sims,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        n_workers=args.n_workers
+    )
+    table = odds_table(agg, args.top)
+    print(table.to_string(index=False))
+    out = playoff_odds_path(
+        args.league_id, args.league_size, args.season, args.played,
+        args.sims, args.data_dir
+    )
+    table.to_csv(out, index=False)
+    print(f'Wrote {out}')
+
+
+if __name__ == '__main__':
+    main()
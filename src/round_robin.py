@@ -0,0 +1,136 @@
+'''Solver-free round robin schedules.
+
+`iter_schedules` walks the same solution space as `te_cli.model_games`
+(every assignment of a week to every pair such that each team plays once
+per week), but builds each week's matching directly by backtracking
+instead of going through CP-SAT.  Solutions come out as week vectors in
+`directed_pairs` order, i.e. the order of `te_cli.model_games`'s `games`
+dict, so they can be fed to the same sinks.
+
+'''
+import argparse
+import os
+from time import perf_counter
+
+from ortools.sat.python import cp_model
+
+
+def directed_pairs(n_t):
+    return [(t1, t2) for t1 in range(n_t) for t2 in range(n_t) if t1 != t2]
+
+
+def iter_schedules(n_t, normalized=False):
+    '''Yield every single round robin schedule for `n_t` teams.
+
+    With `normalized=True`, team 0 is forced to play team `wk` in week
+    `wk`, which yields each 1-factorization exactly once instead of once
+    per ordering of its weeks.
+    '''
+    if n_t % 2:
+        raise ValueError(
+            f'A single round robin in {n_t - 1} weeks needs an even number of teams.'
+        )
+    n_w = n_t - 1
+    pos = {p: i for (i, p) in enumerate(directed_pairs(n_t))}
+    wks = [0] * len(pos)
+    # bit mask of the opponents each team has already played
+    played = [0] * n_t
+    everyone = (1 << n_t) - 1
+
+    def fill_week(wk, free):
+        if not free:
+            if wk == n_w:
+                yield tuple(wks)
+            else:
+                yield from fill_week(wk + 1, everyone)
+            return
+        # the lowest free team has to play someone this week
+        t1 = (free & -free).bit_length() - 1
+        rest = free ^ (1 << t1)
+        options = rest & ~played[t1]
+        if normalized and t1 == 0:
+            options &= 1 << wk
+        while options:
+            bit = options & -options
+            options ^= bit
+            t2 = bit.bit_length() - 1
+            played[t1] |= bit
+            played[t2] |= 1 << t1
+            wks[pos[(t1, t2)]] = wk
+            wks[pos[(t2, t1)]] = wk
+            yield from fill_week(wk, rest ^ bit)
+            played[t1] ^= bit
+            played[t2] ^= 1 << t1
+
+    yield from fill_week(1, everyone)
+
+
+def time_direct(n_t, limit, sink):
+    start = perf_counter()
+    n_sol = 0
+    for wks in iter_schedules(n_t):
+        n_sol += 1
+        sink.write(n_sol, wks)
+        if n_sol >= limit:
+            break
+    return (n_sol, perf_counter() - start)
+
+
+def time_cpsat(n_t, limit, sink):
+    from te_cli import SolutionPrinter, model_games
+
+    start = perf_counter()
+    (model, games) = model_games(n_t=n_t, n_w=n_t - 1)
+    solver = cp_model.CpSolver()
+    printer = SolutionPrinter(
+        games=games, n_t=n_t, n_w=n_t - 1, sink=sink, n_show=0, limit=limit
+    )
+    solver.SearchForAllSolutions(model, printer)
+    return (printer.n_sol(), perf_counter() - start)
+
+
+def compare_engines(n_t, limit):
+    from schedule_sinks import CsvSink
+
+    res = {}
+    for (engine, fn) in [('direct', time_direct), ('cpsat', time_cpsat)]:
+        # write through a real sink so that both sides pay the same
+        # formatting cost
+        sink = CsvSink(os.devnull, directed_pairs(n_t))
+        try:
+            (n_sol, secs) = fn(n_t, limit, sink)
+        finally:
+            sink.close()
+        res[engine] = (n_sol, secs)
+        print(
+            f'{engine:>6}: {n_sol} solutions in {secs:.2f} s ({n_sol / secs:.0f} / s)'
+        )
+    return res
+
+
+def main():
+    '''Compare direct and CP-SAT enumeration throughput.'''
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare throughput of the direct and CP-SAT round robin engines.'
+    )
+    parser.add_argument(
+        '--teams',
+        type=int,
+        dest='n_t',
+        default=10,
+        help='Number of teams in the league'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        dest='limit',
+        default=100000,
+        help='Number of solutions to generate with each engine.'
+    )
+    args = parser.parse_args()
+    compare_engines(args.n_t, args.limit)
+
+
+if __name__ == '__main__':
+    main()
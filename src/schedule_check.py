@@ -0,0 +1,357 @@
+'''Vectorized validation of schedule files.
+
+Every check works on a batch of schedules as `S x W x T` arrays of
+0-based opponents (anything outside `0 .. T - 1` is a bye), plus, where
+the file records it, `S x W x T` home flags, and reports which of the
+`S` schedules fail.  The checks are
+
+* `once_per_week`: each team plays exactly one opponent a week (at most
+  one with byes allowed), and its opponent plays it back,
+* `pair_counts`: every pair of teams meets between `meetings[0]` and
+  `meetings[1]` times,
+* `pool_counts`: games between (and within) pools are within bounds,
+  taken by default from the `sports_schedule_sat` model,
+* `home_stand`: nobody is home, or away, more than `max_home_stand`
+  weeks in a row,
+* `breaks`: the number of back-to-back home or away games, over all
+  teams, is within bounds.
+
+The last three need home and away, so they only apply to
+`sports_schedule_sat` fixture stores.  `main` checks a whole file a batch
+at a time and exits non-zero if any schedule fails, so it can gate a
+simulation run.
+
+'''
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from schedule_store import ScheduleStore
+from standings import iter_schedule_batches
+
+
+def played_games(opps, byes=False):
+    '''Which entries of `opps` are proper games, and schedules that fail.
+
+    Returns `(games, failed)`: `games` marks every team-week whose opponent
+    is another team that has it as opponent in turn.
+    '''
+    n_teams = opps.shape[2]
+    team = np.arange(n_teams)
+    valid = (opps >= 0) & (opps < n_teams)
+    opp = np.where(valid, opps, 0)
+    # the opponent's opponent, gathered from the flattened batch
+    rows = np.arange(opps.shape[0] * opps.shape[1], dtype=np.intp)
+    back = opps.reshape(-1)[rows.reshape(opps.shape[:2] + (1, )) * n_teams +
+                            opp]
+    games = valid & (opp != team) & (back == team)
+    ok = games | ~valid if byes else games
+    return (games, ~ok.all(axis=(1, 2)))
+
+
+def pair_counts(opps, games):
+    '''Meetings of every pair (`S x P`), in `unordered_pairs` order.'''
+    (n_sims, _, n_teams) = opps.shape
+    team = np.arange(n_teams)
+    # count each game once, from the side of the lower team
+    once = games & (opps > team)
+    key = (np.arange(n_sims)[:, None, None] * n_teams + team) * n_teams + opps
+    counts = np.bincount(
+        key[once].astype(np.int64), minlength=n_sims * n_teams * n_teams
+    ).reshape(n_sims, n_teams, n_teams)
+    (t1, t2) = np.triu_indices(n_teams, 1)
+    return counts[:, t1, t2]
+
+
+def meeting_bounds(n_teams, n_weeks):
+    '''Fewest and most meetings of a pair when everybody plays every week.'''
+    n_games = n_weeks * (n_teams // 2)
+    n_pairs = n_teams * (n_teams - 1) // 2
+    return (n_games // n_pairs, -(-n_games // n_pairs))
+
+
+def pool_index(pools, n_teams):
+    pool = np.full(n_teams, -1, dtype=np.int64)
+    for (p, members) in enumerate(pools):
+        pool[list(members)] = p
+    return pool
+
+
+def fold(counts):
+    '''Home x away pool counts to unordered ones (upper triangle used).'''
+    return counts + counts.swapaxes(-1, -2) - (
+        counts * np.eye(counts.shape[-1], dtype=counts.dtype)
+    )
+
+
+def pool_counts(opps, games, pools, home=None):
+    '''Games by home pool and away pool (`S x P x P`).
+
+    Without `home`, games are counted from the side of the lower team, and
+    only `fold` of the result means anything.
+    '''
+    (n_sims, _, n_teams) = opps.shape
+    n_pools = len(pools)
+    pool = pool_index(pools, n_teams)
+    if home is None:
+        side = games & (opps > np.arange(n_teams))
+    else:
+        side = games & home
+    opp_pool = pool[np.where(games, opps, 0).astype(np.intp)]
+    key = (np.arange(n_sims)[:, None, None] * n_pools +
+           pool) * n_pools + opp_pool
+    return np.bincount(
+        key[side], minlength=n_sims * n_pools * n_pools
+    ).reshape(n_sims, n_pools, n_pools)
+
+
+def pool_bounds(pools, n_teams, n_weeks, n_matches=None):
+    '''Home pool x away pool game bounds of `sports_schedule_sat`.
+
+    Returns `(lo, hi)`, each `P x P`.
+    '''
+    from sports_schedule_sat import (
+        expected_pool_vs_pool_games, season_expected_games, season_matchups
+    )
+
+    if n_matches is None:
+        n_matches = n_teams // 2
+    (matchups, matchups_exact, unique_games, total_games) = season_matchups(
+        n_teams, n_weeks, n_matches
+    )
+    n_pools = len(pools)
+    lo = np.zeros((n_pools, n_pools), dtype=np.int64)
+    for (i, pooli) in enumerate(pools):
+        for (j, poolj) in enumerate(pools):
+            lo[i, j] = season_expected_games(
+                games_per_rr=expected_pool_vs_pool_games(pooli, poolj),
+                matchups_exact=matchups_exact,
+                matchups=matchups,
+                total_games=total_games,
+                unique_games=unique_games
+            )
+    # games within a pool may run one over, as in the model
+    return (lo, lo + np.eye(n_pools, dtype=np.int64))
+
+
+def home_stand_fails(home, max_home_stand):
+    '''Schedules with a run of more than `max_home_stand` home or away weeks.'''
+    k = max_home_stand + 1
+    if home.shape[1] < k:
+        return np.zeros(home.shape[0], dtype=bool)
+    runs = np.cumsum(home, axis=1, dtype=np.int16)
+    runs = np.concatenate(
+        [np.zeros_like(runs[:, :1]), runs], axis=1
+    )
+    # home games in every window of k weeks: all or none is too long
+    window = runs[:, k:] - runs[:, :-k]
+    return ((window == 0) | (window == k)).any(axis=(1, 2))
+
+
+def break_counts(home):
+    '''Back-to-back home or away games (`S`), over all teams.'''
+    return (home[:, 1:] == home[:, :-1]).sum(axis=(1, 2))
+
+
+def check_schedules(
+    opps,
+    home=None,
+    byes=False,
+    meetings=None,
+    pools=None,
+    pool_limits=None,
+    max_home_stand=None,
+    breaks=None
+):
+    '''Run every applicable check on a batch; returns `{check: failed}`.
+
+    `meetings`, `pool_limits` and `breaks` are `(lo, hi)` bounds; `None`
+    for a bound of `breaks` leaves that side open.  Checks that are not
+    asked for, or need `home` when there is none, are left out.
+    '''
+    opps = np.asarray(opps)
+    (games, failed) = played_games(opps, byes)
+    result = {'once_per_week': failed}
+    if meetings is not None:
+        counts = pair_counts(opps, games)
+        result['pair_counts'] = (
+            (counts < meetings[0]) | (counts > meetings[1])
+        ).any(axis=1)
+    if pools is not None:
+        counts = pool_counts(opps, games, pools, home)
+        (lo, hi) = pool_limits
+        if home is None:
+            (counts, lo, hi) = (fold(counts), fold(lo), fold(hi))
+            upper = np.triu(np.ones(lo.shape, dtype=bool))
+            (counts, lo, hi) = (counts[:, upper], lo[upper], hi[upper])
+        result['pool_counts'] = ((counts < lo) | (counts > hi)).reshape(
+            counts.shape[0], -1
+        ).any(axis=1)
+    if home is not None and max_home_stand is not None:
+        result['home_stand'] = home_stand_fails(home, max_home_stand)
+    if home is not None and breaks is not None:
+        n = break_counts(home)
+        failed = np.zeros(n.shape, dtype=bool)
+        if breaks[0] is not None:
+            failed |= n < breaks[0]
+        if breaks[1] is not None:
+            failed |= n > breaks[1]
+        result['breaks'] = failed
+    return result
+
+
+def iter_checked_batches(path, n_teams, n_weeks, batch_size=100000):
+    '''`(opponents, home)` batches of a schedule file.
+
+    `home` is `None` except for fixture stores, whose own number of weeks
+    is used.
+    '''
+    if path.endswith('.sched'):
+        store = ScheduleStore(path)
+        if store.layout == 'fixtures':
+            for start in range(0, len(store), batch_size):
+                idx = slice(start, start + batch_size)
+                yield (store.opponents(idx), store.at_home(idx))
+            return
+    for opps in iter_schedule_batches(path, n_teams, n_weeks, batch_size):
+        yield (opps, None)
+
+
+def validate_schedules(path, n_teams, n_weeks, batch_size=100000, **checks):
+    '''Check every schedule of a file, a batch at a time.
+
+    Returns `(n, failures)`: the number of schedules and, per check, the
+    0-based indices of the ones that failed it.  `checks` go to
+    `check_schedules`.
+    '''
+    failures = {}
+    n = 0
+    for (opps, home) in iter_checked_batches(
+        path, n_teams, n_weeks, batch_size
+    ):
+        for (check, failed) in check_schedules(opps, home, **checks).items():
+            failures.setdefault(check, []).append(np.flatnonzero(failed) + n)
+        n += opps.shape[0]
+    return (n, {k: np.concatenate(v) for (k, v) in failures.items()})
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description=
+        'Check every schedule in a file, and exit non-zero if any is broken.'
+    )
+    parser.add_argument(
+        '--schedules',
+        type=str,
+        required=True,
+        help=
+        'schedules-*.parquet, te_cli --format compact .npy or schedule store .sched file.'
+    )
+    parser.add_argument('--teams', type=int, dest='n_teams', default=10)
+    parser.add_argument(
+        '--weeks',
+        type=int,
+        dest='n_weeks',
+        default=None,
+        help=
+        'Weeks to check.  Default is the store\'s own, or one round robin.'
+    )
+    parser.add_argument(
+        '--byes',
+        default=False,
+        action='store_true',
+        help='Allow teams to sit out a week.'
+    )
+    parser.add_argument(
+        '--meetings',
+        type=int,
+        nargs=2,
+        default=None,
+        help=
+        'Fewest and most meetings per pair.  Default is as even as the season allows.'
+    )
+    parser.add_argument(
+        '--pools',
+        type=int,
+        dest='num_pools',
+        default=None,
+        help=
+        'Check pool vs pool games for this many pools, split as in sports_schedule_sat.  Default is no pool check.'
+    )
+    parser.add_argument(
+        '--matches_per_day',
+        type=int,
+        default=None,
+        help='For the pool bounds.  Default is teams divided by 2.'
+    )
+    parser.add_argument(
+        '--max_home_stand',
+        type=int,
+        default=None,
+        help='Longest allowed run of home or away games (fixture stores).'
+    )
+    parser.add_argument(
+        '--breaks',
+        type=int,
+        nargs=2,
+        default=None,
+        help=
+        'Fewest and most back-to-back home or away games per schedule (fixture stores); -1 for no limit.'
+    )
+    parser.add_argument('--batch_size', type=int, default=100000)
+    parser.add_argument(
+        '--out',
+        type=str,
+        default=None,
+        help='Write the failures (idx_sim, check) to this CSV.'
+    )
+    args = parser.parse_args()
+
+    (n_teams, n_weeks) = (args.n_teams, args.n_weeks)
+    if args.schedules.endswith('.sched'):
+        store = ScheduleStore(args.schedules)
+        n_teams = store.n_teams
+        if n_weeks is None:
+            n_weeks = store.n_weeks
+    if n_weeks is None:
+        n_weeks = n_teams - 1
+    checks = {'byes': args.byes}
+    checks['meetings'] = args.meetings
+    if args.meetings is None and not args.byes:
+        checks['meetings'] = meeting_bounds(n_teams, n_weeks)
+    if args.num_pools is not None:
+        from sports_schedule_sat import initialize_pools
+
+        checks['pools'] = initialize_pools(args.num_pools, n_teams)
+        checks['pool_limits'] = pool_bounds(
+            checks['pools'], n_teams, n_weeks, args.matches_per_day
+        )
+    checks['max_home_stand'] = args.max_home_stand
+    if args.breaks is not None:
+        checks['breaks'] = tuple(b if b >= 0 else None for b in args.breaks)
+
+    (n, failures) = validate_schedules(
+        args.schedules, n_teams, n_weeks, args.batch_size, **checks
+    )
+    for (check, idx) in failures.items():
+        print(
+            f'{check}: {len(idx)} of {n} schedules fail' +
+            (f', first {(idx[:5] + 1).tolist()}' if len(idx) else '')
+        )
+    if args.out is not None:
+        pd.DataFrame(
+            [
+                (i + 1, check) for (check, idx) in failures.items()
+                for i in idx
+            ],
+            columns=['idx_sim', 'check']
+        ).sort_values(['idx_sim', 'check']).to_csv(args.out, index=False)
+    if any(len(idx) for idx in failures.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
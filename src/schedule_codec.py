@@ -0,0 +1,60 @@
+'''Compact encoding of single round robin schedules.
+
+`te_cli` writes every game twice, once as `(tm1, tm2)` and once as
+`(tm2, tm1)`.  The compact form keeps one `uint8` week per unordered pair,
+in `unordered_pairs` order, so a batch of schedules is an `N x P` array
+with `P = n_t * (n_t - 1) / 2` (45 bytes per schedule for 10 teams).
+
+'''
+import numpy as np
+
+from round_robin import directed_pairs
+
+
+def unordered_pairs(n_t):
+    return [(t1, t2) for t1 in range(n_t) for t2 in range(t1 + 1, n_t)]
+
+
+def directed_index(n_t):
+    '''Position of each unordered pair in `directed_pairs` order.'''
+    pos = {p: i for (i, p) in enumerate(directed_pairs(n_t))}
+    return np.array([pos[p] for p in unordered_pairs(n_t)])
+
+
+def mirrored_index(n_t):
+    '''Position of each directed pair in `unordered_pairs` order.'''
+    pos = {p: i for (i, p) in enumerate(unordered_pairs(n_t))}
+    return np.array(
+        [pos[(min(t1, t2), max(t1, t2))] for (t1, t2) in directed_pairs(n_t)]
+    )
+
+
+def encode(wks, n_t):
+    '''Directed week vectors (`... x n_t * (n_t - 1)`) to compact codes.'''
+    wks = np.asarray(wks)
+    return wks[..., directed_index(n_t)].astype(np.uint8)
+
+
+def decode(codes, n_t):
+    '''Compact codes back to week vectors in `directed_pairs` order.'''
+    return np.asarray(codes)[..., mirrored_index(n_t)]
+
+
+def to_opponents(codes, n_t, n_weeks=None):
+    '''Compact codes (`N x P`) to 0-based opponents (`N x n_weeks x n_t`).
+
+    Weeks past the end of the round robin repeat it from the start.
+    '''
+    codes = np.asarray(codes).reshape(-1, n_t * (n_t - 1) // 2)
+    n_w = n_t - 1
+    if n_weeks is None:
+        n_weeks = n_w
+    pairs = np.array(unordered_pairs(n_t))
+    (t1, t2) = (pairs[:, 0], pairs[:, 1])
+    n = codes.shape[0]
+    rows = np.arange(n)[:, None]
+    wk = codes.astype(np.int64) - 1
+    opps = np.zeros((n, n_w, n_t), dtype=np.int16)
+    opps[rows, wk, t1] = t2
+    opps[rows, wk, t2] = t1
+    return opps[:, np.arange(n_weeks) % n_w, :]
@@ -0,0 +1,208 @@
+'''Exact schedule counts, without generating the schedules.
+
+A `te_cli` schedule for `n_t` teams and `n_w` weeks gives every pair of
+teams a week, and no team plays twice in the same week: it is a proper
+edge colouring of K_n with `n_w` labelled colours.  The number of
+colourings of a graph `G` with `c` colours is
+
+    h(G, c) = c * sum(h(G - M, c - 1) for M a matching of G containing e)
+
+for any fixed edge `e`: by symmetry between the colours, `e` takes colour
+1 in a `1 / c` share of the colourings, and colour 1 is then some matching
+through `e`.  Matchings have to cover every vertex of degree `c`, or the
+rest would not fit in `c - 1` colours.
+
+`h` only depends on `G` up to isomorphism, so it is memoized on a
+canonical form of the remaining graph (isolated vertices dropped), found
+by individualization and refinement with automorphism pruning.  That
+keeps the state space to a few hundred graphs at 10 teams; 12 teams is
+already a long run.
+
+'''
+import argparse
+import os
+
+from factorizations import catalogue_path, count_schedules, load_catalogue
+
+
+def popcount(x):
+    return bin(x).count('1')
+
+
+def complete_graph(n):
+    everyone = (1 << n) - 1
+    return tuple(everyone ^ (1 << v) for v in range(n))
+
+
+def refine(adj, cells):
+    '''Equitable refinement of an ordered partition of the vertices.'''
+    while True:
+        masks = [sum(1 << v for v in cell) for cell in cells]
+        new = []
+        for cell in cells:
+            if len(cell) == 1:
+                new.append(cell)
+                continue
+            sig = {
+                v: tuple(popcount(adj[v] & m) for m in masks)
+                for v in cell
+            }
+            for key in sorted(set(sig.values())):
+                new.append([v for v in cell if sig[v] == key])
+        if len(new) == len(cells):
+            return cells
+        cells = new
+
+
+def relabeled(adj, order):
+    pos = {v: i for (i, v) in enumerate(order)}
+    return tuple(
+        sum(1 << pos[u] for u in range(len(adj)) if adj[v] >> u & 1)
+        for v in order
+    )
+
+
+def orbit_roots(autos, path, n):
+    # orbits of the automorphisms found so far that fix `path` pointwise
+    root = list(range(n))
+
+    def find(v):
+        while root[v] != v:
+            root[v] = root[root[v]]
+            v = root[v]
+        return v
+
+    for g in autos:
+        if all(g[p] == p for p in path):
+            for v in range(n):
+                (a, b) = (find(v), find(g[v]))
+                if a != b:
+                    root[max(a, b)] = min(a, b)
+    return find
+
+
+def canonical_form(adj):
+    '''Adjacency bitmasks of `adj` relabeled to its canonical labelling.'''
+    n = len(adj)
+    degs = [popcount(a) for a in adj]
+    best = {}
+    autos = []
+
+    def search(cells, path):
+        cells = refine(adj, cells)
+        i = next((i for (i, c) in enumerate(cells) if len(c) > 1), None)
+        if i is None:
+            order = [c[0] for c in cells]
+            cert = relabeled(adj, order)
+            if not best or cert < best['cert']:
+                best.update(cert=cert, order=order)
+            elif cert == best['cert']:
+                g = [0] * n
+                for (u, v) in zip(best['order'], order):
+                    g[u] = v
+                autos.append(g)
+            return
+        seen = set()
+        for v in cells[i]:
+            find = orbit_roots(autos, path, n)
+            if find(v) in seen:
+                continue
+            seen.add(find(v))
+            rest = [u for u in cells[i] if u != v]
+            search(cells[:i] + [[v], rest] + cells[i + 1:], path + [v])
+
+    search([[v for v in range(n) if degs[v] == d] for d in sorted(set(degs))],
+           [])
+    return best['cert']
+
+
+def reduced(adj):
+    '''Canonical form of `adj` without its isolated vertices.'''
+    keep = [v for v in range(len(adj)) if adj[v]]
+    if not keep:
+        return ()
+    return canonical_form(relabeled(adj, keep))
+
+
+def matchings_through(adj, edge, forced):
+    '''Every matching of `adj` that contains `edge` and covers `forced`.'''
+    n = len(adj)
+    (a, b) = edge
+    free = ((1 << n) - 1) ^ (1 << a) ^ (1 << b)
+    chosen = [edge]
+
+    def extend(v, free):
+        while v < n and not free >> v & 1:
+            v += 1
+        if v == n:
+            yield list(chosen)
+            return
+        rest = free ^ (1 << v)
+        if not forced >> v & 1:
+            yield from extend(v + 1, rest)
+        options = adj[v] & rest
+        while options:
+            u = (options & -options).bit_length() - 1
+            options ^= 1 << u
+            chosen.append((v, u))
+            yield from extend(v + 1, rest ^ (1 << u))
+            chosen.pop()
+
+    return extend(0, free)
+
+
+def count_colourings(adj, c, memo=None):
+    '''Proper edge colourings of `adj` (a canonical form) with `c` colours.'''
+    if memo is None:
+        memo = {}
+    if not adj:
+        return 1
+    degs = [popcount(a) for a in adj]
+    if max(degs) > c or sum(degs) // 2 > c * (len(adj) // 2):
+        return 0
+    key = (adj, c)
+    if key not in memo:
+        forced = sum(1 << v for v in range(len(adj)) if degs[v] == c)
+        edge = (0, (adj[0] & -adj[0]).bit_length() - 1)
+        total = 0
+        for matching in matchings_through(adj, edge, forced):
+            rest = list(adj)
+            for (u, v) in matching:
+                rest[u] ^= 1 << v
+                rest[v] ^= 1 << u
+            total += count_colourings(reduced(rest), c - 1, memo)
+        memo[key] = c * total
+    return memo[key]
+
+
+def count_schedules_dp(n_t, n_w):
+    return count_colourings(reduced(complete_graph(n_t)), n_w)
+
+
+def count_te_schedules(n_t, n_w, cache_dir='data'):
+    '''Number of `te_cli` schedules, and how it was worked out.
+
+    A cached 1-factorization catalogue answers single round robins
+    directly; anything else goes through the dynamic program.
+    '''
+    if n_w == n_t - 1 and os.path.exists(catalogue_path(n_t, cache_dir)):
+        return (count_schedules(load_catalogue(n_t, cache_dir)), 'catalogue')
+    return (count_schedules_dp(n_t, n_w), 'dp')
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description='Count round robin schedules exactly.'
+    )
+    parser.add_argument('--teams', type=int, dest='n_t', default=8)
+    parser.add_argument('--weeks', type=int, dest='n_w', default=None)
+    parser.add_argument('--cache_dir', type=str, default='data')
+    args = parser.parse_args()
+    n_w = args.n_w if args.n_w is not None else args.n_t - 1
+    (n, how) = count_te_schedules(args.n_t, n_w, args.cache_dir)
+    print(f'{n} schedules for {args.n_t} teams over {n_w} weeks ({how})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+'''Warm starts for break minimization.
+
+The best schedule found for each league configuration (teams, days,
+matches per day, pools and maximum home stand) is kept as
+`hint-<config>.npz` in a hints directory: its fixture values (days x
+home x away), its number of breaks and the configuration itself.
+
+A new run takes the hint of the nearest compatible configuration: same
+teams and matches per day, and as few other differences as possible,
+the best objective breaking ties.  A hint for a different number of days
+is cut short, or repeated, to fit.  The hint is then repaired against
+the new model, by a short solve for the schedule closest to it (fewest
+fixtures changed), and that whole solution becomes the solution hint of
+the break minimization.  A hint that already fits comes back unchanged.
+
+'''
+import glob
+import json
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from model_cache import var_index
+
+CONFIG_KEYS = [
+    'num_teams', 'num_matchdays', 'num_matches_per_day', 'num_pools',
+    'max_home_stand'
+]
+
+
+def hint_path(config, hints_dir=os.path.join('data', 'hints')):
+    return os.path.join(
+        hints_dir,
+        'hint-' + '-'.join(f'{k}={config[k]}' for k in CONFIG_KEYS) + '.npz'
+    )
+
+
+def load_hint(path):
+    with np.load(path) as f:
+        return (
+            json.loads(str(f['config'])), int(f['objective']), f['fixtures']
+        )
+
+
+def save_hint(hints_dir, config, fixtures, objective):
+    '''Keep `fixtures` for `config` unless a hint at least as good is there.
+
+    Returns whether the hint was written.
+    '''
+    path = hint_path(config, hints_dir)
+    if os.path.exists(path) and load_hint(path)[1] <= objective:
+        return False
+    os.makedirs(hints_dir, exist_ok=True)
+    # write a temporary file of our own, then rename, so a crash never
+    # leaves a half-written hint and parallel runs sharing the hints
+    # directory never write into each other's
+    with tempfile.NamedTemporaryFile(
+        dir=hints_dir, suffix='.tmp', delete=False
+    ) as f:
+        np.savez(
+            f,
+            config=json.dumps({k: config[k] for k in CONFIG_KEYS}),
+            objective=objective,
+            fixtures=np.asarray(fixtures, dtype=np.uint8)
+        )
+    os.replace(f.name, path)
+    return True
+
+
+def hint_distance(old, new):
+    '''How far apart two configurations are, or `None` if incompatible.'''
+    if any(
+        old[k] != new[k] for k in ['num_teams', 'num_matches_per_day']
+    ):
+        return None
+    return (
+        sum(old[k] != new[k] for k in CONFIG_KEYS),
+        abs(old['num_matchdays'] - new['num_matchdays']),
+        abs(old['max_home_stand'] - new['max_home_stand']),
+    )
+
+
+def nearest_hint(hints_dir, config):
+    '''`(config, objective, fixtures)` of the nearest hint, or `None`.'''
+    best = None
+    for path in glob.glob(os.path.join(hints_dir, 'hint-*.npz')):
+        hint = load_hint(path)
+        distance = hint_distance(hint[0], config)
+        if distance is None:
+            continue
+        key = distance + (hint[1], )
+        if best is None or key < best[0]:
+            best = (key, hint)
+    return None if best is None else best[1]
+
+
+def fit_hint(fixtures, num_matchdays):
+    '''Fixture values for `num_matchdays` days, repeating the old days.'''
+    fixtures = np.asarray(fixtures)
+    return fixtures[np.arange(num_matchdays) % fixtures.shape[0]]
+
+
+def repair_hint(model, fixtures, values, time_limit=None, num_cpus=None):
+    '''The solution of `model` with the fewest fixtures changed from
+    `values`, as values of every model variable, or `None`.'''
+    repair = model.Clone()
+    index = var_index(fixtures).ravel().tolist()
+    values = np.asarray(values).ravel().astype(np.int64)
+    variables = [repair.GetBoolVarFromProtoIndex(i) for i in index]
+    # a fixture hinted 0 costs x, one hinted 1 costs 1 - x
+    repair.Minimize(
+        cp_model.LinearExpr.WeightedSum(variables, (1 - 2 * values).tolist())
+        + int(values.sum())
+    )
+    repair.ClearHints()
+    for (v, x) in zip(variables, values.tolist()):
+        repair.AddHint(v, x)
+    solver = cp_model.CpSolver()
+    # or presolve's symmetry breaking may cut the hint itself off
+    solver.parameters.keep_all_feasible_solutions_in_presolve = True
+    if time_limit is not None:
+        solver.parameters.max_time_in_seconds = time_limit
+    if num_cpus is not None:
+        solver.parameters.num_search_workers = num_cpus
+    status = solver.Solve(repair)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None
+    print('Repaired hint: %i fixtures changed' % solver.ObjectiveValue())
+    return list(solver.ResponseProto().solution)
+
+
+def warm_start(
+    model, fixtures, hints_dir, config, time_limit=None, num_cpus=None
+):
+    '''Hint `model` from the nearest stored hint; returns seconds spent.'''
+    start = perf_counter()
+    hint = nearest_hint(hints_dir, config)
+    if hint is None:
+        print('No compatible hint in %s' % hints_dir)
+        return 0
+    (old, objective, values) = hint
+    print('Hint from %s, with %i breaks' % (old, objective))
+    values = fit_hint(values, config['num_matchdays'])
+    solution = repair_hint(model, fixtures, values, time_limit, num_cpus)
+    model.ClearHints()
+    if solution is None:
+        # could not repair it in time: hint the fixtures as they are
+        for (v, x) in zip(
+            var_index(fixtures).ravel().tolist(),
+            values.ravel().tolist()
+        ):
+            model.AddHint(model.GetBoolVarFromProtoIndex(v), x)
+    else:
+        hints = model.Proto().solution_hint
+        hints.vars.extend(range(len(solution)))
+        hints.values.extend(solution)
+    return perf_counter() - start
@@ -0,0 +1,261 @@
+'''Draw unique random schedules without enumerating them.
+
+Two ways to draw a schedule:
+
+* `catalogue`: pick an isomorphism class of 1-factorizations with
+  probability proportional to the number of schedules it accounts for,
+  then a uniformly random team relabeling and week order.  The group acts
+  transitively on each class, so this is exactly uniform over all
+  schedules.  Needs a `factorizations` catalogue (built on the fly up to
+  8 teams).
+* `construct`: build a pool of random 1-factorizations by randomized
+  backtracking and push them through random relabelings and week orders.
+  Fast for any league size, but not exactly uniform.
+
+Schedules are de-duplicated on a 64-bit hash of the season's opponent
+table (so longer seasons that repeat the round robin are compared on what
+the standings simulation actually sees).
+
+'''
+import argparse
+import os
+
+import numpy as np
+
+from factorizations import (
+    BUILD_LIMIT, catalogue_path, class_size, load_catalogue
+)
+
+
+def factors_to_opponents(n_t, factors):
+    opps = np.zeros((n_t - 1, n_t), dtype=np.int16)
+    for (wk, f) in enumerate(factors):
+        for (t1, t2) in f:
+            opps[wk, t1] = t2
+            opps[wk, t2] = t1
+    return opps
+
+
+def random_factorization(n_t, rng):
+    '''One random 1-factorization as a `(n_t - 1) x n_t` opponent table.'''
+    n_w = n_t - 1
+    opps = np.zeros((n_w, n_t), dtype=np.int16)
+    played = [0] * n_t
+    everyone = (1 << n_t) - 1
+
+    def fill_week(wk, free):
+        if not free:
+            return wk == n_w - 1 or fill_week(wk + 1, everyone)
+        t1 = (free & -free).bit_length() - 1
+        rest = free ^ (1 << t1)
+        options = [
+            t2 for t2 in range(n_t) if (rest & ~played[t1]) >> t2 & 1
+        ]
+        for t2 in rng.permutation(options):
+            t2 = int(t2)
+            played[t1] |= 1 << t2
+            played[t2] |= 1 << t1
+            opps[wk, t1] = t2
+            opps[wk, t2] = t1
+            if fill_week(wk, rest ^ (1 << t2)):
+                return True
+            played[t1] ^= 1 << t2
+            played[t2] ^= 1 << t1
+        return False
+
+    fill_week(0, everyone)
+    return opps
+
+
+def random_permutations(rng, k, n):
+    return np.argsort(rng.random((k, n)), axis=1)
+
+
+def relabel_batch(base, which, rng):
+    '''Random team relabeling and week order of `base[which]`.'''
+    k = len(which)
+    (n_w, n_t) = base.shape[1:]
+    teams = random_permutations(rng, k, n_t)
+    weeks = random_permutations(rng, k, n_w)
+    opps = base[which].reshape(k, -1).astype(np.int64)
+    relabeled = np.take_along_axis(teams, opps, axis=1).reshape(k, n_w, n_t)
+    out = np.empty_like(relabeled)
+    out[np.arange(k)[:, None, None], weeks[:, :, None],
+        teams[:, None, :]] = relabeled
+    return out.astype(np.int16)
+
+
+def schedule_hashes(opps, multipliers):
+    '''64-bit hashes of each schedule's flattened opponent table.'''
+    flat = opps.reshape(opps.shape[0], -1).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (flat * multipliers[None, :]).sum(axis=1, dtype=np.uint64)
+
+
+def catalogue_base(n_t, cache_dir='data'):
+    catalogue = load_catalogue(n_t, cache_dir, build=n_t <= BUILD_LIMIT)
+    base = np.stack(
+        [
+            factors_to_opponents(n_t, cls['factors'])
+            for cls in catalogue['classes']
+        ]
+    )
+    sizes = np.array(
+        [class_size(n_t, cls) for cls in catalogue['classes']], dtype=float
+    )
+    return (base, sizes / sizes.sum())
+
+
+def construct_base(n_t, rng, pool_size=256):
+    base = np.stack([random_factorization(n_t, rng) for _ in range(pool_size)])
+    return (base, np.full(pool_size, 1 / pool_size))
+
+
+def default_method(n_t, cache_dir='data'):
+    if n_t <= BUILD_LIMIT or os.path.exists(catalogue_path(n_t, cache_dir)):
+        return 'catalogue'
+    return 'construct'
+
+
+def sample_schedules(
+    n_teams,
+    n_weeks,
+    k,
+    seed=None,
+    method=None,
+    batch_size=100000,
+    max_draws=None,
+    cache_dir='data'
+):
+    '''Draw `k` unique schedules.
+
+    Returns `(opps, stats)`: 0-based opponents as a `k x n_weeks x n_teams`
+    array, and a dict with the number of draws, the acceptance rate and
+    whether the draws were exactly uniform.  Fewer than `k` schedules come
+    back if `max_draws` (default `100 * k`) runs out first.
+    '''
+    if n_teams % 2:
+        raise ValueError('Schedules need an even number of teams.')
+    rng = np.random.default_rng(seed)
+    if method is None:
+        method = default_method(n_teams, cache_dir)
+    if method == 'catalogue':
+        (base, probs) = catalogue_base(n_teams, cache_dir)
+    elif method == 'construct':
+        (base, probs) = construct_base(n_teams, rng)
+    else:
+        raise ValueError(f'Unknown sampling method {method}.')
+    if max_draws is None:
+        max_draws = 100 * k
+
+    n_w = n_teams - 1
+    season = np.arange(n_weeks) % n_w
+    multipliers = rng.integers(
+        0, 2**63, size=n_weeks * n_teams, dtype=np.uint64
+    ) * np.uint64(2) + np.uint64(1)
+    seen = np.zeros(0, dtype=np.uint64)
+    batches = []
+    n_accepted = 0
+    n_drawn = 0
+    while n_accepted < k and n_drawn < max_draws:
+        # size the next batch from the acceptance rate seen so far
+        rate = n_accepted / n_drawn if n_drawn else 1.0
+        n = min(
+            batch_size, max_draws - n_drawn,
+            int((k - n_accepted) / max(rate, 0.01)) + 64
+        )
+        which = rng.choice(len(base), size=n, p=probs)
+        opps = relabel_batch(base, which, rng)[:, season, :]
+        n_drawn += n
+        hashes = schedule_hashes(opps, multipliers)
+        (hashes, first) = np.unique(hashes, return_index=True)
+        fresh = ~np.isin(hashes, seen, assume_unique=True)
+        keep = np.sort(first[fresh])[:k - n_accepted]
+        seen = np.union1d(seen, hashes[fresh])
+        batches.append(opps[keep])
+        n_accepted += len(keep)
+
+    stats = {
+        'method': method,
+        'uniform': method == 'catalogue',
+        'drawn': n_drawn,
+        'accepted': n_accepted,
+        'acceptance_rate': n_accepted / max(n_drawn, 1),
+    }
+    print(
+        'Sampled %i unique schedules from %i draws (acceptance rate %.4f, %s)'
+        % (n_accepted, n_drawn, stats['acceptance_rate'], method)
+    )
+    return (np.concatenate(batches), stats)
+
+
+def write_schedules_parquet(path, opps):
+    '''Write opponents in the `schedules-...parquet` layout.'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    (n_sims, n_weeks, n_teams) = opps.shape
+    table = pa.Table.from_arrays(
+        [
+            pa.array(
+                np.repeat(np.arange(1, n_sims + 1), n_weeks * n_teams),
+                pa.int32()
+            ),
+            pa.array(
+                np.tile(np.repeat(np.arange(1, n_weeks + 1), n_teams), n_sims),
+                pa.float64()
+            ),
+            pa.array(
+                np.tile(np.arange(1, n_teams + 1), n_weeks * n_sims),
+                pa.int32()
+            ),
+            pa.array(opps.reshape(-1).astype(np.int32) + 1, pa.int32()),
+        ],
+        names=['idx_sim', 'week', 'team_id', 'opponent_id']
+    )
+    pq.write_table(table, path)
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description='Sample unique random round robin schedules.'
+    )
+    parser.add_argument('--teams', type=int, dest='n_teams', default=10)
+    parser.add_argument('--weeks', type=int, dest='n_weeks', default=12)
+    parser.add_argument(
+        '--sims',
+        type=int,
+        dest='k',
+        default=10000,
+        help='Number of unique schedules to draw.'
+    )
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument(
+        '--method',
+        type=str,
+        choices=['catalogue', 'construct'],
+        default=None,
+        help=
+        'catalogue is exactly uniform, construct works for any league size. Default is catalogue when one is available.'
+    )
+    parser.add_argument('--data_dir', type=str, default='data')
+    args = parser.parse_args()
+    (opps, stats) = sample_schedules(
+        args.n_teams,
+        args.n_weeks,
+        args.k,
+        seed=args.seed,
+        method=args.method,
+        cache_dir=args.data_dir
+    )
+    path = os.path.join(
+        args.data_dir,
+        f'schedules-league_size={args.n_teams}-weeks={args.n_weeks}-sims={opps.shape[0]}.parquet'
+    )
+    write_schedules_parquet(path, opps)
+    print(f'Wrote {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+'''Output sinks for enumerated schedules.
+
+A sink receives one solution at a time through `write(idx, wks)`, where
+`wks` holds the week assigned to each `(tm1, tm2)` pair, in the same
+order as `pairs`, or a whole `N x len(pairs)` batch of them through
+`write_batch(first_idx, batch)`.  Sinks own their file handle and must be
+closed once the search is over.
+
+Sinks that can be resumed (`CsvSink`, `StoreSink`) also report a flushed
+byte `offset()`, and take that offset back to truncate the file there and
+carry on appending.
+
+`ThreadedSink` wraps any of them so that the actual writing happens on a
+background thread, off the solver's callback thread.  `FirstKSink` and
+`ReservoirSink` pass on only the first `k` solutions or a uniformly
+random `k` of them, and `NullSink` just counts.
+
+'''
+import csv
+import queue
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from schedule_codec import directed_index, encode
+from schedule_store import StoreWriter, fixtures_rows
+
+
+class CsvSink:
+    def __init__(self, path, pairs, offset=None):
+        self._pairs = list(pairs)
+        if offset is None:
+            self._file = open(path, 'w', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['idx', 'tm1', 'tm2', 'wk'])
+        else:
+            self._file = open(path, 'r+', newline='')
+            self._file.truncate(offset)
+            self._file.seek(offset)
+            self._writer = csv.writer(self._file)
+
+    def write(self, idx, wks):
+        self._writer.writerows(
+            (idx, t1, t2, wk) for (t1, t2), wk in zip(self._pairs, wks)
+        )
+
+    def write_batch(self, first_idx, batch):
+        batch = np.asarray(batch)
+        (n, n_pairs) = batch.shape
+        (t1, t2) = np.array(self._pairs, dtype=np.int64).reshape(-1, 2).T
+        self._writer.writerows(
+            zip(
+                np.repeat(np.arange(first_idx, first_idx + n),
+                          n_pairs).tolist(),
+                np.tile(t1, n).tolist(),
+                np.tile(t2, n).tolist(),
+                batch.reshape(-1).tolist()
+            )
+        )
+
+    def offset(self):
+        self._file.flush()
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    '''Columnar sink laid out like `data/schedules-league_size=...parquet`.
+
+    Each solution becomes `n_weeks * n_t` rows of
+    `(idx_sim, week, team_id, opponent_id)`, with 1-based team ids.  If
+    `n_weeks` is longer than the round robin, the round robin weeks are
+    repeated.  Solutions are buffered and written `batch_size` at a time,
+    one Parquet row group per batch.
+    '''
+    def __init__(self, path, pairs, n_t, n_w, n_weeks=None, batch_size=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        if n_weeks is None:
+            n_weeks = n_w
+        pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+        self._t1 = pairs[:, 0]
+        self._t2 = pairs[:, 1]
+        self._n_t = n_t
+        self._n_w = n_w
+        self._n_weeks = n_weeks
+        self._batch_size = batch_size
+        # week of the season -> week of the round robin
+        self._wk_rr = np.arange(n_weeks) % n_w
+
+        self._idx = np.zeros(batch_size, dtype=np.int32)
+        self._opps = np.zeros((batch_size, n_w, n_t), dtype=np.int32)
+        self._n_buf = 0
+
+        self._schema = pa.schema(
+            [
+                ('idx_sim', pa.int32()),
+                ('week', pa.float64()),
+                ('team_id', pa.int32()),
+                ('opponent_id', pa.int32()),
+            ]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, idx, wks):
+        wks = np.asarray(wks, dtype=np.int64) - 1
+        self._idx[self._n_buf] = idx
+        self._opps[self._n_buf, wks, self._t1] = self._t2 + 1
+        self._n_buf += 1
+        if self._n_buf == self._batch_size:
+            self.flush()
+
+    def write_batch(self, first_idx, batch):
+        batch = np.asarray(batch, dtype=np.int64) - 1
+        done = 0
+        while done < batch.shape[0]:
+            n = min(batch.shape[0] - done, self._batch_size - self._n_buf)
+            rows = np.arange(self._n_buf, self._n_buf + n)
+            self._idx[rows] = first_idx + done + np.arange(n)
+            self._opps[rows[:, None], batch[done:done + n],
+                       self._t1[None, :]] = self._t2 + 1
+            self._n_buf += n
+            done += n
+            if self._n_buf == self._batch_size:
+                self.flush()
+
+    def flush(self):
+        n = self._n_buf
+        if n == 0:
+            return
+        n_rows_sol = self._n_weeks * self._n_t
+        opps = self._opps[:n][:, self._wk_rr, :]
+        table = self._pa.Table.from_arrays(
+            [
+                np.repeat(self._idx[:n], n_rows_sol),
+                np.tile(
+                    np.repeat(
+                        np.arange(1, self._n_weeks + 1, dtype=np.float64),
+                        self._n_t
+                    ), n
+                ),
+                np.tile(np.arange(1, self._n_t + 1, dtype=np.int32),
+                        self._n_weeks * n),
+                opps.reshape(-1),
+            ],
+            schema=self._schema
+        )
+        self._writer.write_table(table)
+        self._n_buf = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+class CompactSink:
+    '''Sink for `schedule_codec`'s `N x P` uint8 encoding, saved as `.npy`.
+
+    The mirrored `(tm2, tm1)` half of each solution is dropped.  Batches
+    are kept in memory (P bytes per solution) and saved on close.
+    '''
+    def __init__(self, path, pairs, n_t, batch_size=10000):
+        self._path = path
+        self._n_t = n_t
+        self._n_pairs = len(list(pairs))
+        self._batch_size = batch_size
+        self._rows = []
+        self._batches = []
+
+    def write(self, idx, wks):
+        self._rows.append(wks)
+        if len(self._rows) == self._batch_size:
+            self.flush()
+
+    def write_batch(self, first_idx, batch):
+        self.flush()
+        self._batches.append(encode(batch, self._n_t))
+
+    def flush(self):
+        if self._rows:
+            self._batches.append(encode(self._rows, self._n_t))
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        codes = np.concatenate(
+            self._batches or
+            [np.zeros((0, self._n_pairs // 2), dtype=np.uint8)]
+        )
+        with open(self._path, 'wb') as f:
+            np.save(f, codes)
+
+
+class StoreSink:
+    '''Sink for a memory-mappable `schedule_store` file (`pairs` layout).'''
+    def __init__(self, path, pairs, n_t, n_w, batch_size=10000, offset=None):
+        self._directed = directed_index(n_t)
+        self._writer = StoreWriter(
+            path,
+            n_t,
+            n_w,
+            layout='pairs',
+            batch_size=batch_size,
+            offset=offset
+        )
+
+    def write(self, idx, wks):
+        self._writer.write([wks[i] for i in self._directed])
+
+    def write_batch(self, first_idx, batch):
+        self._writer.write_batch(np.asarray(batch)[:, self._directed])
+
+    def offset(self):
+        return self._writer.offset()
+
+    def close(self):
+        self._writer.close()
+
+
+class FixturesStoreSink:
+    '''Sink for a `schedule_store` file in the `fixtures` layout.
+
+    Solutions are the flattened `days x home x away` fixture values, as
+    recorded by `sports_schedule_sat`.
+    '''
+    def __init__(self, path, num_teams, num_matchdays, batch_size=10000):
+        self._shape = (num_matchdays, num_teams, num_teams)
+        self._num_teams = num_teams
+        self._writer = StoreWriter(
+            path,
+            num_teams,
+            num_matchdays,
+            layout='fixtures',
+            batch_size=batch_size
+        )
+
+    def write(self, idx, values):
+        self.write_batch(idx, np.asarray(values).reshape((1, ) + self._shape))
+
+    def write_batch(self, first_idx, batch):
+        batch = np.asarray(batch).reshape((-1, ) + self._shape)
+        self._writer.write_batch(fixtures_rows(batch, self._num_teams))
+
+    def offset(self):
+        return self._writer.offset()
+
+    def close(self):
+        self._writer.close()
+
+
+class ThreadedSink:
+    '''Hand solutions to `sink` on a background writer thread.
+
+    Single solutions are gathered into batches of `batch_size`, and
+    batches go through a queue of at most `max_batches`, so a search that
+    outruns the disk blocks on `write` instead of piling up memory.  An
+    error on the writer thread is raised on the next `write` or on
+    `close`.  `close` (and `offset`) wait for everything queued so far to
+    be written.
+    '''
+    def __init__(self, sink, max_batches=8, batch_size=1000):
+        self._sink = sink
+        self._batch_size = batch_size
+        self._rows = []
+        self._first_idx = None
+        self._error = None
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._sink.write_batch(*item)
+            except Exception as e:
+                # keep draining so that writers never block on a full queue
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, idx, values):
+        if not self._rows:
+            self._first_idx = idx
+        self._rows.append(values)
+        if len(self._rows) == self._batch_size:
+            self.flush()
+
+    def write_batch(self, first_idx, batch):
+        self.flush()
+        self._check()
+        # callers may reuse their buffer once this returns
+        self._queue.put((first_idx, np.array(batch)))
+
+    def flush(self):
+        if self._rows:
+            (rows, self._rows) = (self._rows, [])
+            self._check()
+            self._queue.put((self._first_idx, np.array(rows)))
+
+    def offset(self):
+        self.flush()
+        self._queue.join()
+        self._check()
+        return self._sink.offset()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            self._sink.close()
+        self._check()
+
+
+class NullSink:
+    '''Count solutions and how fast they come, and write nothing.
+
+    With `echo`, closing prints the statistics.
+    '''
+    def __init__(self, echo=False):
+        self.n_sol = 0
+        self._start = perf_counter()
+        self._seconds = None
+        self._echo = echo
+
+    def write(self, idx, values):
+        self.n_sol += 1
+
+    def write_batch(self, first_idx, batch):
+        self.n_sol += len(batch)
+
+    def stats(self):
+        secs = self._seconds
+        if secs is None:
+            secs = perf_counter() - self._start
+        return {
+            'solutions': self.n_sol,
+            'seconds': secs,
+            'solutions_per_second': self.n_sol / secs if secs else None,
+        }
+
+    def close(self):
+        if self._seconds is not None:
+            return
+        self._seconds = perf_counter() - self._start
+        if self._echo:
+            stats = self.stats()
+            print(
+                'Counted %i solutions in %.2f s (%s solutions/s)' % (
+                    stats['solutions'], stats['seconds'],
+                    '-' if stats['solutions_per_second'] is None else
+                    '%.1f' % stats['solutions_per_second']
+                )
+            )
+
+
+class FirstKSink:
+    '''Pass the first `k` solutions on to `sink` and drop the rest.'''
+    def __init__(self, sink, k):
+        self._sink = sink
+        self._k = k
+        self._n_sol = 0
+
+    def write(self, idx, values):
+        self._n_sol += 1
+        if self._n_sol <= self._k:
+            self._sink.write(idx, values)
+
+    def write_batch(self, first_idx, batch):
+        n = max(min(len(batch), self._k - self._n_sol), 0)
+        self._n_sol += len(batch)
+        if n:
+            self._sink.write_batch(first_idx, batch[:n])
+
+    def offset(self):
+        return self._sink.offset()
+
+    def close(self):
+        self._sink.close()
+
+
+class ReservoirSink:
+    '''Pass a uniformly random `k` of all solutions on to `sink`.
+
+    Reservoir sampling (algorithm R): solution `i` replaces a random
+    slot with probability `k / i`, so memory stays at `k` solutions.  The
+    sample goes to `sink` on close, in enumeration order and with the
+    solutions' original indices.
+    '''
+    def __init__(self, sink, k, seed=None):
+        self._sink = sink
+        self._k = k
+        self._rng = np.random.default_rng(seed)
+        self._idx = np.zeros(k, dtype=np.int64)
+        self._rows = None
+        self._n_sol = 0
+
+    def write(self, idx, values):
+        self.write_batch(idx, np.asarray(values).reshape(1, -1))
+
+    def write_batch(self, first_idx, batch):
+        # a collector can flush an empty tail, which has no row width
+        if len(batch) == 0:
+            return
+        batch = np.asarray(batch).reshape(len(batch), -1)
+        if self._rows is None:
+            self._rows = np.zeros((self._k, batch.shape[1]), dtype=batch.dtype)
+        n = len(batch)
+        # the first k solutions fill the reservoir
+        n_fill = max(min(n, self._k - self._n_sol), 0)
+        slots = np.arange(self._n_sol, self._n_sol + n_fill)
+        self._rows[slots] = batch[:n_fill]
+        self._idx[slots] = first_idx + np.arange(n_fill)
+        # solution i (1-based) then lands in slot floor(u * i) if that is < k
+        seen = self._n_sol + np.arange(n_fill + 1, n + 1)
+        slot = (self._rng.random(n - n_fill) * seen).astype(np.int64)
+        take = np.flatnonzero(slot < self._k)
+        # a later solution overwrites an earlier one in the same slot
+        (slots, last) = np.unique(slot[take][::-1], return_index=True)
+        take = take[::-1][last]
+        self._rows[slots] = batch[n_fill + take]
+        self._idx[slots] = first_idx + n_fill + take
+        self._n_sol += n
+
+    def close(self):
+        try:
+            n = min(self._n_sol, self._k)
+            for i in np.argsort(self._idx[:n], kind='stable'):
+                self._sink.write(int(self._idx[i]), self._rows[i])
+        finally:
+            self._sink.close()
+
+
+def sample_sink(sink, sample=None, k=100, seed=None):
+    '''Wrap `sink` for a `sample` of `all` (or `None`), `first` or `reservoir`.'''
+    if sample in (None, 'all'):
+        return sink
+    if sample == 'first':
+        return FirstKSink(sink, k)
+    if sample == 'reservoir':
+        return ReservoirSink(sink, k, seed=seed)
+    raise ValueError(f'Unknown sample {sample}.')
@@ -0,0 +1,208 @@
+'''Fixed-width, memory-mappable schedule store.
+
+A store file is a header followed by `count` rows of `width` uint8
+values, one row per schedule.  The header is the magic bytes, the header
+size as a little-endian uint64 (a multiple of `HEADER_BLOCK`) and a JSON
+object, padded with spaces:
+
+* `n_teams`, `n_weeks`, `count`, `width`
+* `layout`: how a row is laid out
+
+  - `pairs`: one week (1-based) per unordered pair, in the order given by
+    the header's `pairs` (see `schedule_codec`); written by `te_cli`.
+  - `fixtures`: `n_weeks x n_teams` opponents (0-based), with
+    `HOME_BIT` set when the team is at home and `BYE` when it does not
+    play; written by `sports_schedule_sat`.
+
+Readers memory-map the rows, so schedule `k` or any batch of indices is
+read without loading the rest of the file.  Writers rewrite the header
+`count` on every flush, so a store is always readable up to the last
+flushed row.
+
+'''
+import json
+
+import numpy as np
+
+from schedule_codec import to_opponents, unordered_pairs
+
+MAGIC = b'FFSCHED1'
+HEADER_BLOCK = 4096
+HOME_BIT = 0x80
+OPPONENT_BITS = 0x7F
+BYE = OPPONENT_BITS
+
+
+def pack_header(meta, size=None):
+    body = json.dumps(meta).encode('utf-8')
+    if size is None:
+        # leave room for `count` to grow without moving the rows
+        needed = len(MAGIC) + 8 + len(body) + 20
+        size = -(-needed // HEADER_BLOCK) * HEADER_BLOCK
+    header = MAGIC + size.to_bytes(8, 'little') + body
+    if len(header) > size:
+        raise ValueError('Store header does not fit in %i bytes.' % size)
+    return header.ljust(size, b' ')
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a schedule store.')
+        size = int.from_bytes(f.read(8), 'little')
+        body = f.read(size - len(MAGIC) - 8)
+    return (size, json.loads(body.decode('utf-8')))
+
+
+class StoreWriter:
+    '''Append rows to a new store, or to an existing one from `offset`.
+
+    `offset` is a byte position previously returned by `offset()`; the
+    file is truncated there and writing carries on after it.
+    '''
+    def __init__(
+        self,
+        path,
+        n_teams,
+        n_weeks,
+        layout='pairs',
+        batch_size=10000,
+        offset=None
+    ):
+        if layout == 'pairs':
+            pairs = unordered_pairs(n_teams)
+            width = len(pairs)
+        elif layout == 'fixtures':
+            pairs = None
+            width = n_weeks * n_teams
+        else:
+            raise ValueError(f'Unknown store layout {layout}.')
+        self._meta = {
+            'n_teams': n_teams,
+            'n_weeks': n_weeks,
+            'count': 0,
+            'width': width,
+            'layout': layout,
+            'pairs': pairs,
+        }
+        self._batch_size = batch_size
+        self._rows = []
+        if offset is None:
+            self._header = pack_header(self._meta)
+            self._file = open(path, 'wb')
+            self._file.write(self._header)
+            return
+
+        (header_size, meta) = read_header(path)
+        if any(
+            meta[k] != self._meta[k] for k in ['n_teams', 'n_weeks', 'layout']
+        ):
+            raise ValueError(
+                f'{path} does not hold {layout} schedules for this league.'
+            )
+        self._meta['count'] = (offset - header_size) // width
+        self._header = b' ' * header_size
+        self._file = open(path, 'r+b')
+        self._file.truncate(offset)
+        self._file.seek(0)
+        self._file.write(pack_header(self._meta, header_size))
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) == self._batch_size:
+            self.flush()
+
+    def write_batch(self, rows):
+        self.flush()
+        self._append(np.asarray(rows, dtype=np.uint8))
+
+    def _append(self, rows):
+        rows = rows.reshape(-1, self._meta['width'])
+        self._file.seek(0, 2)
+        rows.tofile(self._file)
+        self._meta['count'] += rows.shape[0]
+        self._file.seek(0)
+        self._file.write(pack_header(self._meta, len(self._header)))
+        self._file.flush()
+
+    def flush(self):
+        if self._rows:
+            self._append(np.asarray(self._rows, dtype=np.uint8))
+            self._rows = []
+
+    def count(self):
+        return self._meta['count'] + len(self._rows)
+
+    def offset(self):
+        '''Flush and return the byte offset just past the last row.'''
+        self.flush()
+        return len(self._header) + self._meta['count'] * self._meta['width']
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class ScheduleStore:
+    def __init__(self, path):
+        (header_size, self.meta) = read_header(path)
+        self.n_teams = self.meta['n_teams']
+        self.n_weeks = self.meta['n_weeks']
+        self.layout = self.meta['layout']
+        count = self.meta['count']
+        if count:
+            self.rows = np.memmap(
+                path,
+                dtype=np.uint8,
+                mode='r',
+                offset=header_size,
+                shape=(count, self.meta['width'])
+            )
+        else:
+            self.rows = np.zeros((0, self.meta['width']), dtype=np.uint8)
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+    def __getitem__(self, idx):
+        return self.rows[idx]
+
+    def sample(self, k, seed=None):
+        rng = np.random.default_rng(seed)
+        # sorted indices keep the reads roughly sequential
+        idx = np.sort(rng.choice(len(self), size=k, replace=False))
+        return (idx, self.rows[idx])
+
+    def opponents(self, idx=slice(None), n_weeks=None):
+        '''0-based opponents (`N x n_weeks x n_teams`) of the rows at `idx`.'''
+        rows = np.atleast_2d(self.rows[idx])
+        if self.layout == 'pairs':
+            return to_opponents(rows, self.n_teams, n_weeks)
+        opps = rows.reshape(-1, self.n_weeks, self.n_teams) & OPPONENT_BITS
+        if n_weeks is not None:
+            opps = opps[:, np.arange(n_weeks) % self.n_weeks, :]
+        return opps.astype(np.int16)
+
+    def at_home(self, idx=slice(None)):
+        if self.layout != 'fixtures':
+            raise ValueError('Only fixture stores record home and away.')
+        rows = np.atleast_2d(self.rows[idx])
+        return (rows & HOME_BIT).astype(bool).reshape(
+            -1, self.n_weeks, self.n_teams
+        )
+
+
+def fixtures_row(values, num_teams):
+    '''Store row for a `days x home x away` array of fixture values.'''
+    return fixtures_rows(np.asarray(values)[None], num_teams)[0]
+
+
+def fixtures_rows(values, num_teams):
+    '''Store rows for an `N x days x home x away` batch of fixture values.'''
+    values = np.asarray(values, dtype=bool)
+    rows = np.full(values.shape[:2] + (num_teams, ), BYE, dtype=np.uint8)
+    (sol, day, home, away) = np.nonzero(values)
+    rows[sol, day, home] = away | HOME_BIT
+    rows[sol, day, away] = home
+    return rows.reshape(values.shape[0], -1)
@@ -0,0 +1,173 @@
+'''Binary cache of the scores CSVs.
+
+`scores-league_id=...csv` files hold every game twice, once from each
+team's side, with names and home/away details that the simulations never
+look at, and parsing them is most of a short simulation's start-up.  The
+first read converts a file into
+
+* `<stem>.<digest>.points.npy`: `float32` points, weeks x teams,
+* `<stem>.<digest>.opponents.npy`: `int16` opponents as 0-based team
+  positions, weeks x teams (-1 where a team has no game),
+* `<stem>.json`: team ids and names, the names of the two arrays, and
+  the absolute path, size, mtime and SHA-256 of the CSV it came from,
+
+under the cache directory.  The stem is the CSV name plus a hash of its
+absolute path, so `data/2019-05/scores.csv` and `data/2019-12/scores.csv`
+get caches of their own, and the number of weeks read; `<digest>` starts
+the CSV's SHA-256.  Later reads memory-map the arrays the metadata names.
+A CSV whose size or mtime changed is hashed again, and the cache is only
+rebuilt if its contents changed too.
+
+A rebuild writes new arrays next to the old ones and then swaps the
+metadata, so a reader always gets the arrays of the metadata it read,
+never a mix of old and new.  Every write goes through a temporary file
+of its own, so concurrent writers never clobber each other's files.
+
+'''
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def cache_stem(path, weeks=None, cache_dir=os.path.join('data', 'cache')):
+    # the CSV name alone is not unique: every data/<season>/scores.csv has it
+    where = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(path))[0] + '-' + where
+    if weeks is not None:
+        stem += f'-read_weeks={weeks}'
+    return os.path.join(cache_dir, stem)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_scores(path, weeks=None):
+    '''Return `(team_ids, teams, points, opponents)` from a scores CSV.'''
+    scores = pd.read_csv(path)
+    if weeks is not None:
+        scores = scores[scores['week'] <= weeks]
+    points = scores.pivot(index='week', columns='team_id', values='pf')
+    team_ids = points.columns.to_numpy()
+    teams = scores.groupby('team_id')['team'].first().loc[team_ids]
+    pos = pd.Series(np.arange(len(team_ids)), index=team_ids)
+    opps = scores.pivot(index='week', columns='team_id', values='opponent_id')
+    opps = opps.reindex(index=points.index, columns=team_ids)
+    opponents = np.full(opps.shape, -1, dtype=np.int16)
+    known = opps.notna().to_numpy()
+    opponents[known] = pos.loc[opps.to_numpy()[known]].to_numpy()
+    return (
+        team_ids, teams.to_numpy(), points.to_numpy(dtype=np.float32),
+        opponents
+    )
+
+
+def replace_with(path, write, mode='wb'):
+    # write a temporary file of our own, then rename, so readers never
+    # see a half-written file and concurrent writers never share one
+    with tempfile.NamedTemporaryFile(
+        mode, dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False
+    ) as f:
+        write(f)
+    os.replace(f.name, path)
+
+
+def save_array(path, array):
+    replace_with(path, lambda f: np.save(f, array))
+
+
+def save_meta(stem, meta):
+    replace_with(stem + '.json', lambda f: json.dump(meta, f), 'w')
+
+
+def write_scores_cache(stem, path, weeks=None, digest=None):
+    (team_ids, teams, points, opponents) = parse_scores(path, weeks)
+    os.makedirs(os.path.dirname(stem) or '.', exist_ok=True)
+    digest = digest or file_digest(path)
+    # arrays named after the contents, so the old ones stay valid for
+    # whoever still reads the old metadata
+    arrays = {
+        name: '%s.%s.%s.npy' % (os.path.basename(stem), digest[:12], name)
+        for name in ['points', 'opponents']
+    }
+    save_array(os.path.join(os.path.dirname(stem), arrays['points']), points)
+    save_array(
+        os.path.join(os.path.dirname(stem), arrays['opponents']), opponents
+    )
+    stat = os.stat(path)
+    meta = {
+        'source': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': digest,
+        'weeks': weeks,
+        'arrays': arrays,
+        'team_ids': team_ids.tolist(),
+        'teams': teams.tolist(),
+    }
+    # the metadata goes last: a cache without it is never used
+    save_meta(stem, meta)
+    # arrays of earlier contents; open memory maps survive the removal
+    for old in glob.glob(glob.escape(stem) + '.*.npy'):
+        if os.path.basename(old) not in arrays.values():
+            os.remove(old)
+    return meta
+
+
+def cache_meta(stem, path):
+    '''The cache's metadata if it still matches the CSV, else `None`.'''
+    if not os.path.exists(stem + '.json'):
+        return None
+    with open(stem + '.json') as f:
+        meta = json.load(f)
+    # a cache of another CSV, or from before the arrays were named
+    if meta.get('source') != os.path.abspath(path) or 'arrays' not in meta:
+        return None
+    stat = os.stat(path)
+    if meta['size'] == stat.st_size and meta['mtime'] == stat.st_mtime:
+        return meta
+    digest = file_digest(path)
+    if digest != meta['sha256']:
+        return None
+    # touched but unchanged: remember the new mtime and keep the arrays
+    meta.update(size=stat.st_size, mtime=stat.st_mtime)
+    save_meta(stem, meta)
+    return meta
+
+
+def map_arrays(stem, meta):
+    return tuple(
+        np.load(
+            os.path.join(os.path.dirname(stem), meta['arrays'][name]),
+            mmap_mode='r'
+        ) for name in ['points', 'opponents']
+    )
+
+
+def load_scores(path, weeks=None, cache_dir=os.path.join('data', 'cache')):
+    '''`(team_ids, teams, points, opponents)`, through the binary cache.
+
+    `points` and `opponents` are read-only memory maps.
+    '''
+    stem = cache_stem(path, weeks, cache_dir)
+    meta = cache_meta(stem, path)
+    if meta is None:
+        meta = write_scores_cache(stem, path, weeks)
+    try:
+        arrays = map_arrays(stem, meta)
+    except FileNotFoundError:
+        # another process rebuilt the cache after we read the metadata
+        meta = cache_meta(stem, path) or write_scores_cache(stem, path, weeks)
+        arrays = map_arrays(stem, meta)
+    return (
+        np.array(meta['team_ids']), np.array(meta['teams'], dtype=object)
+    ) + arrays
@@ -0,0 +1,186 @@
+'''Sharded, multi-process `SearchForAllSolutions`.
+
+CP-SAT only enumerates solutions on a single worker.  To use more cores,
+the search space is split into shards by fixing a short prefix of the
+schedule (which opponent team 0 plays in the first two weeks).  Shards
+are disjoint and together cover every solution, so each one can be
+enumerated in its own process.
+
+A shard worker writes the raw values of the variables it was asked to
+record, one fixed-width `uint8` row per solution, to its own part file.
+The parent reads the parts back in shard order and passes every solution
+on to the real sink, numbering solutions globally as it goes.
+
+The time limit covers the whole run, not each shard: the parent sets a
+deadline and every shard only gets the time left until it, so shards
+that start after the deadline return at once.  A shard is complete when
+its search ran to the end (OPTIMAL, or INFEASIBLE for an empty shard);
+one cut short by the deadline or the solution limit only holds some of
+its solutions.
+
+'''
+import os
+import shutil
+from multiprocessing import Pool
+from time import time as now
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+from solution_batches import BatchCollector
+
+
+def opponent_prefixes(n_t):
+    # opponent of team 0 in the first and second week
+    return [(a, b) for a in range(1, n_t) for b in range(1, n_t) if a != b]
+
+
+class RawSink:
+    def __init__(self, path, batch_size=10000):
+        self._file = open(path, 'wb')
+        self._batch_size = batch_size
+        self._rows = []
+
+    def write(self, idx, values):
+        self._rows.append(values)
+        if len(self._rows) == self._batch_size:
+            self.flush()
+
+    def write_batch(self, first_idx, batch):
+        self.flush()
+        np.asarray(batch, dtype=np.uint8).tofile(self._file)
+
+    def flush(self):
+        if self._rows:
+            np.asarray(self._rows, dtype=np.uint8).tofile(self._file)
+            self._rows = []
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class VarValuesPrinter(cp_model.CpSolverSolutionCallback):
+    def __init__(self, variables, sink, limit=None):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._vars = list(variables)
+        self._sink = sink
+        self._limit = limit
+        self._n_sol = 0
+
+    def on_solution_callback(self):
+        self._n_sol += 1
+        self._sink.write(self._n_sol, [self.Value(v) for v in self._vars])
+        if self._limit is not None and self._n_sol >= self._limit:
+            self.StopSearch()
+
+    def n_sol(self):
+        return self._n_sol
+
+
+# statuses of a shard whose every solution was found
+COMPLETE = ('OPTIMAL', 'INFEASIBLE')
+
+
+def shard_deadline(time=None):
+    '''The wall clock time a run given `time` seconds has to stop at.'''
+    return None if time is None else now() + time
+
+
+def search_shard(model, variables, path, limit=None, deadline=None):
+    solver = cp_model.CpSolver()
+    if deadline is not None:
+        left = deadline - now()
+        if left <= 0:
+            # out of time before it started: an empty, unfinished part
+            open(path, 'wb').close()
+            return (0, 'UNKNOWN', 0.0)
+        solver.parameters.max_time_in_seconds = left
+    sink = RawSink(path)
+    collector = BatchCollector(variables, sink.write_batch, limit=limit)
+    try:
+        status = solver.SearchForAllSolutions(model, collector)
+        collector.flush()
+    finally:
+        sink.close()
+    return (collector.n_sol(), solver.StatusName(status), solver.WallTime())
+
+
+def shard_dir(name):
+    return name + '.shards'
+
+
+def part_path(dir_shards, shard):
+    return os.path.join(dir_shards, 'part-%05i.u8' % shard)
+
+
+def read_part(path, width):
+    return np.fromfile(path, dtype=np.uint8).reshape(-1, width)
+
+
+def run_shards(
+    worker,
+    tasks,
+    width,
+    write,
+    n_workers=None,
+    limit=None,
+    n_sol=0,
+    on_shard_done=None,
+    keep_partial=True
+):
+    '''Run `worker(task)` for every task and merge the part files.
+
+    Each task is a tuple whose first two items are the shard number and
+    the path of its part file; `worker` must return a
+    `(n_sol, status, wall_time)` tuple.  `write(idx, values)` is called
+    for every solution, in shard order, with a global 1-based index that
+    carries on from `n_sol`.  Once a shard is merged,
+    `on_shard_done(shard, n_sol, status)` is called, which is where a
+    caller can flush its output and checkpoint.
+
+    Without `keep_partial`, a shard that is not complete is not merged,
+    unless it reaches `limit`, so a resumed run can search it again
+    without writing any of its solutions twice.  Returns `(n_sol, stats)`,
+    with one `(shard, n_sol, status, wall_time)` per shard run.
+    '''
+    stats = []
+    n_partial = 0
+    with Pool(processes=n_workers) as pool:
+        for (task, res) in zip(tasks, pool.imap(worker, tasks)):
+            (shard, path) = task[:2]
+            stats.append((shard, ) + tuple(res))
+            print(
+                'shard %i: %i solutions, %s, %.2f s' % ((shard, ) + tuple(res))
+            )
+            status = res[1]
+            if status not in COMPLETE:
+                n_partial += 1
+                if not keep_partial and (
+                    limit is None or n_sol + res[0] < limit
+                ):
+                    # searched again on resume, so none of it goes out now
+                    os.remove(path)
+                    continue
+            for values in read_part(path, width):
+                n_sol += 1
+                write(n_sol, values)
+                if limit is not None and n_sol >= limit:
+                    break
+            os.remove(path)
+            if on_shard_done is not None:
+                on_shard_done(shard, n_sol, status)
+            if limit is not None and n_sol >= limit:
+                print(f'Stopping search after {limit} solutions.')
+                pool.terminate()
+                break
+    if n_partial and (limit is None or n_sol < limit):
+        print(
+            '%i shards ran out of time before finding all their solutions%s.'
+            % (n_partial, '' if keep_partial else ', --resume searches again')
+        )
+    return (n_sol, stats)
+
+
+def clear_shard_dir(dir_shards):
+    shutil.rmtree(dir_shards, ignore_errors=True)
@@ -0,0 +1,61 @@
+'''Batched, bulk collection of enumerated solutions.
+
+The usual printers call `solver.Value()` once per variable per solution,
+which for big models costs more than the search step that found the
+solution.  `BatchCollector` instead copies every recorded variable out
+of the solver response in one NumPy gather, using a precomputed map from
+variables to proto indices, into a preallocated `batch_size x n_vars`
+buffer.  Full buffers are handed to `on_batch(first_idx, batch)`, with
+`first_idx` the 1-based index of the batch's first solution.  The buffer
+is reused afterwards, so `on_batch` has to copy anything it keeps.
+
+'''
+import numpy as np
+from ortools.sat.python import cp_model
+
+
+def variable_index(variables):
+    return np.array([v.Index() for v in variables], dtype=np.int64)
+
+
+class BatchCollector(cp_model.CpSolverSolutionCallback):
+    def __init__(
+        self,
+        variables,
+        on_batch,
+        batch_size=10000,
+        limit=None,
+        dtype=np.uint8
+    ):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._index = variable_index(variables)
+        self._on_batch = on_batch
+        self._buf = np.empty((batch_size, len(self._index)), dtype=dtype)
+        self._n_buf = 0
+        self._n_sol = 0
+        self._limit = limit
+
+    def on_solution_callback(self):
+        # the default mode raises on an index outside the response,
+        # rather than quietly reading some other variable
+        np.take(
+            np.asarray(self.Response().solution),
+            self._index,
+            out=self._buf[self._n_buf]
+        )
+        self._n_buf += 1
+        self._n_sol += 1
+        if self._n_buf == self._buf.shape[0]:
+            self.flush()
+        if self._limit is not None and self._n_sol >= self._limit:
+            self.StopSearch()
+
+    def flush(self):
+        if self._n_buf:
+            self._on_batch(
+                self._n_sol - self._n_buf + 1, self._buf[:self._n_buf]
+            )
+            self._n_buf = 0
+
+    def n_sol(self):
+        return self._n_sol
@@ -0,0 +1,290 @@
+'''Multi-seed portfolio of CP-SAT optimization runs.
+
+How well one CP-SAT run does on a hard minimization depends a lot on its
+random seed.  A portfolio runs the same model in several processes
+instead, each with its own seed, a variant of the search parameters and
+a share of the CPUs this process may use.  The model travels to the runs
+as its text-format proto, so it is built only once, by the parent.
+
+The runs share an incumbent: the best objective any of them has found,
+and a stop event.  The incumbent prunes every run: once another run has
+found a better objective than its own, a run stops, adds the cut
+`objective < incumbent` to its model and searches again with the time
+it has left, hinted with the incumbent schedule, so it only ever looks
+for schedules that beat all of the runs.  A run whose lower bound reaches the shared best objective, or
+whose cut model is infeasible, proves the incumbent optimal, and one
+that finishes OPTIMAL proves its own; either way the stop event is set
+and every run stops.  Otherwise they all stop at the time limit.  Each
+run sends back its statistics and the values of the variables it was
+asked for in its best solution, and the parent picks the best of them.
+
+'''
+import math
+import os
+import queue
+import threading
+from multiprocessing import Array, Event, Process, Queue, Value
+from time import perf_counter
+
+import numpy as np
+from ortools.sat.python import cp_model
+
+# search variants the runs take in turn, on top of their own seed
+VARIANTS = [
+    {},
+    {'randomize_search': True},
+    {'linearization_level': 2},
+    {'randomize_search': True, 'linearization_level': 0},
+]
+
+
+def available_cpus():
+    '''CPUs this process may run on, which can be fewer than the box has.'''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def portfolio_runs(n_runs=None, seed=None, num_cpus=None):
+    '''Solver parameters of every run.
+
+    One run per CPU if `n_runs` is not given, with the CPUs (default
+    all available) shared out between the runs; the seeds count up from
+    `seed` (default 0).
+    '''
+    if num_cpus is None:
+        num_cpus = available_cpus()
+    if not n_runs:
+        n_runs = num_cpus
+    seed = 0 if seed is None else seed
+    workers = max(1, num_cpus // n_runs)
+    return [
+        dict(
+            VARIANTS[k % len(VARIANTS)],
+            random_seed=seed + k,
+            num_search_workers=workers
+        ) for k in range(n_runs)
+    ]
+
+
+class Incumbent:
+    '''Best objective and solution over all runs, and the event that
+    stops them.'''
+    def __init__(self, n_vars):
+        self.objective = Value('d', float('inf'))
+        self.solution = Array('q', n_vars, lock=False)
+        self.stop = Event()
+
+    def offer(self, objective, solution):
+        with self.objective.get_lock():
+            if objective < self.objective.value:
+                self.objective.value = objective
+                self.solution[:] = solution
+
+    def hint(self, model):
+        '''Hint `model` with the best solution so far.'''
+        with self.objective.get_lock():
+            values = self.solution[:]
+        model.ClearHints()
+        hints = model.Proto().solution_hint
+        hints.vars.extend(range(len(values)))
+        hints.values.extend(values)
+
+    def check_bound(self, bound):
+        # no run can beat the best objective any more
+        if bound >= self.objective.value:
+            self.stop.set()
+
+
+class PortfolioCallback(cp_model.CpSolverSolutionCallback):
+    '''Keeps the values at `index` of the run's latest (best) solution.'''
+    def __init__(self, index, incumbent):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._index = np.asarray(index)
+        self._incumbent = incumbent
+        self.values = None
+        self.objective = math.inf
+        self.n_sol = 0
+
+    def on_solution_callback(self):
+        self.n_sol += 1
+        solution = self.Response().solution
+        self.values = np.asarray(solution, dtype=np.uint8)[self._index]
+        self.objective = self.ObjectiveValue()
+        self._incumbent.offer(self.objective, solution)
+        self._incumbent.check_bound(self.BestObjectiveBound())
+
+
+def stop_on(incumbent, solver, target, done, settle=1.0, poll=0.1):
+    '''Stop `solver` when every run stops, or, after `settle` seconds,
+    when another run beats `target()`.'''
+    start = perf_counter()
+    while not done.is_set():
+        if incumbent.stop.wait(poll) or (
+            perf_counter() - start >= settle
+            and incumbent.objective.value < target()
+        ):
+            solver.StopSearch()
+            return
+
+
+def add_objective_cut(model, objective):
+    '''Only allow solutions of `model` with a better objective than
+    `objective`: below it when minimizing, above it when maximizing.'''
+    proto = model.Proto()
+    obj = proto.objective
+    scale = obj.scaling_factor or 1
+    ct = proto.constraints.add().linear
+    constant = 0
+    for (ref, coeff) in zip(obj.vars, obj.coeffs):
+        if ref < 0:
+            # a negated reference stands for 1 - x
+            (ref, coeff, constant) = (-ref - 1, -coeff, constant + coeff)
+        ct.vars.append(ref)
+        ct.coeffs.append(coeff)
+    bound = math.ceil(objective / scale - obj.offset) - 1 - constant
+    ct.domain.extend([cp_model.INT_MIN, int(bound)])
+
+
+def portfolio_run(k, text, index, params, time_limit, incumbent, results):
+    '''Solve the model in `text` with `params`; put the outcome on `results`.
+
+    The run restarts with an objective cut whenever another run beats its
+    best objective, until it proves the incumbent optimal or runs out of
+    time.
+    '''
+    start = perf_counter()
+    model = cp_model.CpModel()
+    if not model.Proto().parse_text_format(text):
+        raise ValueError('Could not parse the portfolio model.')
+    # best objective and values of this run, and a lower bound on the
+    # optimum that it proved
+    (best, values, bound) = (math.inf, None, -math.inf)
+    (n_sol, conflicts, branches, restarts) = (0, 0, 0, 0)
+    cut = math.inf
+    while True:
+        solver = cp_model.CpSolver()
+        for (name, value) in params.items():
+            setattr(solver.parameters, name, value)
+        if time_limit is not None:
+            solver.parameters.max_time_in_seconds = max(
+                time_limit - (perf_counter() - start), 0
+            )
+        callback = PortfolioCallback(index, incumbent)
+        solver.best_bound_callback = incumbent.check_bound
+        done = threading.Event()
+        watcher = threading.Thread(
+            target=stop_on,
+            args=(
+                incumbent, solver, lambda: min(best, callback.objective, cut),
+                done
+            ),
+            daemon=True
+        )
+        watcher.start()
+        status = solver.Solve(model, callback)
+        done.set()
+        watcher.join()
+        n_sol += callback.n_sol
+        conflicts += solver.NumConflicts()
+        branches += solver.NumBranches()
+        if callback.values is not None:
+            # under the cut, any solution beats the ones before it
+            (best, values) = (callback.objective, callback.values)
+        if status == cp_model.INFEASIBLE:
+            # nothing beats the cut, if there is one
+            bound = max(bound, cut)
+        elif status != cp_model.MODEL_INVALID:
+            # the optimum is either below the cut, or the cut itself
+            bound = max(bound, min(solver.BestObjectiveBound(), cut))
+        if status in (cp_model.OPTIMAL, cp_model.INFEASIBLE):
+            incumbent.stop.set()
+            break
+        (prev, cut) = (cut, incumbent.objective.value)
+        out_of_time = time_limit is not None and (
+            perf_counter() - start >= time_limit
+        )
+        if incumbent.stop.is_set() or out_of_time or cut >= min(best, prev):
+            break
+        # another run did better: only look for schedules that beat it,
+        # starting from its schedule
+        add_objective_cut(model, cut)
+        incumbent.hint(model)
+        restarts += 1
+    results.put(
+        (
+            k, {
+                'seed': params.get('random_seed'),
+                'params': params,
+                'status': solver.StatusName(status),
+                'objective': None if values is None else best,
+                'bound': bound,
+                'solutions': n_sol,
+                'restarts': restarts,
+                'conflicts': conflicts,
+                'branches': branches,
+                'wall_time': perf_counter() - start,
+            }, values
+        )
+    )
+
+
+def run_portfolio(model, index, runs, time_limit=None):
+    '''Minimize `model` with one process per entry of `runs`.
+
+    `index` is an array of the proto indices of the variables to report.
+    Returns `(status, objective, values, stats)`: the status and values
+    of the best run, `None` if no run found a solution, and the
+    statistics of every run in order.  The status is OPTIMAL if any run
+    proved the best objective optimal.
+    '''
+    text = str(model.Proto())
+    index = np.asarray(index)
+    incumbent = Incumbent(len(model.Proto().variables))
+    results = Queue()
+    procs = [
+        Process(
+            target=portfolio_run,
+            args=(k, text, index, params, time_limit, incumbent, results)
+        ) for (k, params) in enumerate(runs)
+    ]
+    for p in procs:
+        p.start()
+    outcomes = []
+    # read the results before joining, or a full queue can block a run
+    while len(outcomes) < len(procs):
+        try:
+            outcomes.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(p.is_alive() for p in procs) and results.empty():
+                break
+    for p in procs:
+        p.join()
+    outcomes.sort(key=lambda outcome: outcome[0])
+    stats = [s for (_, s, _) in outcomes]
+    found = [(s, v) for (_, s, v) in outcomes if v is not None]
+    if not found:
+        status = 'INFEASIBLE' if any(
+            s['status'] == 'INFEASIBLE' for s in stats
+        ) else 'UNKNOWN'
+        return (status, None, None, stats)
+    (best, values) = min(found, key=lambda sv: sv[0]['objective'])
+    proved = incumbent.stop.is_set() and any(
+        s['status'] == 'OPTIMAL' or s['bound'] >= best['objective']
+        for s in stats
+    )
+    status = 'OPTIMAL' if proved else 'FEASIBLE'
+    return (status, best['objective'], values, stats)
+
+
+def print_portfolio_stats(stats):
+    for (k, s) in enumerate(stats):
+        print(
+            'run %i: seed %s, %s, objective %s, bound %g, %i solutions, %i restarts, %i conflicts, %i branches, %.2f s'
+            % (
+                k, s['seed'], s['status'], s['objective'], s['bound'],
+                s['solutions'], s['restarts'], s['conflicts'], s['branches'],
+                s['wall_time']
+            )
+        )
+        print('  - params: %s' % s['params'])
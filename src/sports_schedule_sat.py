@@ -36,9 +36,33 @@ import re
 import csv
 from functools import partial
 from functools import reduce
+from time import perf_counter
 
+import numpy as np
 from ortools.sat.python import cp_model
 
+import sharded_search
+from home_away_patterns import (
+    break_bounds, load_hap_sets, set_patterns, used_patterns
+)
+from model_cache import (
+    load_model, model_cache_stem, model_vars, save_model, var_index
+)
+from model_proto import (
+    add_clauses, add_linear, bool_vars, fix_vars, negated, new_bool_vars
+)
+from schedule_hints import save_hint, warm_start
+from schedule_sinks import (
+    FixturesStoreSink, NullSink, ThreadedSink, sample_sink
+)
+from decomposed_schedule import (
+    decomposable, opponents_exist, solve_decomposed
+)
+from solution_batches import BatchCollector
+from solver_portfolio import (
+    available_cpus, portfolio_runs, print_portfolio_stats, run_portfolio
+)
+
 # solution_printer = VarArraySolutionPrinter(
 #     fixtures, partial(get_scheduled_fixtures, pools=pools),
 #     check_file_collision("list_" + csv)
@@ -46,53 +70,109 @@ from ortools.sat.python import cp_model
 
 
 class VarArraySolutionPrinter(cp_model.CpSolverSolutionCallback):
-    """Print intermediate solutions."""
-    def __init__(self, fixtures, getter, csvfile, limit=100000):
+    """Hand every solution to a list of schedule_sinks sinks."""
+    def __init__(self, fixtures, sinks):
         cp_model.CpSolverSolutionCallback.__init__(self)
-        self.__fixtures = fixtures
-        self.__getter = getter
+        num_matchdays = len(fixtures)
+        num_teams = len(fixtures[0])
+        self.__variables = fixture_slice(
+            fixtures, range(num_matchdays), range(num_teams), range(num_teams)
+        )
+        self.__sinks = sinks
         self.__solution_count = 0
-        self.__writer = self.get_csv_writer(csvfile)
-        self.__close_once = True
-        self.__solution_limit = limit
-
-        fixture_regex = r"day (\d+), home (\d+), away (\d+)"
-        # fixture_regex = self.__solution_count
-        self.__prog = re.compile(fixture_regex)
 
     def on_solution_callback(self):
         self.__solution_count += 1
-        if self.__solution_count < 101:
-            matches = self.__getter(solver=self, fixtures=self.__fixtures)
-            for row in matches:
-                line = ", ".join(['%s=%i' % (k, v) for (k, v) in row.items()])
-                print(line)
-                self.__writer.writerow(row)
-
-            print()
-            self.__writer.writerow({})
-
-        # elif self.__close_once:
-        #     self.close_csv()
+        values = [self.Value(fixture) for fixture in self.__variables]
+        for sink in self.__sinks:
+            sink.write(self.__solution_count, values)
 
     def solution_count(self):
         return self.__solution_count
 
-    def get_csv_writer(self, csvname):
+    def close(self):
+        close_sinks(self.__sinks)
+
+
+class FixturesCsvSink:
+    """Write solutions as fixture rows, with the solution number first."""
+    def __init__(self, csvname, pools, num_matchdays, num_teams, echo=True):
         self.__csvfile = open(csvname, 'w', newline='')
-        fieldnames = ['day', 'home', 'away', 'home pool', 'away pool']
-        writer = csv.DictWriter(self.__csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        return writer
+        self.__writer = fixture_csv_writer(self.__csvfile)
+        self.__pools = pools
+        self.__shape = (num_matchdays, num_teams, num_teams)
+        self.__echo = echo
+
+    def write(self, idx, values):
+        values = np.asarray(values).reshape(self.__shape)
+        for row in scheduled_fixtures(values, self.__pools):
+            row = dict(solution=idx, **row)
+            if self.__echo:
+                print(", ".join(['%s=%i' % (k, v) for (k, v) in row.items()]))
+            self.__writer.writerow(row)
+        if self.__echo:
+            print()
+
+    def write_batch(self, first_idx, batch):
+        for (i, values) in enumerate(batch):
+            self.write(first_idx + i, values)
+
+    def close(self):
+        self.__csvfile.close()
+
+
+def close_sinks(sinks):
+    # close them all, even if one fails
+    try:
+        if sinks:
+            sinks[0].close()
+    finally:
+        if len(sinks) > 1:
+            close_sinks(sinks[1:])
 
-    # def close_csv(self):
-    #     # if self.__close_once:
-    #     #     os.close(self.__csvfile)
-    #     #self.__close_once = False
-    #  going to leak a file descriptor.  but I'm screwing up the close here
+
+def solution_sinks(
+    pools,
+    num_matchdays,
+    num_teams,
+    csvname,
+    store=None,
+    sample='first',
+    sample_size=100,
+    seed=None,
+    batch_size=10000,
+    queue_size=0,
+    echo=True
+):
+    """A solution counter, the fixture CSV (sampled) and the store."""
+    sinks = [NullSink(echo=True)]
+    if sample != 'count':
+        sinks.append(
+            sample_sink(
+                FixturesCsvSink(
+                    csvname, pools, num_matchdays, num_teams, echo=echo
+                ), sample, sample_size, seed
+            )
+        )
+    if store:
+        store_sink = FixturesStoreSink(
+            store, num_teams, num_matchdays, batch_size=batch_size
+        )
+        if queue_size:
+            store_sink = ThreadedSink(
+                store_sink, max_batches=queue_size, batch_size=batch_size
+            )
+        sinks.append(store_sink)
+    return sinks
 
 
 def get_scheduled_fixtures(solver, fixtures, pools):
+    values = [[[solver.Value(fixture) for fixture in fh] for fh in fd]
+              for fd in fixtures]
+    return scheduled_fixtures(values, pools)
+
+
+def scheduled_fixtures(values, pools):
     pool_membership = {
         home: homepool
         for (homepool, pool) in enumerate(pools) for home in pool
@@ -109,8 +189,8 @@ def get_scheduled_fixtures(solver, fixtures, pools):
             'away': away + 1,
             'home pool': pool_membership[home] + 1,
             'away pool': pool_membership[away] + 1,
-        } for (day, fd) in enumerate(fixtures) for (home, fh) in enumerate(fd)
-        for (away, fixture) in enumerate(fh) if solver.Value(fixture)
+        } for (day, fd) in enumerate(values) for (home, fh) in enumerate(fd)
+        for (away, fixture) in enumerate(fh) if fixture
     ]
     return list(fixed_matches)
 
@@ -148,6 +228,13 @@ def csv_dump_results(scheduled_games, csv_basename):
             writer.writerow(row)
 
 
+def fixture_csv_writer(csvfile):
+    fieldnames = ['solution', 'day', 'home', 'away', 'home pool', 'away pool']
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    writer.writeheader()
+    return writer
+
+
 def accum_pool_pool(pool_vs_pool, row):
     pool_vs_pool[row['home pool'] - 1][row['away pool'] - 1] += 1
     return pool_vs_pool
@@ -262,6 +349,28 @@ def season_expected_games(
         )
 
 
+def season_matchups(num_teams, num_matchdays, num_matches_per_day):
+    # how many possible unique games?
+    unique_games = (num_teams) * (num_teams - 1) / 2
+
+    # how many games are possible to play
+    total_games = num_matchdays * num_matches_per_day
+
+    # maximum possible games versus an opponent.  example, if 20
+    # possible total games, and 28 unique combinations, then 20 // 28
+    # +1 = 1.  If 90 total games (say 5 per day for 18 match days) and
+    # 10 teams for 45 possible unique combinations of teams, then 90
+    # // 45 + 1 = 3. Hmm.  Should be 2
+    matchups = int((total_games // unique_games) + 1)
+    # there is a special case, if total games / unique games == total
+    # games // unique games, then the constraint can be ==, not <=
+    matchups_exact = False
+    if (total_games % unique_games == 0):
+        matchups_exact = True
+        matchups = int(total_games // unique_games)
+    return (matchups, matchups_exact, unique_games, total_games)
+
+
 def add_pool_play_constraints(pools, pool_play, model, minimum_games_function):
 
     # games per round robin
@@ -430,6 +539,77 @@ def add_max_home_stand_constraint(
             # take place.
 
 
+def add_hap_constraints(
+    teams,
+    at_home,
+    model,
+    num_matchdays,
+    max_home_stand,
+    listall,
+    haps,
+    hap_set=0,
+    hap_limit=None,
+    cache_dir='data',
+    hap_time=None,
+    pools=None
+):
+    # the home/away pattern sets come from the cache, and are only
+    # searched for the first time a league shape is seen
+    cached = load_hap_sets(
+        len(teams),
+        num_matchdays,
+        max_home_stand,
+        break_bounds(num_matchdays, listall),
+        cache_dir,
+        hap_limit,
+        time_limit=hap_time
+    )
+    if haps == 'table' and not cached['complete']:
+        # every feasible pattern would be allowed, which is just the
+        # home stand constraint again, as a much larger table
+        print(
+            'Warning: the home/away pattern search stopped at --hap_limit or '
+            '--hap_time, so --haps table cannot narrow anything down; using '
+            'the home stand constraints instead.'
+        )
+        add_max_home_stand_constraint(
+            teams, at_home, model, num_matchdays, max_home_stand
+        )
+    elif haps == 'table':
+        table = used_patterns(cached).tolist()
+        for t in teams:
+            model.AddAllowedAssignments(
+                [at_home[d][t] for d in range(num_matchdays)], table
+            )
+    elif haps == 'fixed':
+        # with the pools known, skip sets whose opponents cannot be
+        # arranged, which the fewest-break sets often are
+        k = hap_set
+        while (
+            pools is not None and k < len(cached['sets'])
+            and not opponents_exist(set_patterns(cached, k).T, pools)
+        ):
+            k += 1
+        if k >= len(cached['sets']):
+            raise ValueError(
+                'Only %i home/away pattern sets are known for this league.' %
+                len(cached['sets'])
+            )
+        if k != hap_set:
+            print(
+                'Home/away pattern sets %i to %i have no schedule; using set %i'
+                % (hap_set, k - 1, k)
+            )
+        # team t gets pattern t of the set
+        fixed = set_patterns(cached, k)
+        [
+            model.Add(at_home[d][t] == int(fixed[t][d]))
+            for t in teams for d in range(num_matchdays)
+        ]
+    else:
+        raise ValueError(f'Unknown home/away pattern mode {haps}.')
+
+
 def create_breaks(model, teams, num_matchdays):
     # note that I am careful to iterate the same way here and in
     # breaks_constraint, so that I don't have to double index breaks
@@ -559,35 +739,40 @@ def daily_at_home(model, num_teams, num_days):
     )
 
 
-def model_matches(
-    num_teams, num_matchdays, num_matches_per_day, num_pools, max_home_stand,
-    listall
+def model_matches(*args, **kwargs):
+    (pools, fixtures, at_home, breaks, model) = build_matches(*args, **kwargs)
+    return (pools, fixtures, breaks, model)
+
+
+def build_matches(
+    num_teams,
+    num_matchdays,
+    num_matches_per_day,
+    num_pools,
+    max_home_stand,
+    listall,
+    haps=None,
+    hap_set=0,
+    hap_limit=None,
+    cache_dir='data',
+    builder='lists',
+    hap_time=None
 ):
+    if builder == 'numpy':
+        return build_matches_numpy(
+            num_teams, num_matchdays, num_matches_per_day, num_pools,
+            max_home_stand, listall, haps, hap_set, hap_limit, cache_dir,
+            hap_time
+        )
 
     model = cp_model.CpModel()
 
     matchdays = range(num_matchdays)
     matches = range(num_matches_per_day)
     teams = range(num_teams)
-    # how many possible unique games?
-    unique_games = (num_teams) * (num_teams - 1) / 2
-
-    # how many games are possible to play
-    total_games = num_matchdays * num_matches_per_day
-
-    # maximum possible games versus an opponent.  example, if 20
-    # possible total games, and 28 unique combinations, then 20 // 28
-    # +1 = 1.  If 90 total games (say 5 per day for 18 match days) and
-    # 10 teams for 45 possible unique combinations of teams, then 90
-    # // 45 + 1 = 3. Hmm.  Should be 2
-    matchups = int((total_games // unique_games) + 1)
-    # print(matchups)
-    # there is a special case, if total games / unique games == total
-    # games // unique games, then the constraint can be ==, not <=
-    matchups_exact = False
-    if (total_games % unique_games == 0):
-        matchups_exact = True
-        matchups = int(total_games // unique_games)
+    (matchups, matchups_exact, unique_games, total_games) = season_matchups(
+        num_teams, num_matchdays, num_matches_per_day
+    )
 
     print('expected matchups per pair', matchups, 'exact?', matchups_exact)
 
@@ -651,23 +836,285 @@ def model_matches(
         num_matches_per_day, num_matchdays
     )
 
-    add_max_home_stand_constraint(
-        teams, at_home, model, num_matchdays, max_home_stand
-    )
+    if haps is None:
+        add_max_home_stand_constraint(
+            teams, at_home, model, num_matchdays, max_home_stand
+        )
+    else:
+        # cached patterns already keep to the maximum home stand
+        add_hap_constraints(
+            teams, at_home, model, num_matchdays, max_home_stand, listall,
+            haps, hap_set, hap_limit, cache_dir, hap_time, pools
+        )
 
     breaks = create_breaks(model, teams, num_matchdays)
 
     breaks_constraint(breaks, teams, at_home, num_matchdays, model, listall)
 
+    return (pools, fixtures, at_home, breaks, model)
+
+
+def add_fixture_constraints(model, fix, pools, num_matches_per_day):
+    """Pool play, pool balance, one game per day and the round robins,
+    over the fixture index array fix[d, h, a] (see build_matches_numpy).
+
+    Returns (home_games, away_games): the fixtures of team t on day d at
+    [d, t], as index arrays.
+    """
+    (n_d, n_t) = fix.shape[:2]
+    teams = np.arange(n_t)
+    (matchups, matchups_exact, unique_games, total_games) = season_matchups(
+        n_t, n_d, num_matches_per_day
+    )
+
+    # home_games[d, t] and away_games[d, t]: fixtures of team t on day d
+    other = ~np.eye(n_t, dtype=bool)
+    home_games = fix[:, other].reshape(n_d, n_t, n_t - 1)
+    away_games = fix.transpose(0, 2, 1)[:, other].reshape(n_d, n_t, n_t - 1)
+
+    minimum_games_function = partial(
+        season_expected_games,
+        matchups=matchups,
+        matchups_exact=matchups_exact,
+        unique_games=unique_games,
+        total_games=total_games
+    )
+
+    # pool play: every team against every pool, home or away
+    for pool in pools:
+        rows = np.concatenate(
+            [
+                fix[:, :, pool].transpose(1, 0, 2).reshape(n_t, -1),
+                fix[:, pool, :].transpose(2, 0, 1).reshape(n_t, -1)
+            ],
+            axis=1
+        )
+        lo = [
+            minimum_games_function(
+                games_per_rr=expected_t_vs_pool_games(t, pool)
+            ) for t in teams
+        ]
+        add_linear(model, rows, lo, None)
+
+    # pool balance: home pool against away pool
+    for (ppi, pooli) in enumerate(pools):
+        for (ppj, poolj) in enumerate(pools):
+            games = minimum_games_function(
+                games_per_rr=expected_pool_vs_pool_games(pooli, poolj)
+            )
+            row = fix[:, pooli][:, :, poolj].reshape(1, -1)
+            # softer within a pool, to allow for odd numbers
+            add_linear(model, row, games, games + (ppi == ppj))
+
+    # one game per day
+    add_linear(
+        model,
+        np.concatenate([home_games, away_games], axis=2).reshape(n_d * n_t, -1),
+        1, 1
+    )
+
+    # every pair meets once per round robin period; the last period
+    # might be short, and then a pair meets at most once in it
+    (t1, t2) = np.triu_indices(n_t, 1)
+    days_to_play = int(unique_games // num_matches_per_day)
+    periods = [
+        (range(m * days_to_play, (m + 1) * days_to_play), 1)
+        for m in range(matchups - 1)
+    ]
+    periods.append(
+        (
+            range((matchups - 1) * days_to_play, n_d),
+            1 if matchups_exact else 0
+        )
+    )
+    for (days, lo) in periods:
+        days = list(days)
+        rows = np.concatenate(
+            [fix[days][:, t1, t2], fix[days][:, t2, t1]], axis=0
+        ).T
+        add_linear(model, rows, lo, 1)
+
+    return (home_games, away_games)
+
+
+def add_home_stand_clauses(model, home, max_home_stand):
+    """No run of max_home_stand + 1 home, or away, days in home[d, t]."""
+    if len(home) <= max_home_stand:
+        return
+    window = np.lib.stride_tricks.sliding_window_view(
+        home, max_home_stand + 1, axis=0
+    ).reshape(-1, max_home_stand + 1)
+    add_clauses(model, window)
+    add_clauses(model, negated(window))
+
+
+def add_break_vars(model, home, listall):
+    """Break variables brk[t, d] of home[d, t], with the break bound."""
+    (n_d, n_t) = home.shape
+    # brk[t, d]: team t is home, or away, on both days d and d + 1
+    brk = new_bool_vars(
+        model, (n_t, n_d - 1),
+        'two home or two away for team %i, starting on matchday %i'
+    )
+    (now, nxt) = (home[:-1].T, home[1:].T)
+    add_clauses(
+        model,
+        np.concatenate(
+            [
+                np.stack(lits, axis=-1).reshape(-1, 3) for lits in [
+                    (now, nxt, brk),
+                    (negated(now), negated(nxt), brk),
+                    (negated(now), nxt, negated(brk)),
+                    (now, negated(nxt), negated(brk)),
+                ]
+            ]
+        )
+    )
+    (lo, hi) = break_bounds(n_d, listall)
+    if listall:
+        print('listall case')
+    else:
+        print('not listall case')
+    add_linear(model, brk.reshape(1, -1), lo, hi)
+    return brk
+
+
+def build_matches_numpy(
+    num_teams,
+    num_matchdays,
+    num_matches_per_day,
+    num_pools,
+    max_home_stand,
+    listall,
+    haps=None,
+    hap_set=0,
+    hap_limit=None,
+    cache_dir='data',
+    hap_time=None
+):
+    """Same model as build_matches, written from NumPy index arrays.
+
+    fix[d, h, a], home[d, t] and brk[t, d] hold the proto indices of the
+    fixture, at_home and break variables, and every constraint family
+    takes its variable lists from slices of them (see model_proto).  The
+    at_home links are one linear constraint per team and day instead of
+    one implication per fixture; given one game per day they allow the
+    same solutions.
+    """
+    model = cp_model.CpModel()
+    (matchups, matchups_exact, _, _) = season_matchups(
+        num_teams, num_matchdays, num_matches_per_day
+    )
+    print('expected matchups per pair', matchups, 'exact?', matchups_exact)
+
+    (n_d, n_t) = (num_matchdays, num_teams)
+    teams = np.arange(n_t)
+    fix = new_bool_vars(
+        model, (n_d, n_t, n_t), 'fixture: day %i, home %i, away %i'
+    )
+    home = new_bool_vars(model, (n_d, n_t), 'at_home: day %i, home %i')
+    pools = initialize_pools(num_pools, num_teams)
+
+    # forbid playing self
+    fix_vars(model, fix[:, teams, teams], 0)
+
+    (home_games, away_games) = add_fixture_constraints(
+        model, fix, pools, num_matches_per_day
+    )
+
+    # link at_home, fixtures: a home game means at home, an away game
+    # away
+    add_linear(
+        model,
+        np.concatenate([home_games, home[:, :, None]], axis=2).reshape(-1, n_t),
+        None,
+        0,
+        coeffs=np.r_[np.ones(n_t - 1, dtype=np.int64), -1]
+    )
+    add_linear(
+        model,
+        np.concatenate([away_games, home[:, :, None]], axis=2).reshape(-1, n_t),
+        None, 1
+    )
+
+    at_home = bool_vars(model, home)
+    if haps is None:
+        add_home_stand_clauses(model, home, max_home_stand)
+    else:
+        add_hap_constraints(
+            range(num_teams), at_home, model, num_matchdays, max_home_stand,
+            listall, haps, hap_set, hap_limit, cache_dir, hap_time, pools
+        )
+
+    brk = add_break_vars(model, home, listall)
+
+    return (
+        pools, bool_vars(model, fix), at_home, bool_vars(model, brk.ravel()),
+        model
+    )
+
+
+def cached_model_matches(
+    num_teams,
+    num_matchdays,
+    num_matches_per_day,
+    num_pools,
+    max_home_stand,
+    listall,
+    model_cache=None,
+    **options
+):
+    """Like model_matches, but reloaded from model_cache when possible."""
+    if model_cache is None:
+        return model_matches(
+            num_teams, num_matchdays, num_matches_per_day, num_pools,
+            max_home_stand, listall, **options
+        )
+    stem = model_cache_stem(
+        dict(
+            num_teams=num_teams,
+            num_matchdays=num_matchdays,
+            num_matches_per_day=num_matches_per_day,
+            num_pools=num_pools,
+            max_home_stand=max_home_stand,
+            listall=listall,
+            **options
+        ), model_cache
+    )
+    cached = load_model(stem)
+    if cached is not None:
+        (model, index) = cached
+        return (
+            initialize_pools(num_pools, num_teams),
+            model_vars(model, index['fixtures']),
+            model_vars(model, index['breaks']), model
+        )
+    (pools, fixtures, at_home, breaks, model) = build_matches(
+        num_teams, num_matchdays, num_matches_per_day, num_pools,
+        max_home_stand, listall, **options
+    )
+    save_model(
+        stem, model, {
+            'fixtures': var_index(fixtures),
+            'at_home': var_index(at_home),
+            'breaks': var_index(breaks),
+        }
+    )
     return (pools, fixtures, breaks, model)
 
 
-def solve_model(model, time_limit=None, num_cpus=None, debug=None):
+def solve_model(
+    model, time_limit=None, num_cpus=None, debug=None, keep_hint=False
+):
     # run the solver
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = time_limit
     solver.parameters.log_search_progress = debug
     solver.parameters.num_search_workers = num_cpus
+    if keep_hint:
+        # presolve's symmetry breaking can otherwise cut the hinted
+        # schedule off, and the search starts over from scratch
+        solver.parameters.keep_all_feasible_solutions_in_presolve = True
 
     # solution_printer = SolutionPrinter() # since we stop at first
     # solution, this isn't really
@@ -688,7 +1135,14 @@ def solution_search_model(
     time_limit=None,
     num_cpus=None,
     debug=None,
-    csv=None
+    csv=None,
+    store=None,
+    collect='value',
+    batch_size=10000,
+    queue_size=0,
+    sample='first',
+    sample_size=100,
+    seed=None
 ):
     # run the solver
     solver = cp_model.CpSolver()
@@ -697,20 +1151,149 @@ def solution_search_model(
     # cannot search with multiple CPUs
     # solver.parameters.num_search_workers = num_cpus
     # Search and print out all solutions.
-    solution_printer = VarArraySolutionPrinter(
-        fixtures, partial(get_scheduled_fixtures, pools=pools),
-        check_file_collision("list_" + csv)
+    num_matchdays = len(fixtures)
+    num_teams = len(fixtures[0])
+    sinks = solution_sinks(
+        pools,
+        num_matchdays,
+        num_teams,
+        check_file_collision("list_" + csv),
+        store=store,
+        sample=sample,
+        sample_size=sample_size,
+        seed=seed,
+        batch_size=batch_size,
+        queue_size=queue_size
     )
-    status = solver.SearchForAllSolutions(model, solution_printer)
+    if collect == 'batch':
+        # every solution is copied out of the solver in bulk and handed
+        # to the sinks a batch at a time
+        def write_batch(first_idx, batch):
+            for sink in sinks:
+                sink.write_batch(first_idx, batch)
+
+        solution_printer = BatchCollector(
+            fixture_slice(
+                fixtures, range(num_matchdays), range(num_teams),
+                range(num_teams)
+            ),
+            write_batch,
+            batch_size=batch_size
+        )
+    else:
+        solution_printer = VarArraySolutionPrinter(fixtures, sinks)
+    try:
+        status = solver.SearchForAllSolutions(model, solution_printer)
+        if collect == 'batch':
+            solution_printer.flush()
+    finally:
+        close_sinks(sinks)
     print('Solve status: %s' % solver.StatusName(status))
     print('Statistics')
     print('  - conflicts : %i' % solver.NumConflicts())
     print('  - branches  : %i' % solver.NumBranches())
     print('  - wall time : %f s' % solver.WallTime())
-    print('  - solutions found: %i' % solution_printer.solution_count())
+    print('  - solutions found: %i' % sinks[0].n_sol)
     return (solver, status)
 
 
+def search_shard(task):
+    (
+        shard, path, num_teams, num_matchdays, num_matches_per_day, num_pools,
+        max_home_stand, listall, (a, b), deadline, model_options
+    ) = task
+    (pools, fixtures, breaks, model) = cached_model_matches(
+        num_teams, num_matchdays, num_matches_per_day, num_pools,
+        max_home_stand, listall, **model_options
+    )
+    # team 0 plays team a on the first day and team b on the second
+    model.Add(fixtures[0][0][a] + fixtures[0][a][0] == 1)
+    model.Add(fixtures[1][0][b] + fixtures[1][b][0] == 1)
+    return sharded_search.search_shard(
+        model,
+        fixture_slice(fixtures, range(num_matchdays), range(num_teams),
+                      range(num_teams)),
+        path,
+        deadline=deadline
+    )
+
+
+def sharded_solution_search_model(
+    num_teams,
+    num_matchdays,
+    num_matches_per_day,
+    num_pools,
+    max_home_stand,
+    listall,
+    time_limit=None,
+    num_workers=None,
+    csv=None,
+    store=None,
+    sample='first',
+    sample_size=100,
+    seed=None,
+    model_options=None,
+    batch_size=10000,
+    queue_size=0
+):
+    if num_matchdays < 2:
+        raise ValueError('Sharding needs at least two match days.')
+    if model_options is None:
+        model_options = {}
+
+    pools = initialize_pools(num_pools, num_teams)
+    csvname = check_file_collision("list_" + csv)
+    dir_shards = sharded_search.shard_dir(csvname)
+    os.makedirs(dir_shards, exist_ok=True)
+    # --timelimit is for the whole run, however many shards it has
+    deadline = sharded_search.shard_deadline(time_limit)
+    tasks = [
+        (
+            shard, sharded_search.part_path(dir_shards, shard), num_teams,
+            num_matchdays, num_matches_per_day, num_pools, max_home_stand,
+            listall, prefix, deadline, model_options
+        ) for (shard, prefix
+              ) in enumerate(sharded_search.opponent_prefixes(num_teams))
+    ]
+
+    sinks = solution_sinks(
+        pools,
+        num_matchdays,
+        num_teams,
+        csvname,
+        store=store,
+        sample=sample,
+        sample_size=sample_size,
+        seed=seed,
+        batch_size=batch_size,
+        queue_size=queue_size,
+        echo=False
+    )
+
+    def write(idx, values):
+        for sink in sinks:
+            sink.write(idx, values)
+
+    try:
+        (solution_count, stats) = sharded_search.run_shards(
+            search_shard,
+            tasks,
+            width=num_matchdays * num_teams * num_teams,
+            write=write,
+            n_workers=num_workers
+        )
+    finally:
+        try:
+            close_sinks(sinks)
+        finally:
+            sharded_search.clear_shard_dir(dir_shards)
+
+    print('Statistics')
+    print('  - shards : %i' % len(stats))
+    print('  - solutions found: %i' % solution_count)
+    return solution_count
+
+
 def report_results(
     solver,
     status,
@@ -751,9 +1334,114 @@ def report_results(
         csv_dump_results(scheduled_games, csv)
 
 
+def portfolio_solve_model(
+    model,
+    fixtures,
+    pools,
+    time_limit=None,
+    n_runs=None,
+    seed=None,
+    csv=None,
+    keep_hint=False
+):
+    '''Minimize with a multi-seed portfolio of runs (see solver_portfolio).
+
+    Returns `(status, objective, values)`, the fixture values of the best
+    schedule as a `days x home x away` array, or `None`.
+    '''
+    runs = portfolio_runs(n_runs, seed)
+    if keep_hint:
+        # as in solve_model, so presolve keeps the hinted schedule
+        for params in runs:
+            params['keep_all_feasible_solutions_in_presolve'] = True
+    print(
+        'Portfolio of %i runs, %i workers each' %
+        (len(runs), runs[0]['num_search_workers'])
+    )
+    (status, objective, values, stats) = run_portfolio(
+        model, var_index(fixtures), runs, time_limit
+    )
+    print_portfolio_stats(stats)
+    print('Portfolio status: %s' % status)
+    report_values(status, objective, values, pools, time_limit, csv)
+    return (status, objective, values)
+
+
+def report_values(status, objective, values, pools, time_limit=None, csv=None):
+    '''report_results for a schedule given by its fixture values.'''
+    if values is None:
+        if status == 'UNKNOWN':
+            print('Not enough time allowed to compute a solution')
+            print('Add more time using the --timelimit command line option')
+        return status
+
+    print('Optimal objective value: %i' % objective)
+    scheduled_games = scheduled_fixtures(np.asarray(values).tolist(), pools)
+    screen_dump_results(scheduled_games)
+    screen_dump_poolchecks(scheduled_games, pools)
+    if status != 'OPTIMAL':
+        print(
+            'Please note that %i was not proved optimal within %i seconds.' %
+            (objective, time_limit)
+        )
+    if csv:
+        csv_dump_results(scheduled_games, csv)
+
+
+def decomposed_solve_model(
+    num_teams,
+    num_matchdays,
+    num_matches_per_day,
+    num_pools,
+    max_home_stand,
+    time_limit,
+    num_cpus=None,
+    debug=None,
+    csv=None,
+    attempts=5,
+    model_options=None
+):
+    """Minimize breaks in two phases, HAPs then opponents (see
+    decomposed_schedule).
+
+    Falls back to the monolithic model, for the time that is left, when
+    the decomposition does not apply (not every team plays every day) or
+    finds no schedule.  Returns (status, objective, values) as
+    portfolio_solve_model does.
+    """
+    if model_options is None:
+        model_options = {}
+    pools = initialize_pools(num_pools, num_teams)
+    start = perf_counter()
+    (status, objective, values) = ('UNKNOWN', None, None)
+    if decomposable(num_teams, num_matches_per_day):
+        (status, objective, values) = solve_decomposed(
+            num_teams, num_matchdays, pools, max_home_stand, time_limit,
+            num_cpus, attempts, debug
+        )
+        print('Decomposed status: %s' % status)
+    else:
+        print('The decomposition needs every team to play every day.')
+    left = time_limit - (perf_counter() - start)
+    if values is None and left > 0:
+        print('Falling back to the monolithic model')
+        (pools, fixtures, breaks, model) = cached_model_matches(
+            num_teams, num_matchdays, num_matches_per_day, num_pools,
+            max_home_stand, False, **model_options
+        )
+        model.Minimize(sum(breaks))
+        (solver, solved) = solve_model(model, left, num_cpus, debug)
+        status = solver.StatusName(solved)
+        if solved in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            objective = int(solver.ObjectiveValue())
+            values = [[[solver.Value(f) for f in row] for row in day]
+                      for day in fixtures]
+    report_values(status, objective, values, pools, time_limit, csv)
+    return (status, objective, values)
+
+
 def cpu_guess_and_gripe(cpu):
-    # ncpu = len(os.sched_getaffinity(0))
-    ncpu = 4
+    ncpu = available_cpus()
     if not cpu:
         cpu = min(6, ncpu)
     print('Setting number of search workers to %i' % cpu)
@@ -828,6 +1516,60 @@ def main():
         help='A file to dump the team assignments.  Default is output.csv'
     )
 
+    parser.add_argument(
+        '--store',
+        type=str,
+        dest='store',
+        default=None,
+        help=
+        'With --enumerate, also write every solution to this memory-mappable schedule store file (see schedule_store).  Default is no store.'
+    )
+
+    parser.add_argument(
+        '--sample',
+        type=str,
+        dest='sample',
+        choices=['all', 'first', 'reservoir', 'count'],
+        default='first',
+        help=
+        'With --enumerate, which solutions go to the CSV.  `first` writes the first --sample_size, `reservoir` a uniformly random --sample_size of all solutions found (written when the search ends), `count` only counts.  --store always gets every solution.  Default is first.'
+    )
+
+    parser.add_argument(
+        '--sample_size',
+        type=int,
+        dest='sample_size',
+        default=100,
+        help='Solutions kept by --sample first or reservoir.  Default is 100.'
+    )
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        dest='seed',
+        default=None,
+        help='Random seed for --sample reservoir.'
+    )
+
+    parser.add_argument(
+        '--queue',
+        type=int,
+        dest='queue_size',
+        default=0,
+        help=
+        'With --store, write the store on a background thread, with at most this many batches of solutions waiting to be written; the search blocks when the queue is full.  Default is 0, writing on the search thread.'
+    )
+
+    parser.add_argument(
+        '--collect',
+        type=str,
+        dest='collect',
+        choices=['value', 'batch'],
+        default='value',
+        help=
+        'With --enumerate, how solutions are read from the solver.  `value` asks for one fixture at a time.  `batch` copies every solution out of the solver response in one go and writes them a batch at a time.  Default is value.'
+    )
+
     parser.add_argument(
         '--timelimit',
         type=int,
@@ -849,6 +1591,15 @@ def main():
         '--debug', action='store_true', help="Turn on some print statements."
     )
 
+    parser.add_argument(
+        '--workers',
+        type=int,
+        dest='num_workers',
+        default=None,
+        help=
+        "With --enumerate, split the search into shards by the opponents of team 1 on the first two days and search them on this many processes.  Default is a single, unsharded search."
+    )
+
     parser.add_argument(
         '--max_home_stand',
         type=int,
@@ -858,6 +1609,70 @@ def main():
         "Maximum consecutive home or away games.  Default to 2, which means three home or away games in a row is forbidden."
     )
 
+    parser.add_argument(
+        '--haps',
+        type=str,
+        dest='haps',
+        choices=['none', 'table', 'fixed'],
+        default='none',
+        help=
+        "Use cached home/away pattern sets (see home_away_patterns), found the first time a league shape is run.  `table` limits every team to the patterns that occur in some set, in place of the home stand constraints; it needs the search to have found every set, and otherwise warns and keeps the home stand constraints.  `fixed` gives team t pattern t of set --hap_set, so only the opponents are left to the solver; the sets are sorted by total breaks, fewest first, and sets whose opponents cannot be arranged are skipped.  Default is none."
+    )
+
+    parser.add_argument(
+        '--hap_set',
+        type=int,
+        dest='hap_set',
+        default=0,
+        help=
+        "Which cached pattern set --haps fixed starts from, counting from the one with the fewest breaks; the first from there with a schedule is used.  Default is 0."
+    )
+
+    parser.add_argument(
+        '--hap_limit',
+        type=int,
+        dest='hap_limit',
+        default=1000,
+        help=
+        "Stop the pattern set search after this many sets; -1 finds them all.  --haps table only uses the sets when all of them are known.  Default is 1000."
+    )
+
+    parser.add_argument(
+        '--hap_time',
+        type=float,
+        dest='hap_time',
+        default=60,
+        help=
+        "Stop the pattern set search after this many seconds; -1 for no limit.  The search grows exponentially with the league, and a search stopped by the clock is cached and reused by runs with no longer a limit.  Default is 60."
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        dest='cache_dir',
+        default='data',
+        help="Directory for the home/away pattern cache.  Default is data."
+    )
+
+    parser.add_argument(
+        '--builder',
+        type=str,
+        dest='builder',
+        choices=['lists', 'numpy'],
+        default='numpy',
+        help=
+        "How the model is built.  `lists` slices nested lists of variables for every constraint.  `numpy` keeps the variables in index arrays and writes each constraint family from them in bulk, with far fewer constraints for the at_home links.  Both give the same solutions.  Default is numpy."
+    )
+
+    parser.add_argument(
+        '--model_cache',
+        type=str,
+        dest='model_cache',
+        default=None,
+        help=
+        "Keep built models in this directory (see model_cache), e.g. data/cache, and load them from there on later runs with the same league parameters.  Default is to build the model every run."
+    )
+
     parser.add_argument(
         '--enumerate',
         default=True,
@@ -867,7 +1682,66 @@ def main():
         "Enumerate all possible cases schedules, instead of finding just one.  This will create an absurd number of schedules for any reasonably-sized problem."
     )
 
+    parser.add_argument(
+        '--minimize',
+        action='store_false',
+        dest='listall',
+        help=
+        "Find the one schedule with the fewest breaks, instead of enumerating them all."
+    )
+
+    parser.add_argument(
+        '--portfolio',
+        type=int,
+        dest='portfolio',
+        default=None,
+        help=
+        "With --minimize, run this many independent solver processes, each with its own random seed (counting up from --seed) and search parameters, and the CPUs this process may use shared between them.  They share the best schedule: a run that another beats restarts from that schedule, looking only for fewer breaks, and all stop as soon as one proves the best optimal.  The best schedule is reported.  0 runs one per CPU.  Default is a single solver with --cpu workers."
+    )
+
+    parser.add_argument(
+        '--engine',
+        type=str,
+        dest='engine',
+        choices=['monolithic', 'decomposed'],
+        default='monolithic',
+        help=
+        "With --minimize, how the schedule is found.  `monolithic` solves the whole model at once.  `decomposed` first picks the teams' home/away patterns, then the opponents for them, with two much smaller models (see decomposed_schedule), for leagues too large for the whole model; it falls back to the whole model when it finds nothing.  Default is monolithic."
+    )
+
+    parser.add_argument(
+        '--attempts',
+        type=int,
+        dest='attempts',
+        default=5,
+        help=
+        "With --engine decomposed, how many home/away pattern sets to try after the first schedule.  Default is 5."
+    )
+
+    parser.add_argument(
+        '--hints',
+        type=str,
+        dest='hints',
+        default=None,
+        help=
+        "With --minimize and --engine monolithic, keep the best schedule of every league configuration in this directory (see schedule_hints), e.g. data/hints, and start later runs from the nearest one, repaired to fit.  The repair takes up to a quarter of --timelimit.  Default is to start from scratch."
+    )
+
     args = parser.parse_args()
+    if args.listall and args.engine != 'monolithic':
+        parser.error('--engine %s needs --minimize' % args.engine)
+    if args.portfolio is not None and args.listall:
+        parser.error('--portfolio needs --minimize')
+    if args.portfolio is not None and args.engine != 'monolithic':
+        parser.error('--portfolio needs --engine monolithic')
+    if args.num_workers is not None and not args.listall:
+        parser.error(
+            '--workers needs --enumerate; use --portfolio with --minimize'
+        )
+    if args.hints is not None and args.listall:
+        parser.error('--hints needs --minimize')
+    if args.hints is not None and args.engine != 'monolithic':
+        parser.error('--hints needs --engine monolithic')
 
     # set default for num_matchdays
     num_matches_per_day = args.num_matches_per_day
@@ -876,10 +1750,40 @@ def main():
 
     cpu = cpu_guess_and_gripe(args.cpu)
 
-    # set up the model
-    (pools, fixtures, breaks, model) = model_matches(
+    model_options = {
+        'model_cache': args.model_cache,
+        'builder': args.builder
+    }
+    if args.haps != 'none':
+        model_options.update(
+            haps=args.haps,
+            hap_set=args.hap_set,
+            hap_limit=args.hap_limit if args.hap_limit >= 0 else None,
+            cache_dir=args.cache_dir,
+            hap_time=args.hap_time if args.hap_time >= 0 else None
+        )
+
+    config = {
+        'num_teams': args.num_teams,
+        'num_matchdays': args.num_matchdays,
+        'num_matches_per_day': num_matches_per_day,
+        'num_pools': args.num_pools,
+        'max_home_stand': args.max_home_stand,
+    }
+
+    if args.engine == 'decomposed':
+        # builds its own, smaller, models
+        (status, objective, values) = decomposed_solve_model(
+            args.num_teams, args.num_matchdays, num_matches_per_day,
+            args.num_pools, args.max_home_stand, args.time_limit, cpu,
+            args.debug, args.csv, args.attempts, model_options
+        )
+        return
+
+    # set up the model, or load it from --model_cache
+    (pools, fixtures, breaks, model) = cached_model_matches(
         args.num_teams, args.num_matchdays, num_matches_per_day, args.num_pools,
-        args.max_home_stand, args.listall
+        args.max_home_stand, args.listall, **model_options
     )
 
     # pulled this out of model_matches to make it easier to collect
@@ -892,16 +1796,48 @@ def main():
 
     minimize = False
     if not args.listall:
+        time_limit = args.time_limit
+        if args.hints is not None:
+            time_limit -= warm_start(
+                model, fixtures, args.hints, config, args.time_limit / 4, cpu
+            )
         model.Minimize(sum(breaks))
 
-        (solver, status) = solve_model(model, args.time_limit, cpu, args.debug)
-        report_results(
-            solver, status, fixtures, pools, args.num_teams, args.num_matchdays,
-            args.time_limit, args.csv
+        if args.portfolio is not None:
+            (status, objective, values) = portfolio_solve_model(
+                model, fixtures, pools, time_limit, args.portfolio, args.seed,
+                args.csv, keep_hint=args.hints is not None
+            )
+        else:
+            (solver, status) = solve_model(
+                model, time_limit, cpu, args.debug,
+                keep_hint=args.hints is not None
+            )
+            objective = None
+            if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                objective = solver.ObjectiveValue()
+                values = [[[solver.Value(f) for f in row] for row in day]
+                          for day in fixtures]
+            report_results(
+                solver, status, fixtures, pools, args.num_teams,
+                args.num_matchdays, args.time_limit, args.csv
+            )
+        if args.hints is not None and objective is not None:
+            if save_hint(args.hints, config, values, int(objective)):
+                print('Saved the schedule as the hint for %s' % config)
+    elif args.num_workers is not None:
+        sharded_solution_search_model(
+            args.num_teams, args.num_matchdays, num_matches_per_day,
+            args.num_pools, args.max_home_stand, args.listall, args.time_limit,
+            args.num_workers, args.csv, args.store, args.sample,
+            args.sample_size, args.seed, model_options,
+            queue_size=args.queue_size
         )
     else:
         (solver, status) = solution_search_model(
-            model, fixtures, pools, args.time_limit, cpu, args.debug, args.csv
+            model, fixtures, pools, args.time_limit, cpu, args.debug, args.csv,
+            args.store, args.collect, queue_size=args.queue_size,
+            sample=args.sample, sample_size=args.sample_size, seed=args.seed
         )
 
 
@@ -0,0 +1,257 @@
+'''Vectorized standings simulation over a batch of schedules.
+
+Python counterpart of `ffsched::do_simulate_standings`.  Given the
+week x team matrix of points scored and an `S x W x T` array of
+opponents (0-based team positions), every schedule's wins, points-for
+and final rank are computed at once with NumPy gathers and sums.  Ranks
+order teams by wins, then points for, as in `analysis/202012.R`.
+
+The output has the layout of the `standings_sims-...parquet` files:
+`idx_sim, team, team_id, pf, w, rank`, one row per schedule and team.
+
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from schedule_codec import to_opponents
+from schedule_store import ScheduleStore
+
+
+def scores_path(league_id, league_size, season, weeks, data_dir='data'):
+    return os.path.join(
+        data_dir,
+        f'scores-league_id={league_id}-league_size={league_size}-season={season}-weeks={weeks}.csv'
+    )
+
+
+def standings_sims_path(
+    league_id, league_size, season, weeks, sims, data_dir='data'
+):
+    return os.path.join(
+        data_dir,
+        f'standings_sims-league_id={league_id}-league_size={league_size}-season={season}-weeks={weeks}-sims={sims}.parquet'
+    )
+
+
+def read_scores(path, weeks=None, cache_dir=None):
+    '''Return `(team_ids, teams, points)`, with `points` as weeks x teams.
+
+    With a `cache_dir`, the scores come from (and go into) the binary
+    cache of `scores_cache`, as `float32`.
+    '''
+    if cache_dir is not None:
+        from scores_cache import load_scores
+
+        return load_scores(path, weeks, cache_dir)[:3]
+    scores = pd.read_csv(path)
+    if weeks is not None:
+        scores = scores[scores['week'] <= weeks]
+    points = scores.pivot(index='week', columns='team_id', values='pf')
+    teams = scores.groupby('team_id')['team'].first()
+    return (
+        points.columns.to_numpy(), teams.loc[points.columns].to_numpy(),
+        points.to_numpy(dtype=np.float64)
+    )
+
+
+def read_schedules(path, n_teams, n_weeks):
+    '''Opponents (`S x n_weeks x n_teams`, 0-based) from a schedule file.
+
+    Reads a `schedules-...parquet` file, whose team ids are taken as
+    1-based positions, a `te_cli --format compact` `.npy` file or a
+    `schedule_store` file.
+    '''
+    if path.endswith('.npy'):
+        return to_opponents(np.load(path), n_teams, n_weeks)
+    if path.endswith('.sched'):
+        store = ScheduleStore(path)
+        if store.n_teams != n_teams:
+            raise ValueError(
+                f'{path} holds {store.n_teams}-team schedules, not {n_teams}.'
+            )
+        return store.opponents(n_weeks=n_weeks)
+    sched = pd.read_parquet(path).sort_values(['idx_sim', 'week', 'team_id'])
+    opps = sched['opponent_id'].to_numpy(dtype=np.int16) - 1
+    return opps.reshape(-1, n_weeks, n_teams)
+
+
+def iter_schedule_batches(path, n_teams, n_weeks, batch_size=100000):
+    '''Like `read_schedules`, but `batch_size` schedules at a time.
+
+    Stores and `.npy` files are memory-mapped and Parquet files read a
+    record batch at a time, so memory does not grow with the file.
+    '''
+    if path.endswith('.npy'):
+        codes = np.load(path, mmap_mode='r')
+        for start in range(0, codes.shape[0], batch_size):
+            yield to_opponents(codes[start:start + batch_size], n_teams, n_weeks)
+        return
+    if path.endswith('.sched'):
+        store = ScheduleStore(path)
+        if store.n_teams != n_teams:
+            raise ValueError(
+                f'{path} holds {store.n_teams}-team schedules, not {n_teams}.'
+            )
+        for start in range(0, len(store), batch_size):
+            yield store.opponents(slice(start, start + batch_size), n_weeks)
+        return
+    import pyarrow.parquet as pq
+
+    # rows come sorted by idx_sim, week and team_id, as written by
+    # `schedule_sampler` and `te_cli --format parquet`
+    rows_sim = n_weeks * n_teams
+    for batch in pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size * rows_sim, columns=['opponent_id']
+    ):
+        opps = batch.column(0).to_numpy().astype(np.int16) - 1
+        yield opps.reshape(-1, n_weeks, n_teams)
+
+
+def simulate_standings(points, opps):
+    '''Wins, points for and ranks (each `S x T`) for every schedule.'''
+    (n_weeks, n_teams) = points.shape
+    opps = opps[:, :n_weeks, :]
+    pts_opp = points[np.arange(n_weeks)[None, :, None], opps]
+    w = (points[None, :, :] > pts_opp).sum(axis=1)
+    pf = points.sum(axis=0)
+    return (w, np.broadcast_to(pf, w.shape), rank_standings(w, pf))
+
+
+def rank_standings(w, pf):
+    '''Ranks (`S x T`) from wins (`S x T`) and points for (`T`).'''
+    n_teams = w.shape[1]
+    # points for never depend on the schedule, so the tiebreak order is
+    # fixed and can be folded into a single integer key
+    pf_order = np.empty(n_teams, dtype=np.int64)
+    pf_order[np.argsort(pf, kind='stable')] = np.arange(n_teams)
+    key = w.astype(np.int64) * n_teams + pf_order[None, :]
+    rank = np.empty_like(key)
+    np.put_along_axis(
+        rank,
+        np.argsort(-key, axis=1, kind='stable'),
+        np.arange(1, n_teams + 1)[None, :],
+        axis=1
+    )
+    return rank
+
+
+def standings_table(team_ids, teams, idx_sim, w, pf, rank):
+    import pyarrow as pa
+
+    # one row per schedule and team, teams in alphabetical order
+    order = np.argsort(teams, kind='stable')
+    (n_sims, n_teams) = w.shape
+    return pa.Table.from_arrays(
+        [
+            pa.array(np.repeat(idx_sim, n_teams), pa.int32()),
+            pa.array(np.tile(teams[order], n_sims), pa.string()),
+            pa.array(
+                np.tile(team_ids[order].astype(np.float64), n_sims),
+                pa.float64()
+            ),
+            pa.array(pf[:, order].reshape(-1), pa.float64()),
+            pa.array(w[:, order].reshape(-1), pa.int32()),
+            pa.array(rank[:, order].reshape(-1), pa.int32()),
+        ],
+        names=['idx_sim', 'team', 'team_id', 'pf', 'w', 'rank']
+    )
+
+
+def write_standings_batches(path, team_ids, teams, batches):
+    '''Write `(idx_sim, w, pf, rank)` batches, one row group each.'''
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for (idx_sim, w, pf, rank) in batches:
+            table = standings_table(team_ids, teams, idx_sim, w, pf, rank)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_standings_sims(
+    path, team_ids, teams, points, opps, batch_size=100000
+):
+    n_sims = opps.shape[0]
+
+    def batches():
+        for start in range(0, n_sims, batch_size):
+            batch = opps[start:start + batch_size]
+            yield (np.arange(start + 1, start + batch.shape[0] + 1), ) + (
+                simulate_standings(points, batch)
+            )
+
+    write_standings_batches(path, team_ids, teams, batches())
+    return n_sims
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description='Simulate final standings over a set of schedules.'
+    )
+    parser.add_argument('--league_id', type=int, default=899513)
+    parser.add_argument('--league_size', type=int, default=10)
+    parser.add_argument('--season', type=int, default=2020)
+    parser.add_argument('--weeks', type=int, default=12)
+    parser.add_argument(
+        '--schedules',
+        type=str,
+        required=True,
+        help=
+        'schedules-*.parquet, te_cli --format compact .npy or schedule store .sched file.'
+    )
+    parser.add_argument(
+        '--data_dir',
+        type=str,
+        default='data',
+        help='Directory with the scores CSVs. Default is data.'
+    )
+    parser.add_argument(
+        '--scores_cache',
+        type=str,
+        default=None,
+        help=
+        'Read the scores through a binary cache in this directory (see scores_cache), e.g. data/cache. Default is to parse the CSV.'
+    )
+    parser.add_argument(
+        '--out',
+        type=str,
+        default=None,
+        help=
+        'Where to write the simulated standings. Default is data/standings_sims-...parquet.'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=100000,
+        help='Schedules simulated per batch and row group. Default is 100000.'
+    )
+    args = parser.parse_args()
+    (team_ids, teams, points) = read_scores(
+        scores_path(
+            args.league_id, args.league_size, args.season, args.weeks,
+            args.data_dir
+        ), args.weeks, args.scores_cache
+    )
+    # schedules cover the whole season, scores only the weeks played
+    opps = read_schedules(args.schedules, points.shape[1], args.weeks)
+    out = args.out
+    if out is None:
+        out = standings_sims_path(
+            args.league_id, args.league_size, args.season, args.weeks,
+            opps.shape[0], args.data_dir
+        )
+    write_standings_sims(out, team_ids, teams, points, opps, args.batch_size)
+    print(f'Wrote {opps.shape[0]} simulated standings to {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+'''Streaming summaries of simulated standings.
+
+The analysis only ever looks at simulated standings through counts: how
+often each team finishes in each place (`standings_sims_n` in
+`analysis/202012.R`), and sometimes how often it ends on each number of
+wins or above each other team.  `StandingsAggregator` keeps just those
+counts and takes the standings a batch at a time, so memory stays flat
+however many schedules go through it and the per-schedule table never
+has to be written.
+
+Batches come either straight from schedules (simulated on the way) or
+from an existing `standings_sims-...parquet` file.
+
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from standings import (
+    iter_schedule_batches, read_scores, scores_path, simulate_standings
+)
+
+
+def standings_agg_path(
+    kind, league_id, league_size, season, weeks, sims, data_dir='data'
+):
+    return os.path.join(
+        data_dir,
+        f'standings_{kind}-league_id={league_id}-league_size={league_size}-season={season}-weeks={weeks}-sims={sims}.parquet'
+    )
+
+
+class StandingsAggregator:
+    '''Team x rank counts, plus optional team x wins and "finished above".
+
+    Teams are in the column order of `read_scores`; `add` takes `S x T`
+    wins and ranks (1-based) in that order.
+    '''
+    def __init__(self, team_ids, teams, n_weeks, wins=False, pairwise=False):
+        n_teams = len(team_ids)
+        self.team_ids = np.asarray(team_ids)
+        self.teams = np.asarray(teams)
+        self.n_sims = 0
+        self.rank_counts = np.zeros((n_teams, n_teams), dtype=np.int64)
+        self.win_counts = None
+        if wins:
+            self.win_counts = np.zeros((n_teams, n_weeks + 1), dtype=np.int64)
+        # above[i, j]: how often team i finished above team j
+        self.above = None
+        if pairwise:
+            self.above = np.zeros((n_teams, n_teams), dtype=np.int64)
+
+    def add(self, w, rank):
+        (n_sims, n_teams) = rank.shape
+        team = np.broadcast_to(np.arange(n_teams), rank.shape)
+        self.rank_counts += np.bincount(
+            (team * n_teams + rank - 1).reshape(-1),
+            minlength=n_teams * n_teams
+        ).reshape(n_teams, n_teams)
+        if self.win_counts is not None:
+            n_w = self.win_counts.shape[1]
+            self.win_counts += np.bincount(
+                (team * n_w + w).reshape(-1), minlength=n_teams * n_w
+            ).reshape(n_teams, n_w)
+        if self.above is not None:
+            self.above += (rank[:, :, None] < rank[:, None, :]).sum(axis=0)
+        self.n_sims += n_sims
+
+    def merge(self, other):
+        '''Add the counts of another aggregator over the same teams.'''
+        self.rank_counts += other.rank_counts
+        if self.win_counts is not None:
+            self.win_counts += other.win_counts
+        if self.above is not None:
+            self.above += other.above
+        self.n_sims += other.n_sims
+        return self
+
+    def add_schedules(self, points, opps):
+        (w, _, rank) = simulate_standings(points, opps)
+        self.add(w, rank)
+
+    def rank_table(self):
+        '''Counts by team and rank, like `standings_sims_n`.'''
+        n_teams = len(self.team_ids)
+        n = self.rank_counts.reshape(-1)
+        return pd.DataFrame(
+            {
+                'team_id': np.repeat(self.team_ids, n_teams),
+                'team': np.repeat(self.teams, n_teams),
+                'rank': np.tile(np.arange(1, n_teams + 1), n_teams),
+                'n': n,
+                'frac': n / max(self.n_sims, 1),
+            }
+        )
+
+    def win_table(self):
+        (n_teams, n_w) = self.win_counts.shape
+        n = self.win_counts.reshape(-1)
+        return pd.DataFrame(
+            {
+                'team_id': np.repeat(self.team_ids, n_w),
+                'team': np.repeat(self.teams, n_w),
+                'w': np.tile(np.arange(n_w), n_teams),
+                'n': n,
+                'frac': n / max(self.n_sims, 1),
+            }
+        )
+
+    def above_table(self):
+        n_teams = len(self.team_ids)
+        n = self.above.reshape(-1)
+        return pd.DataFrame(
+            {
+                'team_id': np.repeat(self.team_ids, n_teams),
+                'team': np.repeat(self.teams, n_teams),
+                'other_team_id': np.tile(self.team_ids, n_teams),
+                'other_team': np.tile(self.teams, n_teams),
+                'n': n,
+                'frac': n / max(self.n_sims, 1),
+            }
+        )
+
+
+def aggregate_standings_sims(path, aggregator, batch_size=100000):
+    '''Feed a `standings_sims-...parquet` file into `aggregator`.'''
+    import pyarrow.parquet as pq
+
+    pos = {t: i for (i, t) in enumerate(aggregator.team_ids)}
+    n_teams = len(pos)
+    for batch in pq.ParquetFile(path).iter_batches(
+        batch_size=batch_size * n_teams, columns=['team_id', 'w', 'rank']
+    ):
+        team = np.array([pos[t] for t in batch.column(0).to_numpy()])
+        w = np.empty((batch.num_rows // n_teams, n_teams), dtype=np.int64)
+        rank = np.empty_like(w)
+        # rows of one simulation are consecutive, in any team order
+        row = np.arange(batch.num_rows) // n_teams
+        w[row, team] = batch.column(1).to_numpy()
+        rank[row, team] = batch.column(2).to_numpy()
+        aggregator.add(w, rank)
+    return aggregator
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description=
+        'Count simulated finishing places (and optionally wins and head-to-head finishes) per team.'
+    )
+    parser.add_argument('--league_id', type=int, default=899513)
+    parser.add_argument('--league_size', type=int, default=10)
+    parser.add_argument('--season', type=int, default=2020)
+    parser.add_argument('--weeks', type=int, default=12)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        '--schedules',
+        type=str,
+        default=None,
+        help=
+        'Simulate standings from these schedules (schedules-*.parquet, te_cli --format compact .npy or schedule store .sched file).'
+    )
+    source.add_argument(
+        '--standings',
+        type=str,
+        default=None,
+        help='Summarize an existing standings_sims-*.parquet file.'
+    )
+    parser.add_argument(
+        '--wins',
+        default=False,
+        action='store_true',
+        help='Also count final win totals per team.'
+    )
+    parser.add_argument(
+        '--pairwise',
+        default=False,
+        action='store_true',
+        help='Also count how often each team finished above each other team.'
+    )
+    parser.add_argument('--data_dir', type=str, default='data')
+    parser.add_argument(
+        '--scores_cache',
+        type=str,
+        default=None,
+        help=
+        'Read the scores through a binary cache in this directory (see scores_cache), e.g. data/cache. Default is to parse the CSV.'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=100000,
+        help='Schedules per batch. Default is 100000.'
+    )
+    args = parser.parse_args()
+    (team_ids, teams, points) = read_scores(
+        scores_path(
+            args.league_id, args.league_size, args.season, args.weeks,
+            args.data_dir
+        ), args.weeks, args.scores_cache
+    )
+    agg = StandingsAggregator(
+        team_ids,
+        teams,
+        points.shape[0],
+        wins=args.wins,
+        pairwise=args.pairwise
+    )
+    if args.standings is not None:
+        aggregate_standings_sims(args.standings, agg, args.batch_size)
+    else:
+        for opps in iter_schedule_batches(
+            args.schedules, points.shape[1], args.weeks, args.batch_size
+        ):
+            agg.add_schedules(points, opps)
+
+    tables = {'ranks': agg.rank_table()}
+    if args.wins:
+        tables['wins'] = agg.win_table()
+    if args.pairwise:
+        tables['above'] = agg.above_table()
+    for (kind, table) in tables.items():
+        path = standings_agg_path(
+            kind, args.league_id, args.league_size, args.season, args.weeks,
+            agg.n_sims, args.data_dir
+        )
+        table.to_parquet(path, index=False)
+        print(f'Wrote {kind} counts over {agg.n_sims} simulations to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+'''Incremental standings as the weeks of a season come in.
+
+Re-simulating every schedule from week 1 each time a week of scores is
+added redoes the same work over and over.  The cache keeps, per schedule
+and team, the wins so far, plus which games each team won in every week
+(bit-packed, one bit per schedule, week and team), and a hash of every
+week's scores.  On the next run only the weeks whose hash changed (new
+weeks, or earlier weeks that were corrected) are simulated: their old
+wins come off the running totals and the new ones go on, and ranks are
+recomputed from the totals in one vectorized pass.
+
+The cache belongs to one set of schedules and teams; if either changes,
+it is rebuilt from scratch.
+
+'''
+import argparse
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from standings import (
+    rank_standings, read_schedules, read_scores, scores_path,
+    standings_sims_path, write_standings_batches
+)
+
+
+def standings_cache_path(
+    league_id, league_size, season, sims, data_dir='data'
+):
+    return os.path.join(
+        data_dir,
+        f'standings_cache-league_id={league_id}-league_size={league_size}-season={season}-sims={sims}.npz'
+    )
+
+
+def week_hashes(points):
+    return np.array(
+        [
+            hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest()
+            for row in np.ascontiguousarray(points, dtype=np.float64)
+        ],
+        dtype='U16'
+    )
+
+
+def schedules_hash(opps):
+    data = np.ascontiguousarray(opps, dtype=np.int16)
+    digest = hashlib.blake2b(data.tobytes(), digest_size=16)
+    digest.update(str(data.shape).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def empty_cache(team_ids, opps):
+    (n_sims, _, n_teams) = opps.shape
+    return {
+        'team_ids': np.asarray(team_ids),
+        'schedules': schedules_hash(opps),
+        'hashes': np.zeros(0, dtype='U16'),
+        'wins': np.zeros((n_sims, 0, (n_teams + 7) // 8), dtype=np.uint8),
+        'w': np.zeros((n_sims, n_teams), dtype=np.int16),
+    }
+
+
+def load_standings_cache(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        cache = {k: f[k] for k in f.files}
+    cache['schedules'] = str(cache['schedules'])
+    return cache
+
+
+def save_standings_cache(path, cache):
+    # write a temporary file of our own, then rename, so a crash never
+    # leaves a half-written cache and concurrent writers never share one
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False
+    ) as f:
+        np.savez(f, **cache)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f.name, path)
+
+
+def week_wins(points, opps, weeks):
+    '''Who won in each of `weeks`, as `S x len(weeks) x T` booleans.'''
+    weeks = np.asarray(weeks, dtype=np.int64)
+    pts = points[weeks]
+    pts_opp = pts[np.arange(len(weeks))[None, :, None], opps[:, weeks, :]]
+    return pts[None, :, :] > pts_opp
+
+
+def update_standings(cache, team_ids, points, opps):
+    '''Bring `cache` up to date with `points` (weeks x teams).
+
+    Returns `(cache, weeks)`, with the 0-based weeks that were simulated.
+    A `cache` of `None`, or one for other teams or schedules, starts over.
+    '''
+    n_teams = points.shape[1]
+    if (
+        cache is None or not np.array_equal(cache['team_ids'], team_ids)
+        or cache['schedules'] != schedules_hash(opps)
+    ):
+        cache = empty_cache(team_ids, opps)
+    old = cache['hashes']
+    new = week_hashes(points)
+    n_keep = min(len(old), len(new))
+    same = np.zeros(len(old), dtype=bool)
+    same[:n_keep] = old[:n_keep] == new[:n_keep]
+    stale = np.flatnonzero(~same)
+    fresh = np.array(
+        [k for k in range(len(new)) if k >= len(old) or not same[k]],
+        dtype=np.int64
+    )
+
+    w = cache['w'].astype(np.int64)
+    if len(stale):
+        gone = np.unpackbits(
+            cache['wins'][:, stale], axis=-1, count=n_teams
+        ).astype(bool)
+        w -= gone.sum(axis=1)
+    wins = np.zeros((w.shape[0], len(new), cache['wins'].shape[2]), np.uint8)
+    keep = np.flatnonzero(same)
+    wins[:, keep] = cache['wins'][:, keep]
+    if len(fresh):
+        won = week_wins(points, opps, fresh)
+        w += won.sum(axis=1)
+        wins[:, fresh] = np.packbits(won, axis=-1)
+
+    cache = dict(
+        cache, hashes=new, wins=wins, w=w.astype(cache['w'].dtype)
+    )
+    return (cache, fresh)
+
+
+def cached_standings(cache, points):
+    '''Wins, points for and ranks (each `S x T`) from an updated cache.'''
+    w = cache['w']
+    pf = points.sum(axis=0)
+    return (w, np.broadcast_to(pf, w.shape), rank_standings(w, pf))
+
+
+def main():
+    '''Entry point of the program.'''
+    parser = argparse.ArgumentParser(
+        description=
+        'Update simulated standings with the weeks of scores that are new or changed.'
+    )
+    parser.add_argument('--league_id', type=int, default=899513)
+    parser.add_argument('--league_size', type=int, default=10)
+    parser.add_argument('--season', type=int, default=2020)
+    parser.add_argument(
+        '--weeks',
+        type=int,
+        default=12,
+        help='Weeks in the season (and the schedules). Default is 12.'
+    )
+    parser.add_argument(
+        '--schedules',
+        type=str,
+        required=True,
+        help=
+        'schedules-*.parquet, te_cli --format compact .npy or schedule store .sched file.'
+    )
+    parser.add_argument('--data_dir', type=str, default='data')
+    parser.add_argument(
+        '--scores_cache',
+        type=str,
+        default=None,
+        help=
+        'Read the scores through a binary cache in this directory (see scores_cache), e.g. data/cache. Default is to parse the CSV.'
+    )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        default=None,
+        help='Standings cache file. Default is data/standings_cache-...npz.'
+    )
+    parser.add_argument(
+        '--out',
+        type=str,
+        default=None,
+        help=
+        'Where to write the simulated standings. Default is data/standings_sims-...parquet.'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=100000,
+        help='Schedules per row group. Default is 100000.'
+    )
+    args = parser.parse_args()
+    (team_ids, teams, points) = read_scores(
+        scores_path(
+            args.league_id, args.league_size, args.season, args.weeks,
+            args.data_dir
+        ), args.weeks, args.scores_cache
+    )
+    opps = read_schedules(args.schedules, points.shape[1], args.weeks)
+    n_sims = opps.shape[0]
+    path_cache = args.cache
+    if path_cache is None:
+        path_cache = standings_cache_path(
+            args.league_id, args.league_size, args.season, n_sims,
+            args.data_dir
+        )
+    (cache, weeks) = update_standings(
+        load_standings_cache(path_cache), team_ids, points, opps
+    )
+    save_standings_cache(path_cache, cache)
+    print(
+        'Simulated weeks %s of %i' %
+        ([int(k) + 1 for k in weeks], points.shape[0])
+    )
+
+    (w, pf, rank) = cached_standings(cache, points)
+    out = args.out
+    if out is None:
+        out = standings_sims_path(
+            args.league_id, args.league_size, args.season, args.weeks,
+            n_sims, args.data_dir
+        )
+    write_standings_batches(
+        out, team_ids, teams, (
+            (
+                np.arange(start + 1, min(start + args.batch_size, n_sims) + 1),
+                w[start:start + args.batch_size],
+                pf[start:start + args.batch_size],
+                rank[start:start + args.batch_size]
+            ) for start in range(0, n_sims, args.batch_size)
+        )
+    )
+    print(f'Wrote {n_sims} simulated standings to {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,33 @@
 import argparse
 import os
-import csv
 import re
-from functools import partial
+from time import perf_counter
 from ortools.sat.python import cp_model
 
+from checkpoint import (
+    check_params, checkpoint_path, load_checkpoint, save_checkpoint
+)
+from factorizations import (
+    BUILD_LIMIT, catalogue_path, iter_catalogue_schedules, load_catalogue
+)
+from round_robin import directed_pairs, iter_schedules
+from schedule_count import count_te_schedules
+from schedule_sinks import (
+    CompactSink, CsvSink, NullSink, ParquetSink, StoreSink, ThreadedSink,
+    sample_sink
+)
+from solution_batches import BatchCollector
+import sharded_search
+
 
 class SolutionPrinter(cp_model.CpSolverSolutionCallback):
     def __init__(
-        self,
-        games,
-        n_t,
-        n_w,
-        getter,
-        n_show=2,
-        limit=100,
-        path_csv='output.csv',
-        verbose=True
+        self, games, n_t, n_w, sink, n_show=2, limit=100, verbose=True
     ):
         cp_model.CpSolverSolutionCallback.__init__(self)
         self._games = games
-        self._getter = getter
+        self._vars = list(games.values())
+        self._sink = sink
         self._n_t = n_t
         self._n_w = n_w
         self._n_show = n_show
@@ -28,7 +35,6 @@ class SolutionPrinter(cp_model.CpSolverSolutionCallback):
         self._n_sol = 0
         self._limit = limit
         self._verbose = verbose
-        self._writer = self.get_csv_writer(path_csv)
 
     def on_solution_callback(self):
         self._n_sol += 1
@@ -47,74 +53,105 @@ class SolutionPrinter(cp_model.CpSolverSolutionCallback):
                             (t1, t2, self.Value(self._games[(t1, t2)]))
                         )
 
-        sol = self._getter(solver=self, games=self._games)
-        for row in sol:
-            # line = ', '.join(['%s=%i' % (k, v) for (k, v) in row.items()])
-            # line = ', '.join([f'{k}={str(v)}' for (k, v) in row.items()])
-            # line = f'idx={str(i+1)}, ' + line
-            # print(line)
-            # print(f'solution: {self._n_sol}')
-            self._writer.writerow(row)
-
-        # self._writer.writerow({})
+        self._sink.write(self._n_sol, [self.Value(v) for v in self._vars])
 
     def n_sol(self):
         return self._n_sol
 
-    def get_csv_writer(self, path):
-        self._path_csv = open(path, 'w', newline='')
-        fields = ['idx', 'tm1', 'tm2', 'wk']
-        writer = csv.DictWriter(self._path_csv, fieldnames=fields)
-        writer.writeheader()
-        return writer
+    def close(self):
+        self._sink.close()
 
 
-def coalesce_idx(solver):
-    if solver is None:
-        return 0
-    return solver._n_sol
+class SolutionCounter(cp_model.CpSolverSolutionCallback):
+    def __init__(self):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._n_sol = 0
 
+    def on_solution_callback(self):
+        self._n_sol += 1
 
-def get_assigned_games(solver, games):
-    assigned_games = [
-        {
-            'idx': coalesce_idx(solver),
-            'tm1': t1,
-            'tm2': t2,
-            'wk': solver.Value(games[(t1, t2)])
-        } for t1, t2 in games.keys()
-    ]
-    return assigned_games
+    def n_sol(self):
+        return self._n_sol
 
 
-def check_file_collision(name):
+def check_file_collision(name, ext='.csv'):
     # check for any existing file
     idx = 1
-    match = re.search(r'\.csv', name)
+    match = re.search(re.escape(ext) + '$', name)
     if not match:
-        name += '.csv'
+        name += ext
 
     res = name
     while os.path.exists(res):
-        res = re.sub(r'\.csv', '_{}.csv'.format(idx), name)
+        res = re.sub(re.escape(ext) + '$', '_{}{}'.format(idx, ext), name)
         idx += 1
     return res
 
 
-# def csv_dump_results(games, name):
+SINK_EXTENSIONS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'compact': '.npy',
+    'store': '.sched',
+}
 
-#     path = check_file_collision(name)
-#     with open(path, 'w', newline='') as file:
-#         fields = ['tm1', 'tm2', 'wk']
-#         # fields = ['idx', 'tm1', 'tm2', 'wk']
-#         writer = csv.DictWriter(file, fieldnames=fields)
 
-#         writer.writeheader()
-#         for row in games:
-#             writer.writerow(row)
-#         # for i, row in games.items():
-#         #     writer.writerow([i, row])
-#     return path
+def make_sink(
+    fmt,
+    name,
+    pairs,
+    n_t,
+    n_w,
+    n_weeks=None,
+    batch_size=10000,
+    path=None,
+    offset=None,
+    queue_size=0,
+    sample=None,
+    sample_size=100,
+    seed=None
+):
+    if sample == 'count':
+        return NullSink(echo=True)
+    sink = make_format_sink(
+        fmt, name, pairs, n_t, n_w, n_weeks, batch_size, path, offset
+    )
+    if sample not in (None, 'all'):
+        # sample before the queue, so only kept solutions are queued
+        return sample_sink(
+            ThreadedSink(sink, max_batches=queue_size, batch_size=batch_size)
+            if queue_size else sink, sample, sample_size, seed
+        )
+    if queue_size:
+        return ThreadedSink(sink, max_batches=queue_size, batch_size=batch_size)
+    return sink
+
+
+def make_format_sink(
+    fmt, name, pairs, n_t, n_w, n_weeks, batch_size, path, offset
+):
+    if fmt not in SINK_EXTENSIONS:
+        raise ValueError(f'Unknown output format {fmt}.')
+    if path is None:
+        path = check_file_collision(name, SINK_EXTENSIONS[fmt])
+    if offset is not None and fmt not in ('csv', 'store'):
+        raise ValueError(f'Cannot resume writing {fmt} output.')
+    if fmt == 'csv':
+        return CsvSink(path, pairs, offset=offset)
+    if fmt == 'parquet':
+        return ParquetSink(
+            path,
+            pairs,
+            n_t=n_t,
+            n_w=n_w,
+            n_weeks=n_weeks,
+            batch_size=batch_size
+        )
+    if fmt == 'compact':
+        return CompactSink(path, pairs, n_t=n_t, batch_size=batch_size)
+    return StoreSink(
+        path, pairs, n_t=n_t, n_w=n_w, batch_size=batch_size, offset=offset
+    )
 
 
 def model_games(n_t=3, n_w=None):
@@ -152,23 +189,64 @@ def solution_search_model(
     limit=100,
     time=None,
     verbose=None,
-    name=None
+    name=None,
+    fmt='csv',
+    n_weeks=None,
+    batch_size=10000,
+    collect='value',
+    queue_size=0,
+    sample=None,
+    sample_size=100,
+    seed=None
 ):
 
     solver = cp_model.CpSolver()
     solver.parameters.max_time_in_seconds = time
     # solver.parameters.log_search_progress = verbose
-    printer = SolutionPrinter(
-        games=games,
+    pairs = list(games.keys())
+    sink = make_sink(
+        fmt=fmt,
+        name=name,
+        pairs=pairs,
         n_t=n_t,
         n_w=n_w,
-        n_show=n_show,
-        limit=limit,
-        verbose=verbose,
-        getter=partial(get_assigned_games, games=games),
-        path_csv=check_file_collision(name)
+        n_weeks=n_weeks,
+        batch_size=batch_size,
+        queue_size=queue_size,
+        sample=sample,
+        sample_size=sample_size,
+        seed=seed
     )
-    status = solver.SearchForAllSolutions(model, printer)
+    if collect == 'batch':
+
+        def write_batch(first_idx, batch):
+            for (i, wks) in enumerate(batch[:max(n_show - first_idx + 1, 0)]):
+                print('Solution %i' % (first_idx + i))
+                for ((t1, t2), wk) in zip(pairs, wks):
+                    print('Team %i plays team %i in week %i' % (t1, t2, wk))
+            sink.write_batch(first_idx, batch)
+
+        printer = BatchCollector(
+            games.values(), write_batch, batch_size=batch_size, limit=limit
+        )
+    else:
+        printer = SolutionPrinter(
+            games=games,
+            n_t=n_t,
+            n_w=n_w,
+            n_show=n_show,
+            limit=limit,
+            verbose=verbose,
+            sink=sink
+        )
+    try:
+        status = solver.SearchForAllSolutions(model, printer)
+        if collect == 'batch':
+            printer.flush()
+            if printer.n_sol() >= limit:
+                print(f'Stopping search after {limit} solutions.')
+    finally:
+        sink.close()
 
     print('Solve status: %s' % solver.StatusName(status))
     print('Statistics')
@@ -179,6 +257,236 @@ def solution_search_model(
     return (solver, status)
 
 
+def solution_search_direct(
+    n_t,
+    n_w,
+    n_show=2,
+    limit=100,
+    time=None,
+    name=None,
+    fmt='csv',
+    n_weeks=None,
+    batch_size=10000,
+    engine='direct',
+    cache_dir='data',
+    queue_size=0,
+    sample=None,
+    sample_size=100,
+    seed=None
+):
+    if n_w != n_t - 1:
+        raise ValueError(
+            f'The {engine} engine only builds single round robins.'
+        )
+
+    if (
+        engine == 'catalogue' and n_t > BUILD_LIMIT
+        and not os.path.exists(catalogue_path(n_t, cache_dir))
+    ):
+        # building one would never finish; direct yields the same schedules
+        print(
+            f'No {catalogue_path(n_t, cache_dir)}, and catalogues are only '
+            f'built up to {BUILD_LIMIT} teams: using --engine direct instead.'
+        )
+        engine = 'direct'
+    if engine == 'catalogue':
+        # small catalogues are built on first use, larger ones must be cached
+        schedules = iter_catalogue_schedules(
+            load_catalogue(n_t, cache_dir, build=n_t <= BUILD_LIMIT)
+        )
+    else:
+        schedules = iter_schedules(n_t)
+    pairs = directed_pairs(n_t)
+    sink = make_sink(
+        fmt=fmt,
+        name=name,
+        pairs=pairs,
+        n_t=n_t,
+        n_w=n_w,
+        n_weeks=n_weeks,
+        batch_size=batch_size,
+        queue_size=queue_size,
+        sample=sample,
+        sample_size=sample_size,
+        seed=seed
+    )
+    start = perf_counter()
+    n_sol = 0
+    try:
+        for wks in schedules:
+            n_sol += 1
+            if n_sol <= n_show:
+                print('Solution %i' % n_sol)
+                for ((t1, t2), wk) in zip(pairs, wks):
+                    print('Team %i plays team %i in week %i' % (t1, t2, wk))
+            sink.write(n_sol, wks)
+            if n_sol >= limit:
+                print(f'Stopping search after {limit} solutions.')
+                break
+            if time is not None and n_sol % 1000 == 0 and perf_counter(
+            ) - start >= time:
+                print(f'Stopping search after {time} seconds.')
+                break
+    finally:
+        sink.close()
+
+    print('Statistics')
+    print('  - wall time : %f s' % (perf_counter() - start))
+    print('  - solutions found: %i' % n_sol)
+    return n_sol
+
+
+def search_shard(task):
+    (shard, path, n_t, n_w, (a, b), limit, deadline) = task
+    (model, games) = model_games(n_t=n_t, n_w=n_w)
+    model.Add(games[(0, a)] == 1)
+    model.Add(games[(0, b)] == 2)
+    return sharded_search.search_shard(
+        model, games.values(), path, limit=limit, deadline=deadline
+    )
+
+
+def solution_search_sharded(
+    n_t,
+    n_w,
+    n_show=2,
+    limit=100,
+    time=None,
+    name=None,
+    fmt='csv',
+    n_weeks=None,
+    batch_size=10000,
+    n_workers=None,
+    resume=False,
+    queue_size=0,
+    sample=None,
+    sample_size=100,
+    seed=None
+):
+    pairs = directed_pairs(n_t)
+    params = {'n_t': n_t, 'n_w': n_w, 'fmt': fmt, 'limit': limit}
+    path_ckpt = checkpoint_path(name)
+    state = load_checkpoint(path_ckpt) if resume else None
+    if state is None:
+        if resume:
+            print(f'No checkpoint at {path_ckpt}, starting from scratch.')
+        state = {
+            'path': check_file_collision(name, SINK_EXTENSIONS[fmt]),
+            'params': params,
+            'n_sol': 0,
+            'completed': [],
+            'offset': None,
+        }
+    else:
+        check_params(state, params)
+        print(
+            'Resuming %s after %i solutions, %i shards done.' %
+            (state['path'], state['n_sol'], len(state['completed']))
+        )
+    if state['n_sol'] >= limit:
+        print('Checkpoint has already reached the solution limit.')
+        return state['n_sol']
+
+    sink = make_sink(
+        fmt=fmt,
+        name=name,
+        pairs=pairs,
+        n_t=n_t,
+        n_w=n_w,
+        n_weeks=n_weeks,
+        batch_size=batch_size,
+        path=state['path'],
+        offset=state['offset'],
+        queue_size=queue_size,
+        sample=sample,
+        sample_size=sample_size,
+        seed=seed
+    )
+    # sampled output depends on the whole run, so only plain csv and
+    # store output can be checkpointed
+    resumable = fmt in ('csv', 'store') and sample in (None, 'all')
+
+    def write(idx, wks):
+        if idx <= n_show:
+            print('Solution %i' % idx)
+            for ((t1, t2), wk) in zip(pairs, wks):
+                print('Team %i plays team %i in week %i' % (t1, t2, wk))
+        sink.write(idx, wks)
+
+    def on_shard_done(shard, n_sol, status):
+        if not resumable:
+            return
+        # an incomplete shard only gets here if it reached the limit,
+        # which ends the run: a resume then has nothing left to do
+        state['n_sol'] = n_sol
+        state['completed'].append(shard)
+        state['offset'] = sink.offset()
+        save_checkpoint(path_ckpt, state)
+
+    dir_shards = sharded_search.shard_dir(name)
+    os.makedirs(dir_shards, exist_ok=True)
+    completed = set(state['completed'])
+    # --time is for the whole run, however many shards it has
+    deadline = sharded_search.shard_deadline(time)
+    tasks = [
+        (
+            shard, sharded_search.part_path(dir_shards, shard), n_t, n_w,
+            prefix, limit, deadline
+        ) for (shard,
+               prefix) in enumerate(sharded_search.opponent_prefixes(n_t))
+        if shard not in completed
+    ]
+    try:
+        (n_sol, stats) = sharded_search.run_shards(
+            search_shard,
+            tasks,
+            width=len(pairs),
+            write=write,
+            n_workers=n_workers,
+            limit=limit,
+            n_sol=state['n_sol'],
+            on_shard_done=on_shard_done,
+            keep_partial=not resumable
+        )
+    finally:
+        sink.close()
+        sharded_search.clear_shard_dir(dir_shards)
+
+    print('Statistics')
+    print('  - shards : %i' % (len(stats) + len(completed)))
+    print('  - solutions found: %i' % n_sol)
+    return n_sol
+
+
+def count_solutions(n_t, n_w, check=False, time=None, cache_dir='data'):
+    start = perf_counter()
+    (n_sol, how) = count_te_schedules(n_t, n_w, cache_dir)
+    print(
+        '%i schedules for %i teams over %i weeks (%s, %f s)' %
+        (n_sol, n_t, n_w, how, perf_counter() - start)
+    )
+    if not check:
+        return n_sol
+
+    (model, games) = model_games(n_t=n_t, n_w=n_w)
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time
+    counter = SolutionCounter()
+    status = solver.SearchForAllSolutions(model, counter)
+    if status not in (cp_model.OPTIMAL, cp_model.INFEASIBLE):
+        print(
+            'CP-SAT enumeration did not finish (%s) after %i solutions.' %
+            (solver.StatusName(status), counter.n_sol())
+        )
+    elif counter.n_sol() != n_sol:
+        raise AssertionError(
+            f'CP-SAT enumerated {counter.n_sol()} schedules, not {n_sol}.'
+        )
+    else:
+        print('CP-SAT enumeration agrees (%f s)' % solver.WallTime())
+    return n_sol
+
+
 def report_results(solver, status, games, time, name=None):
 
     if status == cp_model.INFEASIBLE:
@@ -191,14 +499,11 @@ def report_results(solver, status, games, time, name=None):
 
     print('Optimal objective value: %i' % solver.ObjectiveValue())
 
-    # assigned_games = get_assigned_games(solver=solver, games=games)
     if status != cp_model.OPTIMAL and solver.WallTime() >= time:
         print(f'Solver reached maximum time allowed {time}.')
         print(
             'A better solution might be found by adding more time using the --time command line option'
         )
-    # if name:
-    #     csv_dump_results(games=assigned_games, name=name)
     return status
 
 
@@ -207,6 +512,46 @@ def main():
     parser = argparse.ArgumentParser(
         description='Solve sports league match play assignment problem.'
     )
+    subparsers = parser.add_subparsers(dest='command')
+    count_parser = subparsers.add_parser(
+        'count',
+        help=
+        'Print the exact number of schedules, without enumerating them (see schedule_count).'
+    )
+    count_parser.add_argument(
+        '--teams',
+        type=int,
+        dest='n_t',
+        default=10,
+        help='Number of teams in the league'
+    )
+    count_parser.add_argument(
+        '--weeks',
+        type=int,
+        dest='n_w',
+        default=None,
+        help='Number of weeks to fit the games in. Default is teams - 1.'
+    )
+    count_parser.add_argument(
+        '--check',
+        default=False,
+        action='store_true',
+        help='Also count the schedules by CP-SAT enumeration, and fail if the counts differ.'
+    )
+    count_parser.add_argument(
+        '--time',
+        type=int,
+        dest='time',
+        default=600,
+        help='Maximum run time for --check, in seconds. Default is 600.'
+    )
+    count_parser.add_argument(
+        '--cache_dir',
+        type=str,
+        dest='cache_dir',
+        default='data',
+        help='Directory for cached 1-factorization catalogues. Default is data.'
+    )
     parser.add_argument(
         '--teams',
         type=int,
@@ -256,6 +601,114 @@ def main():
         help='How many solutions to print out if `all=True`. Default is 2.'
     )
 
+    parser.add_argument(
+        '--engine',
+        type=str,
+        dest='engine',
+        choices=['cpsat', 'direct', 'catalogue'],
+        default='cpsat',
+        help=
+        'How to enumerate schedules. `direct` builds round robins by backtracking, without CP-SAT. `catalogue` expands the cached non-isomorphic 1-factorizations; it builds them itself only up to 8 teams, so larger leagues need a catalogue file in --cache_dir, and fall back to `direct` without one (the count subcommand still counts them exactly). Default is cpsat.'
+    )
+
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        dest='cache_dir',
+        default='data',
+        help='Directory for cached 1-factorization catalogues. Default is data.'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        dest='n_workers',
+        default=None,
+        help=
+        'Split the CP-SAT enumeration into shards by the opponents of team 0 in the first two weeks and search them on this many processes. Sharded runs checkpoint after every shard (csv and store output). Default is a single, unsharded search.'
+    )
+
+    parser.add_argument(
+        '--resume',
+        default=False,
+        action='store_true',
+        help=
+        'With --workers, continue from the checkpoint left by an earlier run with the same --name. Needs --workers, --engine cpsat and --format csv or store.'
+    )
+
+    parser.add_argument(
+        '--format',
+        type=str,
+        dest='fmt',
+        choices=['csv', 'parquet', 'compact', 'store'],
+        default='csv',
+        help=
+        'Output format. `parquet` writes batched row groups laid out like the schedules-*.parquet files. `compact` saves one uint8 week per unordered pair and schedule as an .npy array (see schedule_codec). `store` writes the same rows to a memory-mappable .sched file (see schedule_store). Default is csv.'
+    )
+
+    parser.add_argument(
+        '--weeks',
+        type=int,
+        dest='n_weeks',
+        default=None,
+        help=
+        'Number of season weeks to write with `--format parquet`, repeating the round robin as needed. Default is the number of round robin weeks.'
+    )
+
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        dest='batch_size',
+        default=10000,
+        help=
+        'Solutions buffered per write with --format parquet, compact or store. Default is 10000.'
+    )
+
+    parser.add_argument(
+        '--collect',
+        type=str,
+        dest='collect',
+        choices=['value', 'batch'],
+        default='value',
+        help=
+        'How the CP-SAT engine reads solutions. `value` asks the solver for one variable at a time. `batch` copies every solution out of the solver response in one go and hands --batch_size solutions at a time to the output. Default is value.'
+    )
+
+    parser.add_argument(
+        '--sample',
+        type=str,
+        dest='sample',
+        choices=['all', 'first', 'reservoir', 'count'],
+        default='all',
+        help=
+        'Which solutions to write. `first` writes the first --sample_size, `reservoir` a uniformly random --sample_size of all solutions found (written when the search ends), and `count` writes nothing and only counts. Default is all.'
+    )
+
+    parser.add_argument(
+        '--sample_size',
+        type=int,
+        dest='sample_size',
+        default=100,
+        help='Solutions kept by --sample first or reservoir. Default is 100.'
+    )
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        dest='seed',
+        default=None,
+        help='Random seed for --sample reservoir.'
+    )
+
+    parser.add_argument(
+        '--queue',
+        type=int,
+        dest='queue_size',
+        default=0,
+        help=
+        'Write output on a background thread, with at most this many batches of --batch_size solutions waiting to be written; the search blocks when the queue is full. Default is 0, writing on the search thread.'
+    )
+
     parser.add_argument(
         '--verbose',
         default=False,
@@ -263,6 +716,15 @@ def main():
         help='Turn on some print statements.'
     )
     args = parser.parse_args()
+    if args.command == 'count':
+        count_solutions(
+            n_t=args.n_t,
+            n_w=args.n_w if args.n_w is not None else args.n_t - 1,
+            check=args.check,
+            time=args.time,
+            cache_dir=args.cache_dir
+        )
+        return
     n_t = args.n_t
     n_w = n_t - 1
     time = args.time
@@ -271,6 +733,52 @@ def main():
     if name is None:
         name = f'output-n_tm={n_t}-time={time}-limit={limit}'
     verbose = args.verbose
+    if args.engine != 'cpsat' and args.n_workers is not None:
+        parser.error(f'--workers needs --engine cpsat, not {args.engine}.')
+    if args.resume and args.n_workers is None:
+        parser.error(
+            '--resume needs --workers: only sharded runs leave checkpoints.'
+        )
+    if args.resume and args.fmt not in ('csv', 'store'):
+        parser.error(f'--resume needs --format csv or store, not {args.fmt}.')
+    if args.engine in ('direct', 'catalogue'):
+        solution_search_direct(
+            n_t=n_t,
+            n_w=n_w,
+            n_show=args.n_show,
+            limit=limit,
+            time=time,
+            name=name,
+            fmt=args.fmt,
+            n_weeks=args.n_weeks,
+            batch_size=args.batch_size,
+            engine=args.engine,
+            cache_dir=args.cache_dir,
+            queue_size=args.queue_size,
+            sample=args.sample,
+            sample_size=args.sample_size,
+            seed=args.seed
+        )
+        return
+    if args.n_workers is not None:
+        solution_search_sharded(
+            n_t=n_t,
+            n_w=n_w,
+            n_show=args.n_show,
+            limit=limit,
+            time=time,
+            name=name,
+            fmt=args.fmt,
+            n_weeks=args.n_weeks,
+            batch_size=args.batch_size,
+            n_workers=args.n_workers,
+            resume=args.resume,
+            queue_size=args.queue_size,
+            sample=args.sample,
+            sample_size=args.sample_size,
+            seed=args.seed
+        )
+        return
     (model, games) = model_games(n_t=n_t, n_w=n_w)
     (solver, status) = solution_search_model(
         model=model,
@@ -281,7 +789,15 @@ def main():
         limit=limit,
         time=time,
         verbose=verbose,
-        name=name
+        name=name,
+        fmt=args.fmt,
+        n_weeks=args.n_weeks,
+        batch_size=args.batch_size,
+        collect=args.collect,
+        queue_size=args.queue_size,
+        sample=args.sample,
+        sample_size=args.sample_size,
+        seed=args.seed
     )
     report_results(
         solver=solver, status=status, games=games, time=time, name=name
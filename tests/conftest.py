@@ -0,0 +1,5 @@
+'''The modules live flat in src/, and import each other that way.'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
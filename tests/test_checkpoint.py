@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from checkpoint import (
+    check_params, checkpoint_path, load_checkpoint, save_checkpoint
+)
+
+
+def test_round_trip(tmp_path):
+    path = checkpoint_path(str(tmp_path / 'output.csv'))
+    assert load_checkpoint(path) is None
+    state = {
+        'params': {'n_t': 6, 'fmt': 'csv'},
+        'done': [0, 2, 3],
+        'n_sol': 720,
+        'offset': 12345,
+    }
+    save_checkpoint(path, state)
+    assert load_checkpoint(path) == state
+    state['done'].append(1)
+    save_checkpoint(path, state)
+    assert load_checkpoint(path) == state
+    assert os.listdir(tmp_path) == ['output.csv.ckpt.json']
+
+
+def test_check_params():
+    state = {'params': {'n_t': 6, 'fmt': 'csv'}}
+    check_params(state, {'n_t': 6})
+    with pytest.raises(ValueError, match='n_t=6, not 8'):
+        check_params(state, {'n_t': 8})
+    with pytest.raises(ValueError, match='seed=None'):
+        check_params(state, {'seed': 1})
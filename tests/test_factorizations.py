@@ -0,0 +1,37 @@
+import pytest
+
+from factorizations import (
+    BUILD_LIMIT, build_catalogue, count_schedules, iter_catalogue_schedules,
+    load_catalogue
+)
+from round_robin import iter_schedules
+
+
+@pytest.mark.parametrize('n_t, classes, count', [(4, 1, 6), (6, 1, 720)])
+def test_catalogue_counts(n_t, classes, count):
+    catalogue = build_catalogue(n_t)
+    assert len(catalogue['classes']) == classes
+    assert count_schedules(catalogue) == count
+
+
+def test_catalogue_expands_to_every_schedule_once():
+    schedules = list(iter_catalogue_schedules(build_catalogue(6)))
+    assert len(schedules) == 720
+    assert set(schedules) == set(iter_schedules(6))
+
+
+def test_catalogue_round_trips_through_the_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    with pytest.raises(FileNotFoundError):
+        load_catalogue(6, cache_dir)
+    built = load_catalogue(6, cache_dir, build=True)
+    loaded = load_catalogue(6, cache_dir)
+    assert loaded == built
+    assert list(iter_catalogue_schedules(loaded)) == list(
+        iter_catalogue_schedules(built)
+    )
+
+
+def test_large_catalogues_are_never_built():
+    with pytest.raises(ValueError):
+        build_catalogue(BUILD_LIMIT + 2)
@@ -0,0 +1,47 @@
+import pytest
+from ortools.sat.python import cp_model
+
+import te_cli
+from round_robin import directed_pairs, iter_schedules
+
+
+def is_round_robin(wks, n_t):
+    '''Each team plays once a week, and each pair once, both ways alike.'''
+    week = dict(zip(directed_pairs(n_t), wks))
+    if any(week[(t1, t2)] != week[(t2, t1)] for (t1, t2) in week):
+        return False
+    return all(
+        sorted(week[(t, u)] for u in range(n_t) if u != t) == list(
+            range(1, n_t)
+        ) for t in range(n_t)
+    )
+
+
+@pytest.mark.parametrize('n_t, count', [(2, 1), (4, 6), (6, 720)])
+def test_every_schedule_once(n_t, count):
+    schedules = list(iter_schedules(n_t))
+    assert len(schedules) == len(set(schedules)) == count
+    assert all(is_round_robin(wks, n_t) for wks in schedules)
+
+
+def test_same_schedules_as_cp_sat():
+    (model, games) = te_cli.model_games(n_t=4, n_w=3)
+    found = set()
+
+    class Collect(cp_model.CpSolverSolutionCallback):
+        def on_solution_callback(self):
+            found.add(tuple(self.Value(v) for v in games.values()))
+
+    cp_model.CpSolver().SearchForAllSolutions(model, Collect())
+    assert list(games) == directed_pairs(4)
+    assert found == set(iter_schedules(4))
+
+
+def test_normalized_gives_one_schedule_per_factorization():
+    # 6 teams have 6 1-factorizations, each in 5! week orders
+    assert len(list(iter_schedules(6, normalized=True))) == 720 // 120
+
+
+def test_odd_teams_are_refused():
+    with pytest.raises(ValueError):
+        next(iter_schedules(5))
@@ -0,0 +1,30 @@
+import numpy as np
+
+from round_robin import iter_schedules
+from schedule_check import check_schedules
+from schedule_codec import encode, to_opponents
+
+
+def round_robins(n_t):
+    codes = encode(np.array(list(iter_schedules(n_t))), n_t)
+    return to_opponents(codes, n_t).astype(np.int64)
+
+
+def test_round_robins_pass():
+    result = check_schedules(round_robins(6), meetings=(1, 1))
+    assert set(result) == {'once_per_week', 'pair_counts'}
+    assert not result['once_per_week'].any()
+    assert not result['pair_counts'].any()
+
+
+def test_corrupted_schedules_fail():
+    opps = round_robins(6)[:3].copy()
+    # team 0 meets its week 0 opponent again in week 1, but nobody else's
+    # week 1 changes, so the pairing is one-sided
+    opps[1, 1, 0] = opps[1, 0, 0]
+    # week 0 is played twice: a valid pairing every week, but some pairs
+    # meet twice and others never
+    opps[2, 1] = opps[2, 0]
+    result = check_schedules(opps, meetings=(1, 1))
+    assert result['once_per_week'].tolist() == [False, True, False]
+    assert result['pair_counts'].tolist() == [False, True, True]
@@ -0,0 +1,50 @@
+import numpy as np
+
+from round_robin import directed_pairs, iter_schedules
+from schedule_codec import decode, encode, to_opponents, unordered_pairs
+from schedule_sinks import CompactSink
+
+
+def test_encode_decode_round_trip():
+    wks = np.array(list(iter_schedules(6)))
+    codes = encode(wks, 6)
+    assert codes.dtype == np.uint8 and codes.shape == (720, 15)
+    assert np.array_equal(decode(codes, 6), wks)
+    assert len({c.tobytes() for c in codes}) == 720
+
+
+def test_codes_are_the_weeks_of_the_unordered_pairs():
+    wks = next(iter_schedules(4))
+    week = dict(zip(directed_pairs(4), wks))
+    assert encode(wks, 4).tolist() == [week[p] for p in unordered_pairs(4)]
+
+
+def test_opponents_are_a_matching_every_week():
+    codes = encode(np.array(list(iter_schedules(6))), 6)
+    opps = to_opponents(codes, 6)
+    assert opps.shape == (720, 5, 6)
+    teams = np.arange(6)
+    # the opponent's opponent is the team itself, and never the team
+    assert (np.take_along_axis(opps, opps.astype(np.int64), 2) == teams).all()
+    assert (opps != teams).all()
+    # and every team meets everyone else once
+    others = [[u for u in range(6) if u != t] for t in range(6)]
+    assert (np.sort(opps, axis=1).transpose(0, 2, 1) == others).all()
+
+
+def test_opponents_repeat_the_round_robin():
+    codes = encode(next(iter_schedules(4)), 4)
+    opps = to_opponents(codes, 4, n_weeks=7)
+    assert np.array_equal(opps[:, 3:6], opps[:, :3])
+    assert np.array_equal(opps[:, 6], opps[:, 0])
+
+
+def test_compact_sink_round_trip(tmp_path):
+    wks = np.array(list(iter_schedules(6)))
+    path = str(tmp_path / 'out.npy')
+    sink = CompactSink(path, directed_pairs(6), 6, batch_size=100)
+    sink.write_batch(1, wks[:250])
+    for (i, row) in enumerate(wks[250:], 251):
+        sink.write(i, row)
+    sink.close()
+    assert np.array_equal(decode(np.load(path), 6), wks)
@@ -0,0 +1,28 @@
+import pytest
+from ortools.sat.python import cp_model
+
+import te_cli
+from factorizations import build_catalogue, catalogue_path, save_catalogue
+from schedule_count import count_schedules_dp, count_te_schedules
+
+# single round robins, i.e. ordered 1-factorizations of K_n
+KNOWN_COUNTS = {2: 1, 4: 6, 6: 720, 8: 31449600}
+
+
+@pytest.mark.parametrize('n_t', sorted(KNOWN_COUNTS))
+def test_single_round_robins(n_t):
+    assert count_schedules_dp(n_t, n_t - 1) == KNOWN_COUNTS[n_t]
+
+
+@pytest.mark.parametrize('n_t, n_w', [(4, 2), (4, 4), (4, 5), (5, 5), (6, 5)])
+def test_dp_matches_cp_sat_enumeration(n_t, n_w):
+    (model, _) = te_cli.model_games(n_t=n_t, n_w=n_w)
+    counter = te_cli.SolutionCounter()
+    cp_model.CpSolver().SearchForAllSolutions(model, counter)
+    assert count_schedules_dp(n_t, n_w) == counter.n_sol()
+
+
+def test_cached_catalogue_gives_the_same_count(tmp_path):
+    assert count_te_schedules(6, 5, str(tmp_path)) == (720, 'dp')
+    save_catalogue(build_catalogue(6), catalogue_path(6, str(tmp_path)))
+    assert count_te_schedules(6, 5, str(tmp_path)) == (720, 'catalogue')
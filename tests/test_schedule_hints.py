@@ -0,0 +1,47 @@
+import numpy as np
+
+from schedule_hints import fit_hint, load_hint, nearest_hint, save_hint
+
+CONFIG = {
+    'num_teams': 4,
+    'num_matchdays': 3,
+    'num_matches_per_day': 2,
+    'num_pools': 1,
+    'max_home_stand': 2
+}
+
+
+def fixtures(rng, n_d=3, n_t=4):
+    return rng.integers(0, 2, size=(n_d, n_t, n_t))
+
+
+def test_hints_round_trip_and_keep_the_best(tmp_path):
+    rng = np.random.default_rng(0)
+    hints_dir = str(tmp_path)
+    best = fixtures(rng)
+    assert save_hint(hints_dir, CONFIG, best, 4)
+    assert not save_hint(hints_dir, CONFIG, fixtures(rng), 5)
+    (config, objective, values) = nearest_hint(hints_dir, CONFIG)
+    assert config == CONFIG and objective == 4
+    assert np.array_equal(values, best)
+    assert [p.suffix for p in tmp_path.iterdir()] == ['.npz']
+
+
+def test_nearest_hint_needs_the_same_teams(tmp_path):
+    rng = np.random.default_rng(1)
+    save_hint(str(tmp_path), dict(CONFIG, num_matchdays=6), fixtures(rng, 6), 2)
+    assert nearest_hint(str(tmp_path), dict(CONFIG, num_teams=6)) is None
+    (config, _, values) = nearest_hint(str(tmp_path), CONFIG)
+    assert config['num_matchdays'] == 6
+    assert np.array_equal(fit_hint(values, 3), values[:3])
+    assert np.array_equal(fit_hint(values[:2], 3)[2], values[0])
+
+
+def test_load_hint_reads_what_save_hint_wrote(tmp_path):
+    rng = np.random.default_rng(2)
+    values = fixtures(rng)
+    save_hint(str(tmp_path), CONFIG, values, 3)
+    (path, ) = tmp_path.iterdir()
+    (config, objective, loaded) = load_hint(str(path))
+    assert (config, objective) == (CONFIG, 3)
+    assert loaded.dtype == np.uint8 and np.array_equal(loaded, values)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from schedule_check import check_schedules
+from schedule_sampler import sample_schedules
+
+
+@pytest.mark.parametrize('method', ['catalogue', 'construct'])
+def test_samples_are_unique_valid_schedules(tmp_path, method):
+    (opps, stats) = sample_schedules(
+        6, 5, 200, seed=1, method=method, cache_dir=str(tmp_path)
+    )
+    assert opps.shape == (200, 5, 6)
+    assert stats['accepted'] == 200
+    assert len(np.unique(opps.reshape(200, -1), axis=0)) == 200
+    result = check_schedules(opps, meetings=(1, 1))
+    assert not any(failed.any() for failed in result.values())
+
+
+def test_sampling_stops_at_the_schedule_count(tmp_path):
+    # 4 teams have exactly 6 schedules
+    (opps, stats) = sample_schedules(
+        4, 3, 10, seed=2, method='catalogue', cache_dir=str(tmp_path)
+    )
+    assert len(opps) == 6
+    assert stats['accepted'] == 6
+    assert len(np.unique(opps.reshape(6, -1), axis=0)) == 6
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from round_robin import directed_pairs, iter_schedules
+from schedule_codec import encode, to_opponents
+from schedule_sinks import (
+    CsvSink, FirstKSink, NullSink, ParquetSink, ReservoirSink
+)
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+        self.closed = False
+
+    def write(self, idx, values):
+        self.rows.append((idx, np.asarray(values).tolist()))
+
+    def write_batch(self, first_idx, batch):
+        for (i, values) in enumerate(batch, first_idx):
+            self.write(i, values)
+
+    def close(self):
+        self.closed = True
+
+
+def solutions(n, width=3):
+    return np.arange(n * width, dtype=np.uint8).reshape(n, width)
+
+
+def test_reservoir_takes_empty_batches():
+    out = ListSink()
+    sink = ReservoirSink(out, 5, seed=0)
+    sink.write_batch(1, [])
+    sink.write_batch(1, solutions(3))
+    sink.write_batch(4, np.empty((0, 3), dtype=np.uint8))
+    sink.close()
+    assert [idx for (idx, _) in out.rows] == [1, 2, 3]
+    assert out.closed
+
+
+def test_reservoir_keeps_k_distinct_solutions_in_order():
+    batch = solutions(50)
+    out = ListSink()
+    sink = ReservoirSink(out, 7, seed=1)
+    sink.write_batch(1, batch[:20])
+    for (i, values) in enumerate(batch[20:], 21):
+        sink.write(i, values)
+    sink.close()
+    idx = [i for (i, _) in out.rows]
+    assert len(idx) == 7 and idx == sorted(set(idx))
+    for (i, values) in out.rows:
+        assert values == batch[i - 1].tolist()
+
+
+def test_first_k_passes_the_first_solutions_only():
+    out = ListSink()
+    sink = FirstKSink(out, 4)
+    sink.write_batch(1, solutions(3))
+    sink.write_batch(4, solutions(3)[::-1])
+    sink.close()
+    assert [idx for (idx, _) in out.rows] == [1, 2, 3, 4]
+    assert out.rows[3][1] == solutions(3)[2].tolist()
+
+
+def test_null_sink_counts():
+    sink = NullSink()
+    sink.write_batch(1, solutions(4))
+    sink.write(5, [0, 1, 2])
+    sink.close()
+    assert sink.stats()['solutions'] == 5
+
+
+def six_team_schedules():
+    return np.array(list(iter_schedules(6)))
+
+
+def test_csv_sink_round_trip_and_resume(tmp_path):
+    wks = six_team_schedules()
+    pairs = directed_pairs(6)
+    path = str(tmp_path / 'out.csv')
+    sink = CsvSink(path, pairs)
+    sink.write_batch(1, wks[:100])
+    offset = sink.offset()
+    # written after the offset, so lost when resuming from it
+    sink.write_batch(101, wks[100:150])
+    sink.close()
+    sink = CsvSink(path, pairs, offset=offset)
+    for (i, row) in enumerate(wks[100:], 101):
+        sink.write(i, row)
+    sink.close()
+    rows = pd.read_csv(path)
+    assert rows['idx'].tolist() == np.repeat(np.arange(1, 721), 30).tolist()
+    assert list(zip(rows['tm1'][:30], rows['tm2'][:30])) == pairs
+    assert np.array_equal(rows['wk'].to_numpy().reshape(720, 30), wks)
+
+
+def test_parquet_sink_round_trip(tmp_path):
+    wks = six_team_schedules()[:25]
+    path = str(tmp_path / 'out.parquet')
+    sink = ParquetSink(path, directed_pairs(6), 6, 5, n_weeks=7, batch_size=8)
+    sink.write_batch(1, wks[:20])
+    for (i, row) in enumerate(wks[20:], 21):
+        sink.write(i, row)
+    sink.close()
+    rows = pd.read_parquet(path)
+    assert len(rows) == 25 * 7 * 6
+    opps = rows['opponent_id'].to_numpy().reshape(25, 7, 6) - 1
+    expected = to_opponents(encode(wks, 6), 6, n_weeks=7)
+    assert np.array_equal(opps, expected)
+    assert rows['idx_sim'].unique().tolist() == list(range(1, 26))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from round_robin import directed_pairs, iter_schedules
+from schedule_codec import encode, to_opponents
+from schedule_sinks import StoreSink
+from schedule_store import (
+    BYE, ScheduleStore, StoreWriter, fixtures_row, fixtures_rows
+)
+
+
+def six_team_codes():
+    return encode(np.array(list(iter_schedules(6))), 6)
+
+
+def test_write_read_round_trip(tmp_path):
+    codes = six_team_codes()
+    path = str(tmp_path / 'out.sched')
+    writer = StoreWriter(path, 6, 5, batch_size=64)
+    writer.write_batch(codes[:300])
+    for row in codes[300:]:
+        writer.write(row)
+    assert writer.count() == 720
+    writer.close()
+    store = ScheduleStore(path)
+    assert len(store) == 720
+    assert np.array_equal(store[:], codes)
+    assert np.array_equal(
+        store.opponents([3, 700]), to_opponents(codes[[3, 700]], 6)
+    )
+    (idx, rows) = store.sample(10, seed=0)
+    assert np.array_equal(rows, codes[idx])
+
+
+def test_resume_truncates_at_the_offset(tmp_path):
+    codes = six_team_codes()
+    path = str(tmp_path / 'out.sched')
+    writer = StoreWriter(path, 6, 5)
+    writer.write_batch(codes[:100])
+    offset = writer.offset()
+    # rows after the offset are lost with the crash
+    writer.write_batch(codes[100:150])
+    writer.close()
+    writer = StoreWriter(path, 6, 5, offset=offset)
+    writer.write_batch(codes[100:])
+    writer.close()
+    assert np.array_equal(ScheduleStore(path)[:], codes)
+
+
+def test_resume_refuses_another_league(tmp_path):
+    path = str(tmp_path / 'out.sched')
+    writer = StoreWriter(path, 6, 5)
+    offset = writer.offset()
+    writer.close()
+    with pytest.raises(ValueError):
+        StoreWriter(path, 4, 3, offset=offset)
+
+
+def test_store_sink_writes_te_cli_week_vectors(tmp_path):
+    wks = np.array(list(iter_schedules(4)))
+    path = str(tmp_path / 'out.sched')
+    sink = StoreSink(path, directed_pairs(4), 4, 3)
+    sink.write_batch(1, wks[:4])
+    sink.write(5, wks[4])
+    sink.write(6, wks[5])
+    sink.close()
+    assert np.array_equal(ScheduleStore(path)[:], encode(wks, 4))
+
+
+def test_fixtures_rows_round_trip(tmp_path):
+    # 4 teams, 2 days: 1 hosts 2 and 3 hosts 4, then 4 hosts 1, 3 has a bye
+    values = np.zeros((2, 4, 4), dtype=np.uint8)
+    values[0, 0, 1] = values[0, 2, 3] = values[1, 3, 0] = 1
+    path = str(tmp_path / 'fixtures.sched')
+    writer = StoreWriter(path, 4, 2, layout='fixtures')
+    writer.write(fixtures_row(values, 4))
+    writer.write_batch(fixtures_rows(values[None], 4))
+    writer.close()
+    store = ScheduleStore(path)
+    assert len(store) == 2
+    opps = store.opponents(0)[0]
+    assert opps[0].tolist() == [1, 0, 3, 2]
+    assert opps[1].tolist() == [3, BYE, BYE, 0]
+    assert store.at_home(1)[0].tolist() == [
+        [True, False, True, False], [False, False, False, True]
+    ]
@@ -0,0 +1,55 @@
+import pandas as pd
+
+import sharded_search
+import te_cli
+from checkpoint import checkpoint_path, load_checkpoint
+from schedule_count import count_schedules_dp
+
+search_shard = te_cli.search_shard
+
+
+def cut_short_shard(task):
+    '''Odd shards stop after 5 solutions, like shards out of time.'''
+    if task[0] % 2 == 1:
+        task = task[:5] + (5, ) + task[6:]
+    return search_shard(task)
+
+
+def schedules(path):
+    rows = pd.read_csv(path)
+    return rows.groupby('idx')['wk'].apply(tuple)
+
+
+def test_resume_finishes_cut_short_shards(tmp_path, monkeypatch):
+    name = str(tmp_path / 'out')
+    options = dict(
+        n_t=6, n_w=5, n_show=0, limit=10**6, name=name, n_workers=1
+    )
+    monkeypatch.setattr(te_cli, 'search_shard', cut_short_shard)
+    first = te_cli.solution_search_sharded(**options)
+    state = load_checkpoint(checkpoint_path(name))
+    # none of the cut short shards is checkpointed, or written
+    assert all(shard % 2 == 0 for shard in state['completed'])
+    assert first == state['n_sol'] < count_schedules_dp(6, 5)
+
+    monkeypatch.setattr(te_cli, 'search_shard', search_shard)
+    n_sol = te_cli.solution_search_sharded(resume=True, **options)
+    assert n_sol == count_schedules_dp(6, 5) == 720
+    found = schedules(name + '.csv')
+    assert len(found) == n_sol
+    assert found.nunique() == n_sol
+
+
+def test_shards_cover_every_schedule(tmp_path):
+    n_sol = te_cli.solution_search_sharded(
+        n_t=4, n_w=3, n_show=0, limit=10**6, name=str(tmp_path / 'out'),
+        n_workers=1
+    )
+    assert n_sol == count_schedules_dp(4, 3) == 6
+
+
+def test_shards_after_the_deadline_do_not_search(tmp_path):
+    path = str(tmp_path / 'part.u8')
+    task = (0, path, 6, 5, (1, 2), None, sharded_search.shard_deadline(0))
+    assert te_cli.search_shard(task) == (0, 'UNKNOWN', 0.0)
+    assert len(sharded_search.read_part(path, 30)) == 0
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from ortools.sat.python import cp_model
+
+import te_cli
+from solution_batches import BatchCollector
+
+
+def enumerate_weeks(n_t, collector):
+    solver = cp_model.CpSolver()
+    (model, games) = te_cli.model_games(n_t=n_t, n_w=n_t - 1)
+    return (solver.SearchForAllSolutions(model, collector(games)), games)
+
+
+def test_batches_hold_every_solution_once():
+    batches = []
+
+    def on_batch(first_idx, batch):
+        batches.append((first_idx, batch.copy()))
+
+    (status, _) = enumerate_weeks(
+        6, lambda games: BatchCollector(games.values(), on_batch, batch_size=64)
+    )
+    assert status == cp_model.OPTIMAL
+    # the last, partial batch only comes out on flush
+    firsts = [first for (first, _) in batches]
+    assert firsts == list(range(1, 1 + 64 * len(batches), 64))
+
+
+def test_flush_hands_over_the_tail_and_counts():
+    rows = []
+    collectors = []
+
+    def collect(games):
+        collectors.append(
+            BatchCollector(
+                games.values(), lambda i, b: rows.extend(b.tolist()),
+                batch_size=100
+            )
+        )
+        return collectors[0]
+
+    enumerate_weeks(6, collect)
+    collectors[0].flush()
+    assert collectors[0].n_sol() == len(rows) == 720
+    assert len({tuple(r) for r in rows}) == 720
+    # every pair meets in one of the five weeks
+    assert np.isin(np.array(rows), np.arange(1, 6)).all()
+
+
+class Index:
+    def __init__(self, i):
+        self._i = i
+
+    def Index(self):
+        return self._i
+
+
+class FixedResponse(BatchCollector):
+    '''A collector fed one made-up solver response.'''
+    def Response(self):
+        return type('Response', (), {'solution': [0, 1, 0, 1]})
+
+
+def test_indices_outside_the_response_raise():
+    collector = FixedResponse([Index(1), Index(3)], lambda i, b: None)
+    collector.on_solution_callback()
+    assert collector.n_sol() == 1
+    collector = FixedResponse([Index(1), Index(7)], lambda i, b: None)
+    with pytest.raises(IndexError):
+        collector.on_solution_callback()
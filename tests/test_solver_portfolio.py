@@ -0,0 +1,49 @@
+from ortools.sat.python import cp_model
+
+from solver_portfolio import add_objective_cut, portfolio_runs, run_portfolio
+
+
+def covering_model():
+    '''Pick the fewest of 6 items so that every pair of neighbours has
+    one; the optimum is 3.'''
+    model = cp_model.CpModel()
+    x = [model.NewBoolVar('x%i' % i) for i in range(6)]
+    for i in range(6):
+        model.AddBoolOr([x[i], x[(i + 1) % 6]])
+    model.Minimize(sum(x))
+    return (model, x)
+
+
+def solve(model):
+    solver = cp_model.CpSolver()
+    return (solver, solver.Solve(model))
+
+
+def test_objective_cut_excludes_the_optimum_and_above():
+    (model, _) = covering_model()
+    add_objective_cut(model, 4)
+    (solver, status) = solve(model)
+    assert status == cp_model.OPTIMAL and solver.ObjectiveValue() == 3
+    add_objective_cut(model, 3)
+    assert solve(model)[1] == cp_model.INFEASIBLE
+
+
+def test_objective_cut_handles_negated_references():
+    (model, x) = covering_model()
+    # the most items left out, the same problem as a maximization
+    model.Maximize(sum(v.Not() for v in x))
+    add_objective_cut(model, 2)
+    (solver, status) = solve(model)
+    assert status == cp_model.OPTIMAL and solver.ObjectiveValue() == 3
+    add_objective_cut(model, 3)
+    assert solve(model)[1] == cp_model.INFEASIBLE
+
+
+def test_portfolio_proves_the_optimum():
+    (model, x) = covering_model()
+    runs = portfolio_runs(2, seed=0, num_cpus=2)
+    (status, objective, values, stats) = run_portfolio(
+        model, [v.Index() for v in x], runs, time_limit=10
+    )
+    assert (status, objective) == ('OPTIMAL', 3)
+    assert values.sum() == 3 and len(stats) == 2
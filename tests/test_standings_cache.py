@@ -0,0 +1,43 @@
+import numpy as np
+
+from standings_cache import (
+    cached_standings, load_standings_cache, save_standings_cache,
+    update_standings
+)
+
+# a single round robin for 4 teams: opponent of each team, every week
+ROUND_ROBIN = np.array([[1, 0, 3, 2], [2, 3, 0, 1], [3, 2, 1, 0]])
+
+
+def schedules(n_sims, rng):
+    '''`n_sims x weeks x teams` opponents, the round robin relabelled.'''
+    opps = []
+    for _ in range(n_sims):
+        perm = rng.permutation(4)
+        inv = np.argsort(perm)
+        opps.append(perm[ROUND_ROBIN[:, inv]])
+    return np.array(opps, dtype=np.int16)
+
+
+def test_incremental_update_matches_a_fresh_one(tmp_path):
+    rng = np.random.default_rng(0)
+    opps = schedules(20, rng)
+    points = rng.normal(100, 20, size=(3, 4)).astype(np.float32)
+    team_ids = np.arange(1, 5)
+    path = str(tmp_path / 'standings.npz')
+
+    (cache, weeks) = update_standings(None, team_ids, points[:2], opps)
+    assert weeks.tolist() == [0, 1]
+    save_standings_cache(path, cache)
+    # week 3 lands and week 1 is corrected
+    points[0, 0] += 50
+    (cache, weeks) = update_standings(
+        load_standings_cache(path), team_ids, points, opps
+    )
+    assert weeks.tolist() == [0, 2]
+
+    (fresh, _) = update_standings(None, team_ids, points, opps)
+    for (a, b) in zip(cached_standings(cache, points),
+                      cached_standings(fresh, points)):
+        assert np.array_equal(a, b)
+    assert [p.name for p in tmp_path.iterdir()] == ['standings.npz']
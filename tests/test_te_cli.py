@@ -0,0 +1,31 @@
+import pandas as pd
+
+import te_cli
+
+
+def schedules(path):
+    rows = pd.read_csv(path)
+    return set(rows.groupby('idx')['wk'].apply(tuple))
+
+
+def test_direct_and_catalogue_engines_agree(tmp_path):
+    found = {}
+    for engine in ['direct', 'catalogue']:
+        name = str(tmp_path / engine)
+        n_sol = te_cli.solution_search_direct(
+            n_t=6, n_w=5, n_show=0, limit=10**6, name=name, engine=engine,
+            cache_dir=str(tmp_path)
+        )
+        assert n_sol == 720
+        found[engine] = schedules(name + '.csv')
+    assert len(found['direct']) == 720
+    assert found['direct'] == found['catalogue']
+
+
+def test_catalogue_engine_falls_back_to_direct(tmp_path, capsys):
+    n_sol = te_cli.solution_search_direct(
+        n_t=10, n_w=9, n_show=0, limit=3, name=str(tmp_path / 'out'),
+        engine='catalogue', cache_dir=str(tmp_path)
+    )
+    assert n_sol == 3
+    assert 'using --engine direct' in capsys.readouterr().out